@@ -3,6 +3,7 @@ import os
 from runemerchant.settings import BASE_DIR
 
 ICONS_DIR = os.path.join(BASE_DIR, 'merchapi/static/icons')
+SPRITES_DIR = os.path.join(BASE_DIR, 'merchapi/static/sprites')
 
 if not os.path.exists(ICONS_DIR):
     os.makedirs(ICONS_DIR)
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class MerchApiConfig(AppConfig):
     name = 'merchapi'
+
+    def ready(self):
+        # the caches' receivers bump their versions when items and tags change,
+        # so they are connected in every process rather than only the ones that use the caches
+        from util.merch import catalog, tags  # noqa: F401
@@ -0,0 +1,17 @@
+from django.core.management import BaseCommand, CommandError
+
+from util.merch.columnar import get_price_store, stored_snapshots, STORE_BATCH_SIZE
+from util.merch.scrape import group
+
+
+class Command(BaseCommand):
+    help = 'Copies the price history that is missing from the columnar price store into it.'
+
+    def handle(self, *args, **options):
+        store = get_price_store()
+        if store is None:
+            raise CommandError("The price store is disabled, set PRICE_STORE_DIR to enable it.")
+
+        appended = sum(store.extend(snapshots)
+                       for snapshots in group(stored_snapshots(store.last_snapshot()), STORE_BATCH_SIZE))
+        self.stdout.write(f"Appended {appended} snapshots to the price store.")
@@ -0,0 +1,12 @@
+from django.core.management import BaseCommand
+
+from merchapi import ICONS_DIR, SPRITES_DIR
+from util.merch.sprites import build_sprites
+
+
+class Command(BaseCommand):
+    help = 'Packs the downloaded icons into sprite sheets.'
+
+    def handle(self, *args, **options):
+        written = build_sprites(ICONS_DIR, SPRITES_DIR)
+        self.stdout.write(f"Wrote {len(written)} sprite sheets.")
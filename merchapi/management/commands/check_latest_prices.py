@@ -0,0 +1,19 @@
+from django.core.management import BaseCommand
+
+from merchapi.models import LatestPrice
+
+
+class Command(BaseCommand):
+    help = 'Checks the latest prices against the price history, optionally rebuilding them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Rebuild the latest prices from the price history if they are inconsistent.')
+
+    def handle(self, *args, **options):
+        inconsistent = LatestPrice.objects.inconsistent_items()
+        self.stdout.write(f"{len(inconsistent)} items have an inconsistent latest price.")
+
+        if inconsistent and options['rebuild']:
+            LatestPrice.objects.rebuild()
+            self.stdout.write("Rebuilt the latest prices.")
@@ -0,0 +1,11 @@
+from django.core.management import BaseCommand
+
+from merchapi.models import TagCount
+
+
+class Command(BaseCommand):
+    help = 'Recounts the items with each tag, such as after loading tagged items from a fixture.'
+
+    def handle(self, *args, **options):
+        TagCount.objects.refresh()
+        self.stdout.write(f"Counted {TagCount.objects.count()} tags.")
@@ -1,19 +1,18 @@
-import os
 from django.core.management import BaseCommand
 
 from merchapi import ICONS_DIR
 from merchapi.models import Item
-from util.merch.scrape import download_icons
+from util.merch.scrape import download_icons, ICON_CONCURRENCY
 
 
 class Command(BaseCommand):
     help = 'Downloads all missing icons.'
 
-    def handle(self, *args, **options):
-        if not os.path.exists(ICONS_DIR):
-            os.makedirs(ICONS_DIR)
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=ICON_CONCURRENCY,
+                            help='The maximum number of downloads in flight at once.')
 
-        files = os.listdir(ICONS_DIR)
+    def handle(self, *args, **options):
         item_ids = Item.objects.all().values_list('item_id', flat=True)
-
-        download_icons((x for x in item_ids if f"{x}.gif" not in files), ICONS_DIR)
+        downloaded = download_icons(item_ids, ICONS_DIR, concurrency=options['concurrency'])
+        self.stdout.write(f"Downloaded {len(downloaded)} icons.")
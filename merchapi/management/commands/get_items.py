@@ -1,6 +1,7 @@
 from django.core.management import BaseCommand
 
-from merchapi.models import Item
+from merchapi.models import Item, MissingItem
+from util.merch.catalog import bump_catalog_version
 from util.merch.scrape import get_new_items
 
 
@@ -11,4 +12,7 @@ class Command(BaseCommand):
 
         new_items, missing_items = get_new_items(1000)
         Item.objects.bulk_create(new_items)
+        MissingItem.objects.bulk_create(missing_items)
+        if new_items:
+            bump_catalog_version()
 
@@ -1,12 +1,18 @@
 from django.core.management import BaseCommand
 
-from merchapi.models import Item, Price
-from util.merch.scrape import get_prices_for_items
+from merchapi.models import Item
+from util.merch.analytics import warm_analytics
+from util.merch.ingest import ingest_prices
+from util.merch.scrape import PRICE_CONCURRENCY
 
 
 class Command(BaseCommand):
     help = 'Polls the api for the latest prices for each item in the DB.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=PRICE_CONCURRENCY,
+                            help='The maximum number of api requests in flight at once.')
+
     def handle(self, *args, **options):
-        prices = get_prices_for_items(Item.objects.all().values_list('item_id', flat=True))
-        Price.objects.bulk_create(prices)
+        ingest_prices(Item.objects.all().values_list('item_id', flat=True), concurrency=options['concurrency'])
+        warm_analytics()
@@ -0,0 +1,18 @@
+from django.core.management import BaseCommand
+from django.db import connection
+
+from merchapi.models import SQLITE_SEARCH_TABLES
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the item name search index from the items, such as after its triggers were dropped.'
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            self.stdout.write("Only the sqlite search index has to be rebuilt.")
+            return
+
+        with connection.cursor() as cursor:
+            for table in SQLITE_SEARCH_TABLES:
+                cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+        self.stdout.write(f"Rebuilt {len(SQLITE_SEARCH_TABLES)} search tables.")
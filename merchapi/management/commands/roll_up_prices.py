@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management import BaseCommand
+
+from util.merch.rollup import roll_up_all, prune_prices
+
+
+class Command(BaseCommand):
+    help = 'Aggregates the price history into the hourly, daily and weekly rollups, optionally pruning it.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true',
+                            help='Delete the price history that is past its retention once it is rolled up.')
+
+    def handle(self, *args, **options):
+        for name, written in roll_up_all().items():
+            self.stdout.write(f"Wrote {written} {name} rows.")
+
+        if options['prune']:
+            for name, deleted in prune_prices(settings.PRICE_RETENTION).items():
+                self.stdout.write(f"Deleted {deleted} {name} rows.")
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.18 on 2026-10-18 13:04
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models.functions import TruncHour
+import django.db.models.deletion
+
+
+def create_snapshots(apps, schema_editor):
+    """
+    Groups the existing ingested prices into one snapshot per hour.
+    """
+    Price = apps.get_model('merchapi', 'Price')
+    PriceSnapshot = apps.get_model('merchapi', 'PriceSnapshot')
+
+    hours = Price.objects.filter(user=None).annotate(hour=TruncHour('date')) \
+        .values_list('hour', flat=True).distinct().order_by('hour')
+
+    for hour in list(hours):
+        snapshot = PriceSnapshot.objects.create(date=hour)
+        Price.objects.filter(user=None, date__gte=hour, date__lt=hour + timedelta(hours=1)).update(snapshot=snapshot)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchapi', '0010_auto_20180408_1011'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField()),
+            ],
+            options={
+                'verbose_name_plural': 'Price Snapshots',
+            },
+        ),
+        migrations.AddField(
+            model_name='price',
+            name='snapshot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='merchapi.pricesnapshot'),
+        ),
+        migrations.RunPython(create_snapshots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.18 on 2026-10-18 13:07
+
+from django.db import migrations, models
+from django.db.models import Subquery, OuterRef, Max
+import django.db.models.deletion
+
+
+def fill_latest_prices(apps, schema_editor):
+    """
+    Copies the most recent price of each item into the latest prices,
+    ignoring the prices users entered themselves.
+    """
+    Price = apps.get_model('merchapi', 'Price')
+    LatestPrice = apps.get_model('merchapi', 'LatestPrice')
+
+    last_date = Price.objects.filter(user=None, item=OuterRef('item')) \
+        .values('item').annotate(last=Max('date')).values('last')[:1]
+    prices = Price.objects.filter(user=None, date=Subquery(last_date)).order_by('id')
+
+    latest = {price.item_id: LatestPrice(
+        item_id=price.item_id,
+        snapshot_id=price.snapshot_id,
+        date=price.date,
+        buy_price=price.buy_price,
+        sell_price=price.sell_price,
+        average_price=price.average_price,
+        buy_volume=price.buy_volume,
+        sell_volume=price.sell_volume,
+    ) for price in prices}
+
+    LatestPrice.objects.bulk_create(latest.values())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchapi', '0011_pricesnapshot_price_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestPrice',
+            fields=[
+                ('date', models.DateTimeField()),
+                ('buy_price', models.IntegerField(blank=True, null=True)),
+                ('sell_price', models.IntegerField(blank=True, null=True)),
+                ('average_price', models.IntegerField(blank=True, null=True)),
+                ('buy_volume', models.IntegerField(blank=True, null=True)),
+                ('sell_volume', models.IntegerField(blank=True, null=True)),
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='latest_price', serialize=False, to='merchapi.item')),
+                ('snapshot', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='merchapi.pricesnapshot')),
+            ],
+            options={
+                'verbose_name_plural': 'Latest Prices',
+            },
+        ),
+        migrations.RunPython(fill_latest_prices, migrations.RunPython.noop),
+    ]
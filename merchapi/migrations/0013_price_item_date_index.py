@@ -0,0 +1,23 @@
+# Generated by Django 4.2.18 on 2026-10-18 13:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchapi', '0012_latestprice'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='price',
+            index=models.Index(fields=['item', 'date'], name='price_item_date_idx'),
+        ),
+        migrations.AlterField(
+            model_name='price',
+            name='item',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='merchapi.item'),
+        ),
+    ]
@@ -0,0 +1,116 @@
+# Generated by Django 4.2.18 on 2026-10-18 13:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchapi', '0013_price_item_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeeklyPrice',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField()),
+                ('samples', models.IntegerField()),
+                ('buy_price_open', models.IntegerField(blank=True, null=True)),
+                ('buy_price_close', models.IntegerField(blank=True, null=True)),
+                ('buy_price_low', models.IntegerField(blank=True, null=True)),
+                ('buy_price_high', models.IntegerField(blank=True, null=True)),
+                ('buy_price_mean', models.FloatField(blank=True, null=True)),
+                ('sell_price_open', models.IntegerField(blank=True, null=True)),
+                ('sell_price_close', models.IntegerField(blank=True, null=True)),
+                ('sell_price_low', models.IntegerField(blank=True, null=True)),
+                ('sell_price_high', models.IntegerField(blank=True, null=True)),
+                ('sell_price_mean', models.FloatField(blank=True, null=True)),
+                ('average_price_open', models.IntegerField(blank=True, null=True)),
+                ('average_price_close', models.IntegerField(blank=True, null=True)),
+                ('average_price_low', models.IntegerField(blank=True, null=True)),
+                ('average_price_high', models.IntegerField(blank=True, null=True)),
+                ('average_price_mean', models.FloatField(blank=True, null=True)),
+                ('buy_volume', models.IntegerField(blank=True, null=True)),
+                ('sell_volume', models.IntegerField(blank=True, null=True)),
+                ('item', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='merchapi.item')),
+            ],
+            options={
+                'verbose_name_plural': 'Weekly Prices',
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='HourlyPrice',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField()),
+                ('samples', models.IntegerField()),
+                ('buy_price_open', models.IntegerField(blank=True, null=True)),
+                ('buy_price_close', models.IntegerField(blank=True, null=True)),
+                ('buy_price_low', models.IntegerField(blank=True, null=True)),
+                ('buy_price_high', models.IntegerField(blank=True, null=True)),
+                ('buy_price_mean', models.FloatField(blank=True, null=True)),
+                ('sell_price_open', models.IntegerField(blank=True, null=True)),
+                ('sell_price_close', models.IntegerField(blank=True, null=True)),
+                ('sell_price_low', models.IntegerField(blank=True, null=True)),
+                ('sell_price_high', models.IntegerField(blank=True, null=True)),
+                ('sell_price_mean', models.FloatField(blank=True, null=True)),
+                ('average_price_open', models.IntegerField(blank=True, null=True)),
+                ('average_price_close', models.IntegerField(blank=True, null=True)),
+                ('average_price_low', models.IntegerField(blank=True, null=True)),
+                ('average_price_high', models.IntegerField(blank=True, null=True)),
+                ('average_price_mean', models.FloatField(blank=True, null=True)),
+                ('buy_volume', models.IntegerField(blank=True, null=True)),
+                ('sell_volume', models.IntegerField(blank=True, null=True)),
+                ('item', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='merchapi.item')),
+            ],
+            options={
+                'verbose_name_plural': 'Hourly Prices',
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyPrice',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateTimeField()),
+                ('samples', models.IntegerField()),
+                ('buy_price_open', models.IntegerField(blank=True, null=True)),
+                ('buy_price_close', models.IntegerField(blank=True, null=True)),
+                ('buy_price_low', models.IntegerField(blank=True, null=True)),
+                ('buy_price_high', models.IntegerField(blank=True, null=True)),
+                ('buy_price_mean', models.FloatField(blank=True, null=True)),
+                ('sell_price_open', models.IntegerField(blank=True, null=True)),
+                ('sell_price_close', models.IntegerField(blank=True, null=True)),
+                ('sell_price_low', models.IntegerField(blank=True, null=True)),
+                ('sell_price_high', models.IntegerField(blank=True, null=True)),
+                ('sell_price_mean', models.FloatField(blank=True, null=True)),
+                ('average_price_open', models.IntegerField(blank=True, null=True)),
+                ('average_price_close', models.IntegerField(blank=True, null=True)),
+                ('average_price_low', models.IntegerField(blank=True, null=True)),
+                ('average_price_high', models.IntegerField(blank=True, null=True)),
+                ('average_price_mean', models.FloatField(blank=True, null=True)),
+                ('buy_volume', models.IntegerField(blank=True, null=True)),
+                ('sell_volume', models.IntegerField(blank=True, null=True)),
+                ('item', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='merchapi.item')),
+            ],
+            options={
+                'verbose_name_plural': 'Daily Prices',
+                'abstract': False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='weeklyprice',
+            constraint=models.UniqueConstraint(fields=('item', 'date'), name='weeklyprice_item_date'),
+        ),
+        migrations.AddConstraint(
+            model_name='hourlyprice',
+            constraint=models.UniqueConstraint(fields=('item', 'date'), name='hourlyprice_item_date'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailyprice',
+            constraint=models.UniqueConstraint(fields=('item', 'date'), name='dailyprice_item_date'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.18 on 2026-10-18 13:33
+
+from django.db import migrations, models
+from django.db.models import F, Case, When, FloatField
+from django.db.models.functions import Cast
+
+
+def fill_metrics(apps, schema_editor):
+    """
+    Works out the margin, roi, demand and volume of the existing latest prices.
+    """
+    LatestPrice = apps.get_model('merchapi', 'LatestPrice')
+    LatestPrice.objects.update(
+        margin=F('sell_price') - F('buy_price'),
+        roi=Case(When(buy_price__gt=0, then=Cast('sell_price', FloatField()) / F('buy_price'))),
+        demand=Case(When(sell_volume__gt=0, then=Cast('buy_volume', FloatField()) / F('sell_volume'))),
+        volume=F('buy_volume') + F('sell_volume'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchapi', '0014_price_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='latestprice',
+            name='demand',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='latestprice',
+            name='margin',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='latestprice',
+            name='roi',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='latestprice',
+            name='volume',
+            field=models.IntegerField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(fill_metrics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.18 on 2026-10-18 13:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchapi', '0015_latestprice_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScreenerEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('formula', models.CharField(max_length=32)),
+                ('preset', models.CharField(max_length=32)),
+                ('rank', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='merchapi.item')),
+                ('snapshot', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='merchapi.pricesnapshot')),
+            ],
+            options={
+                'verbose_name_plural': 'Screener Entries',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='screenerentry',
+            constraint=models.UniqueConstraint(fields=('formula', 'preset', 'rank'), name='screener_entry_rank'),
+        ),
+    ]
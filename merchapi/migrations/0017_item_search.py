@@ -0,0 +1,69 @@
+from django.db import migrations
+
+# sqlite rebuilds a table to alter it, which drops its triggers, so any
+# migration that alters merchapi_item has to run create_search_index again
+SQLITE_SEARCH_TABLES = {
+    # matches the start of each word, ignoring case and diacritics
+    'merchapi_item_search': "tokenize='unicode61 remove_diacritics 2', prefix='2 3'",
+    # matches any three letters in a row, for typos
+    'merchapi_item_trigram': "tokenize='trigram'",
+}
+
+
+def create_search_index(apps, schema_editor):
+    """
+    Builds the item name search index, and keeps it in sync with the items table.
+    """
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'sqlite':
+        insert, delete = [], []
+        for table, options in SQLITE_SEARCH_TABLES.items():
+            schema_editor.execute(f"CREATE VIRTUAL TABLE {table} USING fts5("
+                                  f"name, content='merchapi_item', content_rowid='item_id', {options})")
+            schema_editor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+            insert.append(f"INSERT INTO {table}(rowid, name) VALUES (new.item_id, new.name);")
+            delete.append(f"INSERT INTO {table}({table}, rowid, name) VALUES ('delete', old.item_id, old.name);")
+
+        insert, delete = ' '.join(insert), ' '.join(delete)
+        schema_editor.execute(f"CREATE TRIGGER merchapi_item_search_insert AFTER INSERT ON merchapi_item "
+                              f"BEGIN {insert} END")
+        schema_editor.execute(f"CREATE TRIGGER merchapi_item_search_delete AFTER DELETE ON merchapi_item "
+                              f"BEGIN {delete} END")
+        schema_editor.execute(f"CREATE TRIGGER merchapi_item_search_update AFTER UPDATE OF item_id, name "
+                              f"ON merchapi_item BEGIN {delete} {insert} END")
+
+    elif vendor == 'postgresql':
+        # unaccent is only stable, so it is wrapped to be allowed in an index
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS unaccent")
+        schema_editor.execute("CREATE FUNCTION merchapi_fold(text) RETURNS text AS "
+                              "$$ SELECT lower(public.unaccent('public.unaccent', $1)) $$ "
+                              "LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT")
+        schema_editor.execute("CREATE INDEX merchapi_item_name_trgm ON merchapi_item "
+                              "USING gin (merchapi_fold(name) gin_trgm_ops)")
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+
+    if vendor == 'sqlite':
+        for action in ('insert', 'delete', 'update'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS merchapi_item_search_{action}")
+        for table in SQLITE_SEARCH_TABLES:
+            schema_editor.execute(f"DROP TABLE IF EXISTS {table}")
+
+    elif vendor == 'postgresql':
+        schema_editor.execute("DROP INDEX IF EXISTS merchapi_item_name_trgm")
+        schema_editor.execute("DROP FUNCTION IF EXISTS merchapi_fold(text)")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchapi', '0016_screenerentry'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.18 on 2026-10-18 14:01
+
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef
+import django.db.models.deletion
+
+
+def count_tags(apps, schema_editor):
+    """
+    Counts the items with each existing tag.
+    """
+    TaggedItem = apps.get_model('merchapi', 'TaggedItem')
+    TagCount = apps.get_model('merchapi', 'TagCount')
+
+    global_tagged = TaggedItem.objects.filter(user=None, tag=OuterRef('tag'), item=OuterRef('item'))
+    TagCount.objects.bulk_create(
+        [TagCount(tag_id=row['tag'], items=row['items'])
+         for row in TaggedItem.objects.filter(user=None).values('tag').annotate(items=Count('item'))] +
+        [TagCount(tag_id=row['tag'], merchant_id=row['user'], items=row['items'])
+         for row in TaggedItem.objects.exclude(user=None).filter(~Exists(global_tagged))
+         .values('tag', 'user').annotate(items=Count('item'))]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchapi', '0017_item_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('items', models.PositiveIntegerField()),
+                ('merchant', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='merchapi.merchant')),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='merchapi.tag')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='tagcount',
+            constraint=models.UniqueConstraint(fields=('merchant', 'tag'), name='tagcount_merchant_tag'),
+        ),
+        migrations.AddConstraint(
+            model_name='tagcount',
+            constraint=models.UniqueConstraint(condition=models.Q(('merchant', None)), fields=('tag',), name='tagcount_global_tag'),
+        ),
+        migrations.RunPython(count_tags, migrations.RunPython.noop),
+    ]
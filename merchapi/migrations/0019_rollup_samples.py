@@ -0,0 +1,95 @@
+# Generated by Django 4.2.18 on 2026-10-18 15:17
+
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def fill_rollups(apps, schema_editor):
+    """
+    Counts the known values of each price as every price in the rollups that
+    have a mean, and marks the prices before the latest hourly rollup as rolled
+    up, so only the windows from there on are recomputed.
+    """
+    Price = apps.get_model('merchapi', 'Price')
+    HourlyPrice = apps.get_model('merchapi', 'HourlyPrice')
+
+    latest = HourlyPrice.objects.aggregate(latest=Max('date'))['latest']
+    rolled_up = Price.objects.filter(user=None, date__lt=latest).aggregate(last=Max('id'))['last'] \
+        if latest is not None else None
+
+    for name in ('HourlyPrice', 'DailyPrice', 'WeeklyPrice'):
+        model = apps.get_model('merchapi', name)
+        for field in ('buy_price', 'sell_price', 'average_price'):
+            model.objects.filter(**{f'{field}_mean__isnull': False}).update(**{f'{field}_samples': F('samples')})
+        model.objects.update(max_price_id=rolled_up or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('merchapi', '0018_tagcount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyprice',
+            name='average_price_samples',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dailyprice',
+            name='buy_price_samples',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dailyprice',
+            name='max_price_id',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dailyprice',
+            name='sell_price_samples',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='hourlyprice',
+            name='average_price_samples',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='hourlyprice',
+            name='buy_price_samples',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='hourlyprice',
+            name='max_price_id',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='hourlyprice',
+            name='sell_price_samples',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='weeklyprice',
+            name='average_price_samples',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='weeklyprice',
+            name='buy_price_samples',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='weeklyprice',
+            name='max_price_id',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='weeklyprice',
+            name='sell_price_samples',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_rollups, migrations.RunPython.noop),
+    ]
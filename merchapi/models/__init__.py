@@ -1,4 +1,7 @@
+from merchapi.models.price import *
+from merchapi.models.rollup import *
 from merchapi.models.item import *
 from merchapi.models.flip import *
 from merchapi.models.user import *
 from merchapi.models.skill import *
+from merchapi.models.screener import *
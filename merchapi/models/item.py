@@ -1,12 +1,50 @@
-from typing import Iterable, Dict
-
-from django.db import models
-from django.db.models import Count, Q, F, Sum, QuerySet, Subquery, OuterRef, Max
-from django.db.models.functions import Cast
+import re
+import unicodedata
+from contextlib import contextmanager
+from threading import local
+from typing import Iterable, List, Tuple
+
+from django.db import models, connections, transaction
+from django.db.models import Count, Q, F, Sum, QuerySet, Func, Value, FloatField, BooleanField, Exists, OuterRef, \
+    Window
+from django.db.models.functions import RowNumber
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.db.models.expressions import RawSQL
 
 from merchapi.models.flip import Flip
 from merchapi.models.price import Price
-from merchapi.models.user import Merchant
+from merchapi.models.user import Merchant, Favorite
+
+
+# how many items a search returns when it has to fall back to matching on trigrams
+SEARCH_FUZZY_LIMIT = 20
+
+# the full text indexes of the item names on sqlite, kept in sync with the items by triggers
+SQLITE_SEARCH_TABLES = ('merchapi_item_search', 'merchapi_item_trigram')
+
+# the most items that can be tagged or untagged in one request
+BULK_TAG_LIMIT = 1000
+
+# set while tagged items change in bulk, which recount the tags themselves
+_bulk_tagging = local()
+
+
+def fold_name(name: str) -> str:
+    """
+    Folds a name for searching, removing case and diacritics.
+    :param name: The name to fold.
+    :return: The folded name, so "Crème" becomes "creme".
+    """
+    decomposed = unicodedata.normalize('NFKD', name)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def get_search_terms(query: str) -> List[str]:
+    """
+    Splits a search query into the same words the sqlite search index splits names into.
+    """
+    return re.findall(r'[^\W_]+', fold_name(query))
 
 
 class MissingItem(models.Model):
@@ -25,34 +63,97 @@ class ItemManager(models.QuerySet):
         :param merchant: The merchant to get the favorites for.
         :return: A queryset with favorites annotated.
         """
-        return self.annotate(
-            favorited=Cast(Count('favorite', filter=Q(favorite__merchant=merchant)), models.BooleanField()))
+        # an exists looks up each item in the favorites' unique index, where counting
+        # them joined and grouped the whole item table
+        return self.annotate(favorited=Exists(Favorite.objects.filter(item=OuterRef('pk'), merchant=merchant)))
 
-    def with_prices(self) -> Iterable['Item']:
+    def search(self, query: str) -> QuerySet:
         """
-        Takes a queryset of Items and merges in price data.
-        :return: An iterable.
+        Searches the items by name, ignoring case and diacritics.
+
+        On sqlite, names are matched word by word against the start of each word in
+        the item_search full text index, so "rune plate" finds "Rune platebody", or
+        contain the query's words anywhere in the item_trigram index, so "body" still
+        finds it. Only if no item matches either way, it falls back to the names that
+        share the most trigrams with the query, so small typos still find the item.
+        The closest of those are picked after any filters added to the queryset.
+        On postgres, the names are matched by trigram word similarity instead.
+
+        :param query: The name to search for.
+        :return: The matching items, ordered by relevance.
         """
-
-        def item_generator(items: Iterable[Item], price_logs: Dict[int, Price]):
-            for item in items:
-                item.price = price_logs[item.item_id] if item.item_id in price_logs else None
-                yield item
-
-        latest_prices = Price.objects.filter(
-            date=Subquery(
-                Price.objects
-                    .filter(item=OuterRef('item'))
-                    .values('item')
-                    .annotate(last_price=Max('date'))
-                    .values('last_price')[:1]
-            )
-        )
-
-        return item_generator(
-            self.order_by('item_id'),
-            {price_log.item_id: price_log for price_log in latest_prices}
-        )
+        terms = get_search_terms(query)
+        if not terms:
+            return self.none()
+
+        vendor = connections[self.db].vendor
+        if vendor == 'sqlite':
+            return self._search_sqlite(terms)
+        elif vendor == 'postgresql':
+            return self._search_postgres(terms)
+
+        queryset = self
+        for term in terms:
+            queryset = queryset.filter(name__icontains=term)
+        return queryset.order_by('name')
+
+    def _search_sqlite(self, terms: List[str]) -> QuerySet:
+        item_id = f'{self.model._meta.db_table}.item_id'
+        words = ' '.join(f'"{term}"*' for term in terms)
+        trigrams = ' OR '.join(f'"{term[i:i + 3]}"' for term in terms for i in range(len(term) - 2))
+
+        def rank(table: str, query: str) -> RawSQL:
+            # the matches are ranked once and looked up for each item, where
+            # matching on the item's rowid would run the whole search per item
+            return RawSQL(f'WITH ranks AS MATERIALIZED (SELECT rowid, rank FROM {table} WHERE {table} MATCH %s) '
+                          f'SELECT rank FROM ranks WHERE ranks.rowid = {item_id}', (query,),
+                          output_field=FloatField())
+
+        # the trigram index matches any part of a name as long as each word is at least three letters
+        if all(len(term) >= 3 for term in terms):
+            substrings = ' AND '.join(f'"{term}"' for term in terms)
+            found = RawSQL('SELECT rowid FROM merchapi_item_search WHERE merchapi_item_search MATCH %s UNION '
+                           'SELECT rowid FROM merchapi_item_trigram WHERE merchapi_item_trigram MATCH %s',
+                           (words, substrings))
+        else:
+            found = RawSQL('SELECT rowid FROM merchapi_item_search WHERE merchapi_item_search MATCH %s', (words,))
+
+        queryset = self.filter(item_id__in=found)
+        if queryset.exists() or not trigrams:
+            return queryset.alias(search_rank=rank('merchapi_item_search', words)) \
+                .order_by(F('search_rank').asc(nulls_last=True), 'item_id')
+
+        # the window picks the closest matches out of whatever rows are left after every other filter
+        closest = Window(RowNumber(), order_by=[F('search_rank').asc(), F('item_id').asc()])
+        return self.filter(item_id__in=RawSQL('SELECT rowid FROM merchapi_item_trigram '
+                                              'WHERE merchapi_item_trigram MATCH %s', (trigrams,))) \
+            .alias(search_rank=rank('merchapi_item_trigram', trigrams), search_closest=closest) \
+            .filter(search_closest__lte=SEARCH_FUZZY_LIMIT) \
+            .order_by('search_closest')
+
+    def _search_postgres(self, terms: List[str]) -> QuerySet:
+        # merchapi_fold is lower(unaccent(name)), and is what the trigram index is built on,
+        # so both the similarity and the substring matches are served by it
+        table = self.model._meta.db_table
+        query = ' '.join(terms)
+        name = Func(F('name'), function='merchapi_fold')
+        matches = RawSQL(f'merchapi_fold(%s) <%% merchapi_fold({table}.name)', (query,), output_field=BooleanField())
+        contains = RawSQL(' AND '.join(f'merchapi_fold({table}.name) LIKE %s' for _ in terms),
+                          [f'%{term}%' for term in terms], output_field=BooleanField())
+        return self.filter(Q(matches) | Q(contains)) \
+            .alias(search_rank=Func(Func(Value(query), function='merchapi_fold'), name,
+                                    function='word_similarity', output_field=FloatField())) \
+            .order_by('-search_rank', 'item_id')
+
+    def with_prices(self) -> QuerySet:
+        """
+        Joins in the latest price of each item, so only the prices of the items that
+        are actually fetched are loaded, and the queryset can still be sliced or paginated.
+        Items are ordered by id unless the queryset is already ordered.
+        :return: A queryset with the latest prices selected.
+        """
+        queryset = self.select_related('latest_price')
+        return queryset if queryset.ordered else queryset.order_by('item_id')
 
 
 class Item(models.Model):
@@ -101,7 +202,7 @@ class Item(models.Model):
 class UniqueNullForeignKey(models.ForeignKey):
     description = "Foreign Field that stores None as -1 to enforce the unique constraint."
 
-    def from_db_value(self, value, expression, connection, context):
+    def from_db_value(self, value, expression, connection):
         """
         Intercepts the data being loaded and replaces -1 with None
         for proper use in the application.
@@ -130,6 +231,91 @@ class UniqueNullForeignKey(models.ForeignKey):
         return -1 if value is None else value
 
 
+def is_bulk_tagging() -> bool:
+    """
+    :return: Whether tagged items are being changed in bulk on this thread, so their
+             signals should leave recounting the tags to whatever is changing them.
+    """
+    return getattr(_bulk_tagging, 'active', False)
+
+
+@contextmanager
+def bulk_tagging():
+    """
+    Marks the tagged items changed inside it as being changed in bulk.
+    """
+    _bulk_tagging.active = True
+    try:
+        yield
+    finally:
+        _bulk_tagging.active = False
+
+
+class TaggedItemManager(models.QuerySet):
+
+    def tag_items(self, pairs: List[Tuple[int, str]], merchant: Merchant) -> List[str]:
+        """
+        Tags many items for a merchant at once, creating any new tags.
+        Bulk inserts send no signals, so the tags are recounted here and
+        the caller bumps the tag version.
+        :param pairs: The item id and tag name of each tag to add.
+        :param merchant: The merchant adding the tags.
+        :return: For each pair, whether it was created, already exists or the item is missing.
+                 A pair given more than once is only created the first time.
+        """
+        item_ids = set(Item.objects.filter(item_id__in={item_id for item_id, _ in pairs})
+                       .values_list('item_id', flat=True))
+        pairs_found = {(item_id, name) for item_id, name in pairs if item_id in item_ids}
+        names = {name for _, name in pairs_found}
+
+        with transaction.atomic():
+            Tag.objects.bulk_create([Tag(name=name) for name in names], ignore_conflicts=True)
+            tag_ids = dict(Tag.objects.filter(name__in=names).values_list('name', 'id'))
+
+            existing = set(self.filter(user=merchant, tag_id__in=tag_ids.values(), item_id__in=item_ids)
+                           .values_list('item_id', 'tag__name'))
+            self.bulk_create([TaggedItem(tag_id=tag_ids[name], item_id=item_id, user=merchant)
+                              for item_id, name in pairs_found - existing], ignore_conflicts=True)
+
+            TagCount.objects.refresh(tag_ids.values())
+
+        results = []
+        for item_id, name in pairs:
+            if item_id not in item_ids:
+                results.append('missing')
+            elif (item_id, name) in existing:
+                results.append('exists')
+            else:
+                results.append('created')
+                existing.add((item_id, name))
+        return results
+
+    def untag_items(self, pairs: List[Tuple[int, str]], merchant: Merchant) -> List[str]:
+        """
+        Removes many of a merchant's own tags at once, leaving global tags alone.
+        :param pairs: The item id and tag name of each tag to remove.
+        :param merchant: The merchant removing the tags.
+        :return: For each pair, whether it was deleted or the merchant had no such tag.
+                 A pair given more than once is only deleted the first time.
+        """
+        tagged = {(item_id, name): (pk, tag_id) for pk, item_id, name, tag_id in self.filter(
+            user=merchant,
+            item_id__in={item_id for item_id, _ in pairs},
+            tag__name__in={name for _, name in pairs},
+        ).values_list('id', 'item_id', 'tag__name', 'tag_id')}
+        found = [tagged[pair] for pair in set(pairs) if pair in tagged]
+
+        with transaction.atomic(), bulk_tagging():
+            self.filter(id__in=[pk for pk, _ in found]).delete()
+            TagCount.objects.refresh({tag_id for _, tag_id in found})
+
+        results = []
+        for pair in pairs:
+            results.append('deleted' if pair in tagged else 'missing')
+            tagged.pop(pair, None)
+        return results
+
+
 class TaggedItem(models.Model):
     """
     The many to many relationship between tags and items, with an optional user.
@@ -138,6 +324,8 @@ class TaggedItem(models.Model):
     item = models.ForeignKey(Item, on_delete=models.CASCADE)
     user = UniqueNullForeignKey(Merchant, on_delete=models.CASCADE, default=None, blank=True, null=True)
 
+    objects = TaggedItemManager.as_manager()
+
     class Meta:
         verbose_name_plural = "Tagged Items"
         unique_together = (('tag', 'item', 'user'),)
@@ -161,6 +349,71 @@ class Tag(models.Model):
         verbose_name_plural = "Tags"
 
 
+class TagCountManager(models.QuerySet):
+
+    def visible_to(self, merchant: Merchant = None) -> QuerySet:
+        """
+        Gets the counts of the tags a merchant can see.
+        :param merchant: The merchant whose own tags are included as well as the global ones.
+        :return: The global counts, and the counts of the merchant's own tags.
+        """
+        return self.filter(Q(merchant=None) | Q(merchant=merchant)) if merchant else self.filter(merchant=None)
+
+    def refresh(self, tag_ids: Iterable[int] = None) -> None:
+        """
+        Recounts the items with some tags from the tagged items.
+        The tags are locked while they are counted, so concurrent recounts of the
+        same tag wait for each other rather than inserting the same counts twice.
+        :param tag_ids: The tags to recount, or None to recount every tag.
+        """
+        tag_ids = None if tag_ids is None else list(tag_ids)
+
+        with transaction.atomic():
+            tags = Tag.objects.select_for_update().order_by('id')
+            list((tags if tag_ids is None else tags.filter(id__in=tag_ids)).values_list('id', flat=True))
+
+            tagged = TaggedItem.objects.all() if tag_ids is None else TaggedItem.objects.filter(tag_id__in=tag_ids)
+            global_tagged = TaggedItem.objects.filter(user=None, tag=OuterRef('tag'), item=OuterRef('item'))
+
+            counts = [TagCount(tag_id=row['tag'], items=row['items'])
+                      for row in tagged.filter(user=None).values('tag').annotate(items=Count('item'))]
+            counts += [TagCount(tag_id=row['tag'], merchant_id=row['user'], items=row['items'])
+                       for row in tagged.exclude(user=None).filter(~Exists(global_tagged))
+                       .values('tag', 'user').annotate(items=Count('item'))]
+
+            (self.all() if tag_ids is None else self.filter(tag_id__in=tag_ids)).delete()
+            self.bulk_create(counts)
+
+
+class TagCount(models.Model):
+    """
+    The number of items with a tag that everyone can see, or the number
+    more that only one merchant can see because they tagged them themselves.
+    A merchant sees the sum of the two.
+    """
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE)
+    merchant = models.ForeignKey(Merchant, blank=True, null=True, on_delete=models.CASCADE)
+    items = models.PositiveIntegerField()
+
+    objects = TagCountManager.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['merchant', 'tag'], name='tagcount_merchant_tag'),
+            models.UniqueConstraint(fields=['tag'], condition=Q(merchant=None), name='tagcount_global_tag'),
+        ]
+
+
+@receiver([post_save, post_delete], sender=TaggedItem)
+def recount_tag(sender, instance: TaggedItem, raw=False, **kwargs):
+    """
+    Recounts a tag when an item is tagged or untagged.
+    Fixtures are left alone, and bulk changes recount the tags themselves.
+    """
+    if not raw and not is_bulk_tagging():
+        TagCount.objects.refresh([instance.tag_id])
+
+
 class Rune(Item):
     """
     A rune in Runescape.
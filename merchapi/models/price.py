@@ -1,8 +1,136 @@
-from typing import Iterable
+from datetime import datetime, timezone
+from typing import Iterable, Set, Dict
 
 from django.contrib.auth.models import User
-from django.db import models
-from django.db.models import Subquery, OuterRef, Max
+from django.db import models, transaction
+from django.db.models import Subquery, OuterRef, Func, F, Window, Min, Max, Avg, Sum, Count, RowRange
+from django.db.models.functions import Floor, ExtractYear, ExtractMonth, RowNumber, LastValue
+
+
+INTERVAL_SECONDS = {
+    'h': 60 * 60,
+    'd': 24 * 60 * 60,
+    'w': 7 * 24 * 60 * 60,
+}
+
+# the unix epoch is a thursday, so weeks are shifted to start on a monday
+WEEK_OFFSET = 4 * 24 * 60 * 60
+
+INTERVAL_FIELDS = ('buy_price', 'sell_price', 'average_price')
+
+
+class Epoch(Func):
+    """
+    The number of seconds between the unix epoch and a datetime.
+    """
+    output_field = models.IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template=(
+            "CAST(ROUND((julianday(%(expressions)s) - 2440587.5) * 86400) AS INTEGER)"
+        ), **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="EXTRACT(EPOCH FROM %(expressions)s)", **extra_context)
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(compiler, connection, template="UNIX_TIMESTAMP(%(expressions)s)", **extra_context)
+
+
+def get_window(count: int, unit: str) -> Func:
+    """
+    Builds an expression that numbers the window each row's date falls in.
+    :param count: The number of units in each window.
+    :param unit: The unit of the window, one of h, d, w, m or y.
+    :return: The window expression.
+    """
+    if unit in INTERVAL_SECONDS:
+        offset = WEEK_OFFSET if unit == 'w' else 0
+        return Floor((Epoch('date') - offset) / (count * INTERVAL_SECONDS[unit]))
+    elif unit == 'm':
+        return Floor((ExtractYear('date') * 12 + ExtractMonth('date') - 1) / count)
+    elif unit == 'y':
+        return Floor(ExtractYear('date') / count)
+    else:
+        raise ValueError(f"Unknown interval unit {unit}")
+
+
+def get_window_start(window: int, count: int, unit: str) -> datetime:
+    """
+    Works out when a window numbered by get_window starts.
+    :param window: The window number.
+    :param count: The number of units in each window.
+    :param unit: The unit of the window, one of h, d, w, m or y.
+    :return: The start of the window.
+    """
+    if unit in INTERVAL_SECONDS:
+        offset = WEEK_OFFSET if unit == 'w' else 0
+        return datetime.fromtimestamp(window * count * INTERVAL_SECONDS[unit] + offset, timezone.utc)
+    elif unit == 'm':
+        year, month = divmod(window * count, 12)
+        return datetime(year, month + 1, 1, tzinfo=timezone.utc)
+    elif unit == 'y':
+        return datetime(window * count, 1, 1, tzinfo=timezone.utc)
+    else:
+        raise ValueError(f"Unknown interval unit {unit}")
+
+
+def over_window(expression) -> Window:
+    """
+    Evaluates an aggregate over every row in the same item and window.
+    """
+    return Window(expression, partition_by=[F('item'), F('window')], order_by=F('date').asc(),
+                  frame=RowRange(start=None, end=None))
+
+
+def aggregate_windows(queryset: models.QuerySet, count: int, unit: str, columns: Dict[str, Func]):
+    """
+    Reduces a queryset to the first row of each item and window, annotated with
+    aggregates over the whole window. The aggregation is done with window
+    functions, so only one row per window leaves the database.
+    :param queryset: The rows to aggregate, which must have an item and a date.
+    :param count: The number of units in each window.
+    :param unit: The unit of the window, one of h, d, w, m or y.
+    :param columns: The columns to return, usually built with over_window.
+    :return: A queryset of dictionaries with the window, date, item and columns.
+    """
+    position = Window(RowNumber(), partition_by=[F('item'), F('window')], order_by=F('date').asc())
+    return queryset.annotate(window=get_window(count, unit)).annotate(position=position, **columns) \
+        .filter(position=1) \
+        .order_by('item', 'date') \
+        .values('window', 'date', 'item', *columns)
+
+
+def merge_windows(earlier: Dict, later: Dict) -> Dict:
+    """
+    Combines two parts of the same window, as returned by in_intervals,
+    into the window they would make up together.
+    :param earlier: The part of the window with the earlier rows.
+    :param later: The part of the window with the later rows.
+    :return: The whole window.
+    """
+    def combine(function, column):
+        values = [part[column] for part in (earlier, later) if part[column] is not None]
+        return function(values) if values else None
+
+    merged = dict(earlier)
+    for field in INTERVAL_FIELDS:
+        merged[f'{field}_last'] = combine(lambda values: values[-1], f'{field}_last')
+        merged[f'{field}_min'] = combine(min, f'{field}_min')
+        merged[f'{field}_max'] = combine(max, f'{field}_max')
+
+        # the averages are weighted by the number of known prices in each part
+        parts = [(part[f'{field}_count'], part[f'{field}_avg']) for part in (earlier, later)
+                 if part[f'{field}_avg'] is not None and part[f'{field}_count']]
+        samples = sum(count for count, _ in parts)
+        merged[f'{field}_avg'] = sum(count * average for count, average in parts) / samples if samples else None
+        merged[f'{field}_count'] = combine(sum, f'{field}_count')
+
+    for column in ('total_buy_volume', 'total_sell_volume', 'count'):
+        merged[column] = combine(sum, column)
+    merged['newest_price_id'] = combine(max, 'newest_price_id')
+
+    return merged
 
 
 class PriceManager(models.QuerySet):
@@ -10,29 +138,89 @@ class PriceManager(models.QuerySet):
     A price manager.
     """
 
+    def in_snapshot(self, snapshot: 'PriceSnapshot' or int):
+        """
+        Gets the prices recorded by a single ingest run.
+        :param snapshot: The snapshot or its id.
+        :return: A queryset of prices, one for each item in the snapshot.
+        """
+        return self.filter(snapshot=snapshot)
+
+    def latest_snapshot(self):
+        """
+        Gets the prices recorded by the most recent ingest run.
+        :return: A queryset of prices, one for each item in the snapshot.
+        """
+        return self.filter(snapshot=Subquery(PriceSnapshot.objects.order_by('-id').values('id')[:1]))
+
+    def in_intervals(self, count: int, unit: str):
+        """
+        Aggregates the prices into windows of a given length, entirely in the database.
+        Each window is represented by its first price, along with the first, last,
+        min, max, average and number of known values of each price field, the total
+        volumes, the number of prices and the id of the newest price.
+        :param count: The number of units in each window.
+        :param unit: The unit of the window, one of h, d, w, m or y.
+        :return: A queryset of dictionaries, one for each item and window.
+        """
+        columns = {}
+        for field in INTERVAL_FIELDS:
+            columns.update({
+                f'{field}_first': F(field),
+                f'{field}_last': over_window(LastValue(field)),
+                f'{field}_min': over_window(Min(field)),
+                f'{field}_max': over_window(Max(field)),
+                f'{field}_avg': over_window(Avg(field)),
+                f'{field}_count': over_window(Count(field)),
+            })
+        columns.update({
+            'total_buy_volume': over_window(Sum('buy_volume')),
+            'total_sell_volume': over_window(Sum('sell_volume')),
+            'count': over_window(Count('id')),
+            'newest_price_id': over_window(Max('id')),
+        })
+
+        return aggregate_windows(self, count, unit, columns)
+
     def most_recent_for_each_item(self, items: Iterable = None):
         """
         Gets the most recent price for a list of items (or all of them)
+        out of the prices in this queryset, so filtering first picks the most
+        recent of the filtered prices rather than dropping items whose most
+        recent price does not match.
         :param items: A list of items to get the price of. None for all.
         :return: A queryset of prices, one for each item.
+
+        .. note::
+            The latest price of each item is found through the (item, date)
+            index starting from the items, so the price table is never scanned.
         """
-        sub_query = Price.objects.filter(item=OuterRef('item')) \
-                        .values('item') \
-                        .annotate(last_price=Max('date')) \
-                        .values('last_price')[:1]
+        item_model = Price.item.field.related_model
+        items = item_model.objects.all() if items is None else \
+            item_model.objects.filter(pk__in=[getattr(item, 'pk', item) for item in items])
 
-        return self.filter(date=Subquery(sub_query)) \
-            if items is None else \
-            self.filter(item__in=items).filter(date=Subquery(sub_query))
+        last_price = self.filter(item=OuterRef('pk')).order_by('-date', '-id').values('id')[:1]
+        return self.filter(id__in=items.annotate(last_price=Subquery(last_price)).values('last_price'))
 
 
-class Price(models.Model):
+class PriceSnapshot(models.Model):
     """
-    A single piece of price data for an item.
+    A single run of the price ingest, shared by every price it fetched.
+    """
+    date = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.id} - {self.date}"
+
+    class Meta:
+        verbose_name_plural = "Price Snapshots"
+
+
+class BasePrice(models.Model):
+    """
+    The price data shared by price logs and latest prices.
     """
     date = models.DateTimeField()
-    item = models.ForeignKey('Item', on_delete=models.CASCADE)
-    user = models.ForeignKey(User, blank=True, null=True, on_delete=models.CASCADE)
 
     buy_price = models.IntegerField(blank=True, null=True)
     sell_price = models.IntegerField(blank=True, null=True)
@@ -41,7 +229,7 @@ class Price(models.Model):
     buy_volume = models.IntegerField(blank=True, null=True)
     sell_volume = models.IntegerField(blank=True, null=True)
 
-    objects = PriceManager.as_manager()
+    PRICE_FIELDS = ('date', 'buy_price', 'sell_price', 'average_price', 'buy_volume', 'sell_volume')
 
     def get_profit(self) -> int or None:
         """
@@ -86,5 +274,119 @@ class Price(models.Model):
     def __str__(self):
         return self.item.name
 
+    class Meta:
+        abstract = True
+
+
+class Price(BasePrice):
+    """
+    A single piece of price data for an item.
+    """
+    item = models.ForeignKey('Item', on_delete=models.CASCADE, db_index=False)
+    user = models.ForeignKey(User, blank=True, null=True, on_delete=models.CASCADE)
+    snapshot = models.ForeignKey(PriceSnapshot, blank=True, null=True, on_delete=models.CASCADE)
+
+    objects = PriceManager.as_manager()
+
     class Meta:
         verbose_name_plural = "Prices"
+        indexes = [
+            models.Index(fields=['item', 'date'], name='price_item_date_idx'),
+        ]
+
+
+class LatestPriceManager(models.QuerySet):
+    """
+    A latest price manager.
+    """
+
+    def update_from(self, prices: Iterable[Price]) -> None:
+        """
+        Replaces the latest prices of the given items with newer prices.
+        :param prices: The new prices, at most one for each item.
+        """
+        LatestPrice.objects.bulk_create(
+            (LatestPrice.from_price(price) for price in prices),
+            update_conflicts=True,
+            unique_fields=('item',),
+            update_fields=BasePrice.PRICE_FIELDS + LatestPrice.METRIC_FIELDS + ('snapshot',),
+        )
+
+    @staticmethod
+    def from_history() -> Dict[int, 'LatestPrice']:
+        """
+        Works out the latest prices from the full price history.
+        :return: An unsaved latest price for each item, keyed by item id.
+        """
+        prices = Price.objects.filter(user=None).most_recent_for_each_item().order_by('id')
+        return {price.item_id: LatestPrice.from_price(price) for price in prices}
+
+    def rebuild(self) -> None:
+        """
+        Rebuilds the latest prices from the full price history.
+        """
+        with transaction.atomic():
+            LatestPrice.objects.all().delete()
+            LatestPrice.objects.bulk_create(self.from_history().values())
+
+    def inconsistent_items(self) -> Set[int]:
+        """
+        Compares the latest prices against the full price history.
+        :return: The ids of the items whose latest price is missing or out of date.
+        """
+        expected = self.from_history()
+        actual = {latest.item_id: latest for latest in LatestPrice.objects.all()}
+
+        return {item_id for item_id in expected.keys() | actual.keys()
+                if item_id not in expected or item_id not in actual or
+                any(getattr(expected[item_id], field) != getattr(actual[item_id], field)
+                    for field in BasePrice.PRICE_FIELDS + LatestPrice.METRIC_FIELDS + ('snapshot_id',))}
+
+
+class LatestPrice(BasePrice):
+    """
+    The most recent price data for an item, kept up to date by the ingest.
+    The margin, roi, demand and volume are stored alongside the prices so
+    that items can be sorted and filtered by them in the database.
+    """
+    item = models.OneToOneField('Item', primary_key=True, on_delete=models.CASCADE, related_name='latest_price')
+    snapshot = models.ForeignKey(PriceSnapshot, blank=True, null=True, on_delete=models.SET_NULL)
+
+    margin = models.IntegerField(blank=True, null=True, db_index=True)
+    roi = models.FloatField(blank=True, null=True, db_index=True)
+    demand = models.FloatField(blank=True, null=True, db_index=True)
+    volume = models.IntegerField(blank=True, null=True, db_index=True)
+
+    METRIC_FIELDS = ('margin', 'roi', 'demand', 'volume')
+
+    objects = LatestPriceManager.as_manager()
+
+    @staticmethod
+    def from_price(price: Price) -> 'LatestPrice':
+        """
+        Copies a price log into a latest price.
+        :param price: The price to copy.
+        :return: An unsaved latest price.
+        """
+        latest = LatestPrice(item_id=price.item_id, snapshot_id=price.snapshot_id,
+                             **{field: getattr(price, field) for field in BasePrice.PRICE_FIELDS})
+        latest.update_metrics()
+        return latest
+
+    def update_metrics(self) -> None:
+        """
+        Works out the stored metrics from the prices, leaving
+        them empty where a price is missing or zero.
+        """
+        self.margin = self.get_profit()
+        self.roi = self.get_roi() if self.buy_price else None
+        self.demand = self.get_demand() if self.sell_volume else None
+        self.volume = self.buy_volume + self.sell_volume \
+            if self.buy_volume is not None and self.sell_volume is not None else None
+
+    def save(self, *args, **kwargs):
+        self.update_metrics()
+        super().save(*args, **kwargs)
+
+    class Meta:
+        verbose_name_plural = "Latest Prices"
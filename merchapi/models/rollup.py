@@ -0,0 +1,196 @@
+from itertools import chain
+from typing import Dict, List, Type
+
+from django.db import models
+from django.db.models import F, Q, Min, Max, Sum, FloatField
+from django.db.models.functions import LastValue, NullIf
+
+from merchapi.models.price import Price, INTERVAL_FIELDS, over_window, aggregate_windows, merge_windows
+
+
+class PriceRollupManager(models.QuerySet):
+    """
+    A price rollup manager.
+    """
+
+    def in_intervals(self, count: int, unit: str):
+        """
+        Aggregates the rollups into coarser windows, entirely in the database.
+        Returns the same columns as PriceManager.in_intervals, with averages
+        weighted by the number of known prices in each rollup.
+        :param count: The number of units in each window.
+        :param unit: The unit of the window, one of h, d, w, m or y.
+        :return: A queryset of dictionaries, one for each item and window.
+        """
+        columns = {}
+        for field in INTERVAL_FIELDS:
+            weighted = Sum(F(f'{field}_mean') * F(f'{field}_samples'), output_field=FloatField())
+            columns.update({
+                f'{field}_first': F(f'{field}_open'),
+                f'{field}_last': over_window(LastValue(f'{field}_close')),
+                f'{field}_min': over_window(Min(f'{field}_low')),
+                f'{field}_max': over_window(Max(f'{field}_high')),
+                f'{field}_avg': over_window(weighted) / NullIf(over_window(Sum(f'{field}_samples')), 0),
+                f'{field}_count': over_window(Sum(f'{field}_samples')),
+            })
+        columns.update({
+            'total_buy_volume': over_window(Sum('buy_volume')),
+            'total_sell_volume': over_window(Sum('sell_volume')),
+            'count': over_window(Sum('samples')),
+            'newest_price_id': over_window(Max('max_price_id')),
+        })
+
+        return aggregate_windows(self, count, unit, columns)
+
+
+class PriceRollup(models.Model):
+    """
+    The prices of an item aggregated over a window of time, starting at the date,
+    with the open, close, low, high, mean and number of known values of each price,
+    the total volumes and the number of prices that were aggregated.
+
+    Each rollup defines a get_source class method returning the finer grained
+    rows it is aggregated from, with the id of the newest price in each row as
+    max_price_id, so rows that are newer than the rollup can be found.
+    """
+    item = models.ForeignKey('Item', on_delete=models.CASCADE, db_index=False)
+    date = models.DateTimeField()
+    samples = models.IntegerField()
+
+    buy_price_open = models.IntegerField(blank=True, null=True)
+    buy_price_close = models.IntegerField(blank=True, null=True)
+    buy_price_low = models.IntegerField(blank=True, null=True)
+    buy_price_high = models.IntegerField(blank=True, null=True)
+    buy_price_mean = models.FloatField(blank=True, null=True)
+    buy_price_samples = models.IntegerField(default=0)
+
+    sell_price_open = models.IntegerField(blank=True, null=True)
+    sell_price_close = models.IntegerField(blank=True, null=True)
+    sell_price_low = models.IntegerField(blank=True, null=True)
+    sell_price_high = models.IntegerField(blank=True, null=True)
+    sell_price_mean = models.FloatField(blank=True, null=True)
+    sell_price_samples = models.IntegerField(default=0)
+
+    average_price_open = models.IntegerField(blank=True, null=True)
+    average_price_close = models.IntegerField(blank=True, null=True)
+    average_price_low = models.IntegerField(blank=True, null=True)
+    average_price_high = models.IntegerField(blank=True, null=True)
+    average_price_mean = models.FloatField(blank=True, null=True)
+    average_price_samples = models.IntegerField(default=0)
+
+    buy_volume = models.IntegerField(blank=True, null=True)
+    sell_volume = models.IntegerField(blank=True, null=True)
+
+    # the id of the newest price aggregated into the rollup
+    max_price_id = models.IntegerField(default=0)
+
+    # the rollup field holding each column of PriceManager.in_intervals
+    COLUMNS = dict(
+        [('count', 'samples'), ('total_buy_volume', 'buy_volume'), ('total_sell_volume', 'sell_volume'),
+         ('newest_price_id', 'max_price_id')] +
+        [(f'{field}_{column}', f'{field}_{name}') for field in INTERVAL_FIELDS for column, name in
+         (('first', 'open'), ('last', 'close'), ('min', 'low'), ('max', 'high'), ('avg', 'mean'),
+          ('count', 'samples'))]
+    )
+
+    # the unit of the window, and the interval units that are a whole number of windows
+    UNIT = None
+    COVERS = ''
+
+    objects = PriceRollupManager.as_manager()
+
+    def __str__(self):
+        return f"{self.item_id} - {self.date}"
+
+    class Meta:
+        abstract = True
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'date'], name='%(class)s_item_date'),
+        ]
+
+
+class HourlyPrice(PriceRollup):
+    """
+    The prices of an item aggregated by hour.
+    """
+    UNIT = 'h'
+    COVERS = 'hdwmy'
+
+    @classmethod
+    def get_source(cls):
+        return Price.objects.filter(user=None).alias(max_price_id=F('id'))
+
+    class Meta(PriceRollup.Meta):
+        verbose_name_plural = "Hourly Prices"
+
+
+class DailyPrice(PriceRollup):
+    """
+    The prices of an item aggregated by day.
+    """
+    UNIT = 'd'
+    COVERS = 'dwmy'
+
+    @classmethod
+    def get_source(cls):
+        return HourlyPrice.objects.all()
+
+    class Meta(PriceRollup.Meta):
+        verbose_name_plural = "Daily Prices"
+
+
+class WeeklyPrice(PriceRollup):
+    """
+    The prices of an item aggregated by week, starting on monday.
+    """
+    UNIT = 'w'
+    COVERS = 'w'
+
+    @classmethod
+    def get_source(cls):
+        return DailyPrice.objects.all()
+
+    class Meta(PriceRollup.Meta):
+        verbose_name_plural = "Weekly Prices"
+
+
+# from the finest to the coarsest
+ROLLUP_MODELS = (HourlyPrice, DailyPrice, WeeklyPrice)
+
+
+def get_rollup_model(unit: str):
+    """
+    Picks the coarsest rollup that can answer an interval query without losing detail.
+    :param unit: The unit of the interval, one of h, d, w, m or y.
+    :return: The rollup model, or None if only the raw prices will do.
+    """
+    return next((model for model in reversed(ROLLUP_MODELS) if unit in model.COVERS), None)
+
+
+def get_rolled_up_windows(model: Type[PriceRollup], item, count: int, unit: str, dates: Q = Q()) -> List[Dict]:
+    """
+    Aggregates an item's prices into windows from a rollup. Rollups are filled in
+    the background, so the prices from the start of the item's latest rollup
+    onwards are aggregated from the raw prices instead, and a window that is
+    partly in both is merged.
+    :param model: The rollup model to read.
+    :param item: The item or its id.
+    :param count: The number of units in each window.
+    :param unit: The unit of the window, one of h, d, w, m or y.
+    :param dates: Limits the rollups and prices to a range of dates.
+    :return: The windows, as returned by in_intervals, in order of date.
+    """
+    rollups = model.objects.filter(dates, item=item)
+    prices = Price.objects.filter(dates, item=item, user=None)
+
+    latest = model.objects.filter(item=item).order_by('-date').values_list('date', flat=True).first()
+    if latest is not None:
+        rollups = rollups.filter(date__lt=latest)
+        prices = prices.filter(date__gte=latest)
+
+    windows = {}
+    for window in chain(rollups.in_intervals(count, unit), prices.in_intervals(count, unit)):
+        key = window['window']
+        windows[key] = merge_windows(windows[key], window) if key in windows else window
+
+    return list(windows.values())
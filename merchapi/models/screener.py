@@ -0,0 +1,94 @@
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Coalesce, Least
+
+from merchapi.models.price import PriceSnapshot, LatestPrice
+
+# how many items are kept in each ranking
+SCREENER_SIZE = 250
+
+# the volume an item needs to be in the liquid preset
+SCREENER_LIQUID_VOLUME = 1000
+
+# the score of a latest price under each ranking
+SCREENER_FORMULAS = {
+    # the profit of buying a full buy limit and selling it again
+    'profit': F('margin') * F('item__buy_limit'),
+    # the same, but only as much as is actually being traded, falling back to whichever
+    # of the two is known since Least is NULL on SQLite if either is, unlike on Postgres
+    'traded_profit': F('margin') * Least(Coalesce(F('item__buy_limit'), F('volume')),
+                                         Coalesce(F('volume'), F('item__buy_limit'))),
+    'margin': F('margin'),
+    'roi': F('roi'),
+}
+
+# the latest prices that are ranked under each filter preset
+SCREENER_PRESETS = {
+    'all': Q(),
+    'f2p': Q(item__members=False),
+    'members': Q(item__members=True),
+    'liquid': Q(volume__gte=SCREENER_LIQUID_VOLUME),
+}
+
+
+class ScreenerEntryManager(models.QuerySet):
+    """
+    A screener entry manager.
+    """
+
+    def ranking(self, formula: str, preset: str):
+        """
+        Gets a precomputed ranking.
+        :param formula: The name of the ranking formula.
+        :param preset: The name of the filter preset.
+        :return: A queryset of entries with their items and latest prices, best first.
+        """
+        return self.filter(formula=formula, preset=preset) \
+            .select_related('item', 'item__latest_price') \
+            .order_by('rank')
+
+    def rebuild(self, snapshot: PriceSnapshot = None) -> None:
+        """
+        Ranks the profitable items under every formula and preset, replacing the previous rankings.
+        :param snapshot: The snapshot the latest prices are from.
+        """
+        entries = []
+        for formula, score in SCREENER_FORMULAS.items():
+            for preset, condition in SCREENER_PRESETS.items():
+                ranked = LatestPrice.objects.filter(condition, margin__gt=0) \
+                    .annotate(score=score) \
+                    .filter(score__isnull=False) \
+                    .order_by('-score', 'item_id') \
+                    .values_list('item_id', 'score')[:SCREENER_SIZE]
+
+                entries.extend(ScreenerEntry(formula=formula, preset=preset, rank=rank, item_id=item_id,
+                                             score=score, snapshot=snapshot)
+                               for rank, (item_id, score) in enumerate(ranked, start=1))
+
+        with transaction.atomic():
+            ScreenerEntry.objects.all().delete()
+            ScreenerEntry.objects.bulk_create(entries)
+
+
+class ScreenerEntry(models.Model):
+    """
+    An item's place in one of the precomputed flipping rankings.
+    """
+    formula = models.CharField(max_length=32)
+    preset = models.CharField(max_length=32)
+    rank = models.PositiveIntegerField()
+
+    item = models.ForeignKey('Item', on_delete=models.CASCADE)
+    score = models.FloatField()
+    snapshot = models.ForeignKey(PriceSnapshot, blank=True, null=True, on_delete=models.SET_NULL)
+
+    objects = ScreenerEntryManager.as_manager()
+
+    def __str__(self):
+        return f"{self.formula} / {self.preset} #{self.rank} - {self.item_id}"
+
+    class Meta:
+        verbose_name_plural = "Screener Entries"
+        constraints = [
+            models.UniqueConstraint(fields=['formula', 'preset', 'rank'], name='screener_entry_rank'),
+        ]
@@ -0,0 +1,142 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from typing import List
+
+from dateutil.parser import isoparse
+from django.db.models import Q, QuerySet
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginates a queryset newest first, in (date, pk) order, by filtering on the
+    position of the last row of the previous page rather than counting rows with
+    an offset, so every page is a single index seek no matter how deep it is.
+
+    Cursors are opaque and point at a row rather than a page number, so they
+    stay valid when new rows are added.
+
+    Pagination is opt in, so clients that send neither a cursor nor a page size
+    still get the whole list.
+    """
+
+    page_size = 500
+    max_page_size = 5000
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset: QuerySet, request: Request, view=None) -> List or None:
+        if self.cursor_query_param not in request.query_params and \
+                self.page_size_query_param not in request.query_params:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        rows = list(self.get_page_queryset(queryset, position, reverse)[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = rows
+        return rows
+
+    @staticmethod
+    def get_page_queryset(queryset: QuerySet, position: tuple or None, reverse: bool = False) -> QuerySet:
+        """
+        Orders a queryset newest first and filters it to the rows after (or before) a position.
+        :param queryset: The queryset to paginate.
+        :param position: The date and pk to start from, or None to start at the newest row.
+        :param reverse: Whether to go backwards from the position, towards the newer rows.
+        :return: The ordered queryset.
+        """
+        if position is not None:
+            date, pk = position
+            if reverse:
+                queryset = queryset.filter(Q(date__gte=date) & (Q(date__gt=date) | Q(pk__gt=pk)))
+            else:
+                queryset = queryset.filter(Q(date__lte=date) & (Q(date__lt=date) | Q(pk__lt=pk)))
+
+        return queryset.order_by('date', 'pk') if reverse else queryset.order_by('-date', '-pk')
+
+    def get_page_size(self, request: Request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+
+        return min(page_size, self.max_page_size) if page_size > 0 else self.page_size
+
+    def decode_cursor(self, request: Request) -> (tuple or None, bool):
+        """
+        Reads the cursor from the request.
+        :return: The date and pk it points at, or None if there is no cursor, and whether it goes backwards.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None, False
+
+        try:
+            cursor = json.loads(urlsafe_b64decode(encoded.encode()))
+            date, pk = isoparse(cursor['date']), cursor['pk']
+            # the pk is bound as a 64 bit integer, so anything else would only fail in the database
+            if type(pk) is not int or not -2 ** 63 <= pk < 2 ** 63:
+                raise ValueError(pk)
+            return (date, pk), bool(cursor.get('reverse'))
+        except (TypeError, ValueError, KeyError, OverflowError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, row, reverse: bool) -> str:
+        """
+        Builds the url of the page that starts after (or ends before) a row.
+        """
+        cursor = {'date': row.date.isoformat(), 'pk': row.pk}
+        if reverse:
+            cursor['reverse'] = True
+
+        encoded = urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self) -> str or None:
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self) -> str or None:
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data) -> Response:
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -1,9 +1,10 @@
 import itertools
+from functools import lru_cache
 
 from rest_framework import serializers
 
-from merchapi.models import Item, Tag, Flip
-from merchapi.models.price import Price
+from merchapi.models import Item, Tag, Flip, ScreenerEntry
+from merchapi.models.price import Price, LatestPrice
 
 
 def composed_serializer(serializer):
@@ -29,6 +30,27 @@ def composed_serializer(serializer):
     return ComposedSerializer
 
 
+@lru_cache()
+def compose(*serializers):
+    """
+    Composes a list of serializers at runtime, for when the
+    combination depends on the request.
+    :param serializers: The serializers to compose.
+    :return: The composed serializer.
+    """
+    serializers = tuple(serializer for serializer in serializers
+                        if not any(other is not serializer and issubclass(other, serializer) for other in serializers))
+    if len(serializers) == 1:
+        return serializers[0]
+
+    class Composed(*serializers):
+        class Meta:
+            fields = ()
+
+    Composed.__name__ = "".join(serializer.__name__ for serializer in serializers)
+    return composed_serializer(Composed)
+
+
 class ItemSerializer(serializers.ModelSerializer):
     """
     Serializes an item with basic information.
@@ -49,6 +71,87 @@ class PriceSerializer(serializers.ModelSerializer):
         fields = ('date', 'item', 'buy_price', 'sell_price', 'average_price', 'buy_volume', 'sell_volume')
 
 
+class LatestPriceSerializer(serializers.ModelSerializer):
+    """
+    Serializes the latest price of an item.
+    """
+
+    class Meta:
+        model = LatestPrice
+        fields = PriceSerializer.Meta.fields + LatestPrice.METRIC_FIELDS
+
+
+class PriceIntervalSerializer(serializers.Serializer):
+    """
+    Serializes a window of prices as produced by PriceManager.in_intervals,
+    with the first, last, min, max and average of each price and the total volumes.
+    """
+
+    date = serializers.DateTimeField()
+    item = serializers.IntegerField()
+    count = serializers.IntegerField()
+
+    buy_price_first = serializers.IntegerField()
+    buy_price_last = serializers.IntegerField()
+    buy_price_min = serializers.IntegerField()
+    buy_price_max = serializers.IntegerField()
+    buy_price_avg = serializers.FloatField()
+
+    sell_price_first = serializers.IntegerField()
+    sell_price_last = serializers.IntegerField()
+    sell_price_min = serializers.IntegerField()
+    sell_price_max = serializers.IntegerField()
+    sell_price_avg = serializers.FloatField()
+
+    average_price_first = serializers.IntegerField()
+    average_price_last = serializers.IntegerField()
+    average_price_min = serializers.IntegerField()
+    average_price_max = serializers.IntegerField()
+    average_price_avg = serializers.FloatField()
+
+    total_buy_volume = serializers.IntegerField()
+    total_sell_volume = serializers.IntegerField()
+
+
+class PriceHistorySerializer(serializers.BaseSerializer):
+    """
+    Serializes the price history of several items as columns: a shared list
+    of timestamps, and a list of values lined up with them for each item and
+    price field, with nulls where an item has no price at that time. Takes
+    rows of (item, date, *fields) and the item ids and fields in its context.
+    """
+
+    def to_representation(self, rows):
+        fields = self.context['fields']
+
+        timestamps = sorted({row[1] for row in rows})
+        positions = {date: position for position, date in enumerate(timestamps)}
+        items = {str(item_id): {field: [None] * len(timestamps) for field in fields}
+                 for item_id in self.context['item_ids']}
+
+        for item_id, date, *values in rows:
+            columns = items[str(item_id)]
+            for field, value in zip(fields, values):
+                columns[field][positions[date]] = value
+
+        return {
+            'timestamps': [int(date.timestamp()) for date in timestamps],
+            'items': items,
+        }
+
+
+class ScreenerEntrySerializer(serializers.ModelSerializer):
+    """
+    Serializes a screener entry with its item and the latest price it was ranked by.
+    """
+    item = ItemSerializer()
+    price = LatestPriceSerializer(source='item.latest_price')
+
+    class Meta:
+        model = ScreenerEntry
+        fields = ('rank', 'score', 'item', 'price')
+
+
 class TagSerializer(serializers.ModelSerializer):
     """
     Serializes a tag. Simply returns a string with the name.
@@ -62,6 +165,22 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ('name',)  # overridden by to_representation
 
 
+class TagCountSerializer(serializers.Serializer):
+    """
+    Serializes the name of a tag and the number of items it is on.
+    """
+    name = serializers.CharField(source='tag__name')
+    items = serializers.IntegerField()
+
+
+class TagPairSerializer(serializers.Serializer):
+    """
+    Deserializes an item and the name of a tag to add to or remove from it.
+    """
+    item = serializers.IntegerField()
+    tag = serializers.CharField(max_length=256)
+
+
 class FlipSerializer(serializers.ModelSerializer):
     """
     Serializes a flip.
@@ -1,8 +1,11 @@
+from django.templatetags.static import static
 from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 
+from merchapi import SPRITES_DIR
 from merchapi.models import Price
-from merchapi.serializers.base import PriceSerializer, composed_serializer, ItemSerializer
+from merchapi.serializers.base import PriceSerializer, composed_serializer, ItemSerializer, LatestPriceSerializer
+from util.merch.sprites import get_sprite_index
 
 
 @composed_serializer
@@ -24,7 +27,7 @@ class ItemPriceSerializer(ItemSerializer):
     price log. Better performance for many items.
     Requires Items.with_prices()
     """
-    price = PriceSerializer()
+    price = LatestPriceSerializer(source='latest_price')
 
     class Meta:
         fields = ('price',)
@@ -54,6 +57,37 @@ class SingleItemPriceSerializer(ItemSerializer):
         fields = ('price',)
 
 
+@composed_serializer
+class ItemSpriteSerializer(ItemSerializer):
+    """
+    Serializes an Item and embeds the location of
+    its icon in the sprite sheets.
+    """
+    sprite = SerializerMethodField()
+
+    @staticmethod
+    def get_sprite(item):
+        """
+        Gets the sprite sheet and offset of the item's icon.
+        :param item: The item to look up.
+        :return: The sheet url and the icon's position, or None if it has no icon.
+        """
+        icon = get_sprite_index(SPRITES_DIR)["icons"].get(str(item.item_id))
+        if icon is None:
+            return None
+
+        return {
+            "sheet": static(f"sprites/{icon['sheet']}"),
+            "x": icon["x"],
+            "y": icon["y"],
+            "width": icon["width"],
+            "height": icon["height"],
+        }
+
+    class Meta:
+        fields = ('sprite',)
+
+
 @composed_serializer
 class SingleItemPriceFavoriteSerializer(ItemFavoriteSerializer, SingleItemPriceSerializer):
     """
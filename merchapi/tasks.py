@@ -1,31 +1,55 @@
-import os
-
 from huey import crontab
-from huey.contrib.djhuey import db_periodic_task
+from django.conf import settings
+from huey.contrib.djhuey import db_periodic_task, db_task
 
-from merchapi import ICONS_DIR
-from merchapi.models import Item, Price
-from util.merch.scrape import get_new_items, get_prices_for_items, download_icons
+from merchapi import ICONS_DIR, SPRITES_DIR
+from merchapi.models import Item, MissingItem
+from util.merch.analytics import warm_analytics
+from util.merch.catalog import bump_catalog_version
+from util.merch.ingest import ingest_prices
+from util.merch.rollup import roll_up_all, prune_prices
+from util.merch.scrape import get_new_items, download_icons
+from util.merch.sprites import build_sprites
 
 
 @db_periodic_task(crontab(day="*"))
 def fetch_new_items():
     """
-    Gets new items from the api and downloads the icons.
+    Gets new items from the api, downloads the icons and packs them into sprite sheets.
     """
-    new_items, _ = get_new_items(1000)
+    new_items, missing_items = get_new_items(1000)
     Item.objects.bulk_create(new_items)
+    MissingItem.objects.bulk_create(missing_items)
+    if new_items:
+        bump_catalog_version()
 
-    files = os.listdir(ICONS_DIR)
-    item_ids = Item.objects.all().values_list('item_id', flat=True)
-
-    download_icons((item_id for item_id in item_ids if f"{item_id}.gif" not in files), ICONS_DIR)
+    download_icons(Item.objects.all().values_list('item_id', flat=True), ICONS_DIR)
+    build_sprites(ICONS_DIR, SPRITES_DIR)
 
 
 @db_periodic_task(crontab(hour="*"))
 def fetch_new_prices():
     """
-    Fetches new prices for all items in the DB.
+    Fetches new prices for all items in the DB as a new snapshot, computes
+    the market analytics for it, then rolls them up.
+    """
+    ingest_prices(Item.objects.all().values_list('item_id', flat=True))
+    warm_analytics()
+    roll_up_prices()
+
+
+@db_task()
+def roll_up_prices():
+    """
+    Aggregates the new prices into the hourly, daily and weekly rollups.
+    """
+    roll_up_all()
+
+
+@db_periodic_task(crontab(hour="4", minute="0"))
+def compact_prices():
+    """
+    Deletes the price history that has been rolled up and is past its retention.
     """
-    prices = get_prices_for_items(Item.objects.all().values_list('item_id', flat=True))
-    Price.objects.bulk_create(prices)
+    roll_up_all()
+    prune_prices(settings.PRICE_RETENTION)
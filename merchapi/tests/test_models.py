@@ -1,9 +1,16 @@
+import os
+import shutil
+import tempfile
 from datetime import datetime, timezone, timedelta
+from io import StringIO
 
-from django.db import IntegrityError
-from django.test import TestCase, TransactionTestCase
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-from merchapi.models import Item, Price, User, Flip, Spell, Tag, Merchant
+from merchapi.models import Item, Price, User, Flip, Spell, Tag, Merchant, PriceSnapshot, LatestPrice, \
+    ScreenerEntry, TaggedItem, TagCount, SEARCH_FUZZY_LIMIT, SQLITE_SEARCH_TABLES
 
 
 class ItemTest(TestCase):
@@ -67,6 +74,74 @@ class ItemTest(TestCase):
         self.assertEqual(self.item.get_profit(self.merchant), 100)
         self.assertEqual(self.item.get_profit(self.merchant2), 0)
 
+    def test_with_prices(self):
+        LatestPrice.objects.update_from([self.second_price])
+        items = Item.objects.filter(item_id__in=[2, 6]).with_prices()
+        self.assertEqual(items.count(), 2)
+
+        with self.assertNumQueries(1):
+            first, second = items[:2]
+            self.assertEqual((first.latest_price.buy_price, second.item_id), (5, 6))
+            self.assertFalse(hasattr(second, 'latest_price'))
+
+    def test_search(self):
+        self.assertEqual(Item.objects.search("rune platebody")[0].name, "Rune platebody")
+        self.assertEqual(Item.objects.search("RUNE PLATEB")[0].name, "Rune platebody")
+        self.assertEqual(Item.objects.search("cannonbäll")[0].name, "Cannonball")
+        self.assertTrue(all("platebody" in item.name.lower() for item in Item.objects.search("platebody")))
+        self.assertEqual(list(Item.objects.search("'")), [])
+
+    def test_search_substrings(self):
+        self.assertIn("Rune platebody", [item.name for item in Item.objects.search("body")])
+        self.assertIn("Rune platebody", [item.name for item in Item.objects.search("rune tebo")])
+        self.assertEqual(Item.objects.search("rune platebody")[0].name, "Rune platebody")
+
+    def test_search_typos(self):
+        self.assertEqual(Item.objects.search("rune pletebody")[0].name, "Rune platebody")
+        self.assertEqual(Item.objects.search("canonball")[0].name, "Cannonball")
+        self.assertEqual(list(Item.objects.search("zzzzzz")), [])
+        self.assertEqual(Item.objects.search("rune pletebody").count(), SEARCH_FUZZY_LIMIT)
+
+    def test_search_filtered_before_fallback(self):
+        # the arrow is nowhere near the closest trigram matches until the other items are filtered out
+        self.assertNotIn(892, [item.item_id for item in Item.objects.search("rune pletebody")])
+        self.assertEqual([item.item_id for item in Item.objects.search("rune pletebody").filter(item_id=892)], [892])
+
+    def test_search_in_sync(self):
+        Item.objects.filter(item_id=2).update(name="Crème brûlée")
+        Item.objects.create(item_id=1, name="Cannonball (new)", description="", members=False)
+
+        self.assertEqual([item.item_id for item in Item.objects.search("creme")], [2])
+        self.assertEqual([item.item_id for item in Item.objects.search("cannonball")], [1])
+
+        Item.objects.filter(item_id=1).delete()
+        self.assertNotIn(1, [item.item_id for item in Item.objects.search("cannonball")])
+        self.assertSearchInSync()
+
+    def test_search_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'merchapi_item'")
+            triggers = {name for name, in cursor.fetchall()}
+        self.assertEqual(triggers, {f'merchapi_item_search_{action}' for action in ('insert', 'delete', 'update')})
+
+        Item.objects.bulk_create([Item(item_id=1, name="Rune pickaxe (new)", description="", members=True)])
+        Item.objects.bulk_update([Item(item_id=2, name="Cannonball (old)")], ['name'])
+        Item.objects.filter(item_id=6).delete()
+        self.assertSearchInSync()
+
+    def test_rebuild_search_index(self):
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertSearchInSync()
+        self.assertEqual(Item.objects.search("rune platebody")[0].name, "Rune platebody")
+
+    def assertSearchInSync(self):
+        """
+        Checks that the search indexes match the items table exactly.
+        """
+        with connection.cursor() as cursor:
+            for table in SQLITE_SEARCH_TABLES:
+                cursor.execute(f"INSERT INTO {table}({table}, rank) VALUES ('integrity-check', 1)")
+
 
 class PriceTest(TestCase):
     fixtures = ['items.json']
@@ -95,6 +170,177 @@ class PriceTest(TestCase):
         self.assertAlmostEqual(self.price.get_demand(), 2 / 3)
 
 
+class PriceSnapshotTest(TestCase):
+    fixtures = ['items.json']
+
+    def setUp(self):
+        self.snapshots = [
+            PriceSnapshot.objects.create(date=datetime.now(timezone.utc) - timedelta(hours=hours))
+            for hours in (2, 1)
+        ]
+
+        for snapshot in self.snapshots:
+            for item_id in (2, 6):
+                Price.objects.create(
+                    date=snapshot.date,
+                    snapshot=snapshot,
+                    item_id=item_id,
+                    buy_price=snapshot.id,
+                    sell_price=snapshot.id,
+                )
+
+    def test_latest_snapshot(self):
+        with self.assertNumQueries(1):
+            prices = list(Price.objects.latest_snapshot())
+
+        self.assertEqual({price.item_id for price in prices}, {2, 6})
+        self.assertEqual({price.snapshot_id for price in prices}, {self.snapshots[1].id})
+
+    def test_in_snapshot(self):
+        prices = Price.objects.in_snapshot(self.snapshots[0])
+        self.assertEqual({price.buy_price for price in prices}, {self.snapshots[0].id})
+
+
+class PriceIntervalTest(TestCase):
+    fixtures = ['items.json']
+
+    def setUp(self):
+        start = datetime(2018, 1, 30, tzinfo=timezone.utc)
+        Price.objects.bulk_create(Price(
+            date=start + timedelta(hours=hours),
+            item_id=2,
+            buy_price=hours,
+            sell_price=hours * 2,
+            average_price=hours,
+            buy_volume=1,
+            sell_volume=2,
+        ) for hours in range(0, 96, 6))
+
+    def test_hours(self):
+        windows = list(Price.objects.in_intervals(12, 'h'))
+        self.assertEqual(len(windows), 8)
+        self.assertEqual(windows[0]['date'], datetime(2018, 1, 30, tzinfo=timezone.utc))
+        self.assertEqual((windows[0]['buy_price_first'], windows[0]['buy_price_last']), (0, 6))
+
+    def test_days(self):
+        with self.assertNumQueries(1):
+            windows = list(Price.objects.filter(item_id=2).in_intervals(1, 'd'))
+
+        self.assertEqual(len(windows), 4)
+        self.assertEqual([window['count'] for window in windows], [4] * 4)
+
+        day = windows[1]
+        self.assertEqual(day['date'], datetime(2018, 1, 31, tzinfo=timezone.utc))
+        self.assertEqual((day['buy_price_first'], day['buy_price_last']), (24, 42))
+        self.assertEqual((day['sell_price_min'], day['sell_price_max']), (48, 84))
+        self.assertAlmostEqual(day['average_price_avg'], 33)
+        self.assertEqual((day['total_buy_volume'], day['total_sell_volume']), (4, 8))
+
+    def test_months(self):
+        windows = list(Price.objects.in_intervals(1, 'm'))
+        self.assertEqual([window['count'] for window in windows], [8, 8])
+        self.assertEqual(len(Price.objects.in_intervals(1, 'y')), 1)
+
+
+class LatestPriceTest(TestCase):
+    fixtures = ['items.json']
+
+    def setUp(self):
+        self.snapshot = PriceSnapshot.objects.create(date=datetime.now(timezone.utc) - timedelta(hours=1))
+        self.prices = [Price.objects.create(
+            date=self.snapshot.date,
+            snapshot=self.snapshot,
+            item_id=item_id,
+            buy_price=4,
+            sell_price=5,
+        ) for item_id in (2, 6)]
+
+    def test_update_from(self):
+        LatestPrice.objects.update_from(self.prices)
+        self.assertEqual(LatestPrice.objects.count(), 2)
+
+        newer = PriceSnapshot.objects.create(date=datetime.now(timezone.utc))
+        price = Price.objects.create(date=newer.date, snapshot=newer, item_id=2, buy_price=6, sell_price=9)
+
+        with self.assertNumQueries(1):
+            LatestPrice.objects.update_from([price])
+
+        latest = LatestPrice.objects.get(item_id=2)
+        self.assertEqual((latest.snapshot_id, latest.buy_price, latest.get_profit()), (newer.id, 6, 3))
+        self.assertEqual(LatestPrice.objects.get(item_id=6).snapshot_id, self.snapshot.id)
+
+    def test_metrics(self):
+        latest = LatestPrice.from_price(self.prices[0])
+        self.assertEqual((latest.margin, latest.roi, latest.demand, latest.volume), (1, 1.25, None, None))
+
+        latest.buy_price, latest.buy_volume, latest.sell_volume = 0, 6, 3
+        latest.save()
+        latest.refresh_from_db()
+        self.assertEqual((latest.margin, latest.roi, latest.demand, latest.volume), (5, None, 2, 9))
+
+    def test_consistency(self):
+        self.assertEqual(LatestPrice.objects.inconsistent_items(), {2, 6})
+
+        LatestPrice.objects.rebuild()
+        self.assertEqual(LatestPrice.objects.inconsistent_items(), set())
+
+        LatestPrice.objects.filter(item_id=6).update(buy_price=1)
+        self.assertEqual(LatestPrice.objects.inconsistent_items(), {6})
+
+    def test_from_history_skips_user_prices(self):
+        user = User.objects.create(username="test")
+        Price.objects.create(date=datetime.now(timezone.utc), item_id=2, buy_price=1, sell_price=2, user=user)
+
+        latest = LatestPrice.objects.from_history()
+        self.assertEqual(set(latest), {2, 6})
+        self.assertEqual(latest[2].snapshot_id, self.snapshot.id)
+        self.assertEqual(set(Price.objects.filter(user=None).most_recent_for_each_item()), set(self.prices))
+
+
+class ScreenerEntryTest(TestCase):
+    fixtures = ['items.json']
+
+    def setUp(self):
+        self.snapshot = PriceSnapshot.objects.create(date=datetime.now(timezone.utc))
+        LatestPrice.objects.update_from([Price.objects.create(
+            date=self.snapshot.date,
+            snapshot=self.snapshot,
+            item_id=item_id,
+            buy_price=buy_price,
+            sell_price=sell_price,
+            buy_volume=volume,
+            sell_volume=volume,
+        ) for item_id, buy_price, sell_price, volume in (
+            (2, 10, 15, 400),
+            (6, 1, 5, 100),
+            (52, 10, 8, 5000),
+            (225, 100, 103, 5000),
+        )])
+
+    def ranking(self, formula, preset):
+        return [(entry.item_id, entry.score) for entry in ScreenerEntry.objects.ranking(formula, preset)]
+
+    def test_rebuild(self):
+        ScreenerEntry.objects.rebuild(self.snapshot)
+
+        self.assertEqual(self.ranking('profit', 'all'), [(225, 39000), (2, 35000)])
+        self.assertEqual(self.ranking('traded_profit', 'all'), [(225, 30000), (2, 4000), (6, 800)])
+        self.assertEqual(self.ranking('margin', 'all'), [(2, 5), (6, 4), (225, 3)])
+        self.assertEqual(self.ranking('roi', 'all')[0], (6, 5))
+        self.assertEqual(self.ranking('profit', 'f2p'), [(225, 39000)])
+        self.assertEqual(self.ranking('profit', 'members'), [(2, 35000)])
+        self.assertEqual(self.ranking('margin', 'liquid'), [(225, 3)])
+        self.assertEqual(ScreenerEntry.objects.get(formula='profit', preset='all', rank=1).snapshot, self.snapshot)
+
+    def test_rebuild_replaces(self):
+        ScreenerEntry.objects.rebuild(self.snapshot)
+        LatestPrice.objects.filter(item_id=225).update(margin=0)
+
+        ScreenerEntry.objects.rebuild(self.snapshot)
+        self.assertEqual(self.ranking('profit', 'all'), [(2, 35000)])
+        self.assertEqual(self.ranking('profit', 'f2p'), [])
+
+
 class FlipTest(TestCase):
     # todo implement when adding flips
 
@@ -143,6 +389,8 @@ class SpellTest(TestCase):
             sell_volume=300,
         )
 
+        LatestPrice.objects.rebuild()
+
     def test_get_price(self):
         spell = Spell.objects.get(name="Wind Strike")
         required_runes = spell.requiredrunes_set.all()
@@ -154,9 +402,74 @@ class SpellTest(TestCase):
             self.assertEqual(spell.get_price(), price)
 
 
+class TagCountTest(TestCase):
+    fixtures = ['items.json', 'merchants.json']
+
+    def setUp(self):
+        self.merchant = User.objects.create(username="test").merchant
+        self.other = User.objects.create(username="other").merchant
+        self.tag = Tag.objects.create(name="test")
+
+    def counts(self, merchant=None):
+        return {row.merchant_id: row.items for row in TagCount.objects.visible_to(merchant)}
+
+    def test_counts(self):
+        self.tag.tag_item(Item.objects.get(item_id=2))
+        self.tag.tag_item(Item.objects.get(item_id=6))
+        self.tag.tag_item(Item.objects.get(item_id=6), self.merchant)
+        self.tag.tag_item(Item.objects.get(item_id=8), self.merchant)
+        self.tag.tag_item(Item.objects.get(item_id=8), self.other)
+
+        self.assertEqual(self.counts(), {None: 2})
+        self.assertEqual(self.counts(self.merchant), {None: 2, self.merchant.id: 1})
+
+        TaggedItem.objects.filter(item_id=6, user=None).delete()
+        self.assertEqual(self.counts(self.merchant), {None: 1, self.merchant.id: 2})
+
+        self.tag.delete()
+        self.assertEqual(TagCount.objects.count(), 0)
+
+    def test_refresh(self):
+        TaggedItem.objects.bulk_create([TaggedItem(tag=self.tag, item_id=item_id) for item_id in (2, 6)])
+        self.assertEqual(self.counts(), {})
+
+        TagCount.objects.refresh()
+        self.assertEqual(self.counts(), {None: 2})
+
+    def test_untag_items_recounts_once(self):
+        TaggedItem.objects.tag_items([(2, "test"), (6, "test"), (8, "test")], self.merchant)
+        self.assertEqual(self.counts(self.merchant), {self.merchant.id: 3})
+
+        with CaptureQueriesContext(connection) as queries:
+            results = TaggedItem.objects.untag_items([(2, "test"), (6, "test"), (8, "other")], self.merchant)
+
+        self.assertEqual(results, ['deleted', 'deleted', 'missing'])
+        self.assertEqual(self.counts(self.merchant), {self.merchant.id: 1})
+        recounts = [query for query in queries if query['sql'].startswith('DELETE FROM "merchapi_tagcount"')]
+        self.assertEqual(len(recounts), 1)
+
+    def test_refresh_locks_tags(self):
+        with CaptureQueriesContext(connection) as queries:
+            TagCount.objects.refresh([self.tag.id])
+
+        selects = [query['sql'] for query in queries if query['sql'].startswith('SELECT')]
+        self.assertIn('FROM "merchapi_tag"', selects[0])
+        if connection.features.has_select_for_update:
+            self.assertIn('FOR UPDATE', selects[0])
+
+
 class TaggedItemTest(TransactionTestCase):
     fixtures = ['items.json', 'merchants.json']
 
+    def setUp(self):
+        # the tag version is bumped for real once each change commits
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        settings = override_settings(TAG_INDEX_VERSION_FILE=os.path.join(directory, 'tags.version'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
     def test_unique(self):
         tag = Tag.objects.create(
             name="test"
@@ -0,0 +1,140 @@
+import re
+from datetime import datetime, timezone, timedelta
+
+from django.contrib.auth.models import AnonymousUser
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase
+from rest_framework.test import APIRequestFactory
+
+from merchapi import views
+from merchapi.models import Item, Price, User, Flip, LatestPrice, Tag, TagCount
+from merchapi.pagination import KeysetPagination
+
+# a scan of every row of a table, or of every entry in one of its indexes
+FULL_SCAN = re.compile(r'\bSCAN (\S+)(?: USING (?:COVERING )?INDEX (\S+))?$|Seq Scan on (\S+)', re.MULTILINE)
+
+# the subqueries sqlite runs as part of the query, which it scans rather than a table
+SUBQUERY = re.compile(r'\b(?:CO-ROUTINE|MATERIALIZE) (\S+)$', re.MULTILINE)
+
+
+class QueryPlanTest(TestCase):
+    """
+    Captures the query plans of the hot queries and makes sure
+    none of them fall back to a full table scan.
+    """
+    fixtures = ['items.json', 'merchants.json']
+
+    def setUp(self):
+        self.item = Item.objects.get(item_id=2)
+        self.merchant = User.objects.create(username="test").merchant
+        self.factory = APIRequestFactory()
+
+    def assertUsesIndexes(self, queryset, allow_index_scans=()):
+        """
+        Fails if the query plan contains a full scan of any table.
+        The plan is explained from the query's own sql, as django misplaces the explain
+        when a filter on a window function wraps the query in a subquery.
+        :param allow_index_scans: The tables whose indexes may be scanned from end to end,
+                                  for queries that have to visit every row.
+        """
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            plan = '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+        subqueries = set(SUBQUERY.findall(plan))
+        allowed = tuple(f'{table}_' for table in allow_index_scans)
+        scans = [name or seq_scan for name, index, seq_scan in FULL_SCAN.findall(plan)
+                 if name not in subqueries and not (index and allowed and index.startswith(allowed))]
+        self.assertEqual(scans, [], f"Full table scan in {connection.vendor} plan:\n{plan}")
+
+    def view_queryset(self, view_class, query=None, user=None, **kwargs):
+        """
+        Builds the queryset of a view for a request, which is anonymous unless a user is given.
+        """
+        view = view_class()
+        view.setup(self.factory.get('/', query or {}), **kwargs)
+        view.request = view.initialize_request(view.request)
+        view.request.user = user or AnonymousUser()
+        view.format_kwarg = None
+        return view.get_queryset()
+
+    def test_most_recent_price(self):
+        self.assertUsesIndexes(Price.objects.filter(item=self.item).order_by('-date'))
+
+    def test_most_recent_for_each_item(self):
+        # every item is visited to look up its latest price, but only through an index
+        self.assertUsesIndexes(Price.objects.most_recent_for_each_item(), allow_index_scans=['merchapi_item'])
+        self.assertUsesIndexes(Price.objects.most_recent_for_each_item([self.item]))
+        self.assertUsesIndexes(Price.objects.filter(user=None).most_recent_for_each_item(),
+                               allow_index_scans=['merchapi_item'])
+
+    def test_in_snapshot(self):
+        self.assertUsesIndexes(Price.objects.in_snapshot(1))
+
+    def test_latest_prices_for_items(self):
+        self.assertUsesIndexes(LatestPrice.objects.filter(item__in=[2, 6]))
+
+    def test_item_profit(self):
+        self.assertUsesIndexes(Flip.objects.filter(item=self.item, merchant=self.merchant))
+
+    def test_item_favorited(self):
+        self.assertUsesIndexes(Item.objects.with_favorited(self.merchant).filter(item_id=2))
+
+    def test_item_list_by_metric(self):
+        self.assertUsesIndexes(self.view_queryset(views.ItemList, {'order': '-margin'}))
+        self.assertUsesIndexes(self.view_queryset(views.ItemList, {'order': 'roi', 'min_roi': 1.1}))
+        self.assertUsesIndexes(self.view_queryset(views.ItemList, {'min_volume': 1000}))
+
+    def test_item_list_by_tags(self):
+        Tag.objects.create(name='rune').tag_item(self.item)
+        Tag.objects.get(name='rune').tag_item(Item.objects.get(item_id=6), self.merchant)
+        self.assertUsesIndexes(self.view_queryset(views.ItemList, {'tag': ['rune|dragon', 'rune']}))
+        self.assertUsesIndexes(self.view_queryset(views.ItemList, {'tag': 'rune', 'prices': 1},
+                                                  user=self.merchant.user))
+
+    def test_tag_list(self):
+        self.assertUsesIndexes(TagCount.objects.visible_to(self.merchant).values('tag__name')
+                               .annotate(items=Sum('items')).order_by('tag__name'))
+        self.assertUsesIndexes(TagCount.objects.visible_to(None))
+
+    def test_tag_list_view(self):
+        Tag.objects.create(name='rune').tag_item(self.item)
+        for user in (None, self.merchant.user):
+            self.assertUsesIndexes(self.view_queryset(views.TagList, user=user))
+            self.assertUsesIndexes(self.view_queryset(views.TagList, {'counts': ''}, user=user))
+
+    def test_tag_items_view(self):
+        Tag.objects.create(name='rune').tag_item(self.item)
+        self.assertUsesIndexes(self.view_queryset(views.TagItems, tag_name='rune'))
+        self.assertUsesIndexes(self.view_queryset(views.TagItems, user=self.merchant.user, tag_name='rune'))
+
+    def test_item_search_with_prices(self):
+        self.assertUsesIndexes(self.view_queryset(views.ItemList, {'name': 'rune platebody', 'prices': 1}))
+        self.assertUsesIndexes(self.view_queryset(views.ItemList, {'name': 'rune pletebody', 'prices': 1}))
+
+    def test_screener_view(self):
+        self.assertUsesIndexes(self.view_queryset(views.ScreenerList, {'formula': 'roi', 'preset': 'f2p'}))
+
+    def test_item_prices_view(self):
+        now = datetime.now(timezone.utc)
+        self.assertUsesIndexes(self.view_queryset(views.ItemPrices, item_id=2))
+        self.assertUsesIndexes(self.view_queryset(views.ItemPrices, {
+            'before': now.isoformat(),
+            'after': (now - timedelta(days=7)).isoformat(),
+        }, item_id=2))
+
+    def test_item_prices_pages(self):
+        position = (datetime.now(timezone.utc), 10)
+        for reverse in (False, True):
+            self.assertUsesIndexes(KeysetPagination.get_page_queryset(self.item.price_set.all(), position, reverse))
+
+    def test_price_history_view(self):
+        self.assertUsesIndexes(self.view_queryset(views.PriceHistory, {'ids': '2,6,8'}))
+
+    def test_snapshot_prices_view(self):
+        self.assertUsesIndexes(self.view_queryset(views.PriceForItemList, {'snapshot': 1}))
+
+    def test_item_tags_view(self):
+        self.assertUsesIndexes(self.view_queryset(views.ItemTags, item_id=2))
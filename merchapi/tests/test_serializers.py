@@ -1,8 +1,9 @@
 from django.test import TestCase
 
 from merchapi.models import Item, User
-from merchapi.serializers.base import ItemSerializer
-from merchapi.serializers.item import ItemFavoriteSerializer, ItemPriceSerializer, ItemPriceFavoriteSerializer
+from merchapi.serializers.base import ItemSerializer, compose
+from merchapi.serializers.item import ItemFavoriteSerializer, ItemPriceSerializer, ItemPriceFavoriteSerializer, \
+    ItemSpriteSerializer
 
 
 class ComposedSerializerTest(TestCase):
@@ -55,3 +56,21 @@ class ItemSerializerTest(TestCase):
             set(ItemPriceFavoriteSerializer(item).data.keys()),
             {'item_id', 'name', 'description', 'store_price', 'members', 'buy_limit', 'high_alch', 'price', 'favorited'}
         )
+
+    def test_item_sprite_serializer(self):
+        item = Item.objects.get(item_id=2)
+        self.assertSetEqual(
+            set(ItemSpriteSerializer(item).data.keys()),
+            {'item_id', 'name', 'description', 'store_price', 'members', 'buy_limit', 'high_alch', 'sprite'}
+        )
+
+    def test_composed_sprite_serializer(self):
+        item = Item.objects.with_favorited(self.user.merchant).get(item_id=2)
+        serializer = compose(ItemFavoriteSerializer, ItemSpriteSerializer)
+        self.assertIs(serializer, compose(ItemFavoriteSerializer, ItemSpriteSerializer))
+        self.assertIs(compose(ItemSerializer, ItemSpriteSerializer), ItemSpriteSerializer)
+        self.assertSetEqual(
+            set(serializer(item).data.keys()),
+            {'item_id', 'name', 'description', 'store_price', 'members', 'buy_limit', 'high_alch', 'favorited',
+             'sprite'}
+        )
@@ -1,8 +1,21 @@
+import json
+import os
+import shutil
+import tempfile
+from base64 import urlsafe_b64encode
+from datetime import datetime, timezone, timedelta
+from unittest import mock
+
+from django.test import override_settings
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APITestCase, APITransactionTestCase
 
-from merchapi.models import Item, User, Favorite
+from merchapi import views
+from merchapi.serializers.base import ItemSerializer
+from merchapi.models import Item, User, Favorite, Price, PriceSnapshot, LatestPrice, ScreenerEntry, TagCount, \
+    TaggedItem
+from util.merch import analytics, autocomplete, catalog, tags
 
 
 class ItemTest(APITestCase):
@@ -12,6 +25,17 @@ class ItemTest(APITestCase):
 
     fixtures = ['items.json']
 
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        settings = override_settings(CATALOG_VERSION_FILE=os.path.join(directory, 'catalog', 'catalog.version'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        catalog._catalog = None
+        self.addCleanup(setattr, catalog, '_catalog', None)
+
     def test_get_items_list(self):
         """
         Tests the endpoint to get all items. /v1/items/
@@ -22,6 +46,83 @@ class ItemTest(APITestCase):
         data = response.json()
         self.assertEqual(Item.objects.count(), len(data))
 
+    def test_get_items_list_from_catalog(self):
+        """
+        Tests that plain item lists are served from the catalog. /v1/items/?members=false
+        """
+        url = reverse('items', kwargs={'version': 1})
+        self.client.get(url)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'members': 'false'})
+        self.assertEqual(len(response.json()), Item.objects.filter(members=False).count())
+        self.assertFalse(any(item['members'] for item in response.json()))
+        self.assertEqual(response.json()[0], ItemSerializer(Item.objects.filter(members=False).first()).data)
+
+    def test_get_items_list_sprites(self):
+        """
+        Tests the endpoint to get all items with their sprites. /v1/items/?sprites=1
+        """
+        url = reverse('items', kwargs={'version': 1})
+        response = self.client.get(url, {'sprites': 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('sprite', response.json()[0])
+
+    def test_search_items(self):
+        url = reverse('items', kwargs={'version': 1})
+        response = self.client.get(url, {'name': 'rune platebody'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()[0]['name'], "Rune platebody")
+
+        LatestPrice.objects.create(item_id=1127, date=datetime.now(timezone.utc), buy_price=4, sell_price=5)
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'name': 'rune platebody', 'prices': 1})
+        self.assertEqual([item['price'] and item['price']['margin'] for item in response.json()], [1, None, None])
+
+        response = self.client.get(url, {'name': 'platebody', 'members': 'false'})
+        self.assertTrue(all(not item['members'] for item in response.json()))
+        self.assertIn("Bronze platebody", [item['name'] for item in response.json()])
+
+    def test_autocomplete_items(self):
+        autocomplete._autocomplete = None
+        self.addCleanup(setattr, autocomplete, '_autocomplete', None)
+
+        url = reverse('item autocomplete', kwargs={'version': 1})
+        response = self.client.get(url, {'q': 'rune plate'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn({'item_id': 1127, 'name': "Rune platebody"}, response.json())
+
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {'q': 'cannon', 'limit': 2})
+        self.assertEqual(len(response.json()), 2)
+
+        self.assertEqual(self.client.get(url).json(), [])
+        self.assertEqual(self.client.get(url, {'q': 'a', 'limit': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_items_by_metric(self):
+        """
+        Tests ordering and filtering the items by their latest price. /v1/items/?order=-margin
+        """
+        for item_id, buy_price, sell_price, volume in ((2, 10, 15, 100), (6, 10, 30, 5), (8, 10, 11, 50), (10, 0, 3, 1)):
+            LatestPrice.objects.create(item_id=item_id, date=datetime.now(timezone.utc), buy_price=buy_price,
+                                       sell_price=sell_price, buy_volume=volume, sell_volume=volume)
+
+        url = reverse('items', kwargs={'version': 1})
+
+        response = self.client.get(url, {'order': '-margin'})
+        self.assertEqual([item['item_id'] for item in response.json()], [6, 2, 10, 8])
+
+        response = self.client.get(url, {'order': 'roi', 'prices': 1})
+        self.assertEqual([item['item_id'] for item in response.json()], [8, 2, 6])
+        self.assertEqual(response.json()[0]['price']['roi'], 1.1)
+
+        response = self.client.get(url, {'min_roi': 1.2, 'min_volume': 20})
+        self.assertEqual([item['item_id'] for item in response.json()], [2])
+
+        for query in ({'order': 'name'}, {'min_margin': 'lots'}, {'min_margin': 'inf'}, {'min_volume': '1e400'},
+                      {'min_volume': '1e300'}, {'min_roi': 'nan'}):
+            self.assertEqual(self.client.get(url, query).status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_get_item(self):
         """
         Tests the endpoint to get an item. /v1/items/2/
@@ -58,11 +159,63 @@ class ItemTest(APITestCase):
         data = response.json()
         self.assertIsInstance(data, list)
 
+    def test_get_item_price_pages(self):
+        """
+        Tests walking the pages of an item's prices. /v1/items/2/prices/?page_size=2
+        """
+        start = datetime(2018, 4, 2, tzinfo=timezone.utc)
+        dates = [start, start, start + timedelta(hours=1), start + timedelta(hours=2), start + timedelta(hours=3)]
+        ids = [Price.objects.create(item_id=2, date=date, buy_price=index).id for index, date in enumerate(dates)]
+
+        url = reverse('item prices', kwargs={'version': 1, 'item_id': 2})
+        self.assertEqual([price['buy_price'] for price in self.client.get(url).json()], list(range(len(ids))))
+
+        data = self.client.get(url, {'page_size': 2}).json()
+        self.assertIsNone(data['previous'])
+
+        pages = [data['results']]
+        while data['next'] is not None:
+            data = self.client.get(data['next']).json()
+            pages.append(data['results'])
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual([price['buy_price'] for page in pages for price in page], list(reversed(range(len(ids)))))
+
+        data = self.client.get(data['previous']).json()
+        self.assertEqual([price['buy_price'] for price in data['results']], [2, 1])
+
+        response = self.client.get(url, {'cursor': 'nonsense'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        for cursor in ({'date': start.isoformat(), 'pk': 'abc'}, {'date': start.isoformat(), 'pk': 10 ** 30},
+                       {'date': start.isoformat(), 'pk': 1.5}, {'date': 'yesterday', 'pk': 1}, {'date': 1, 'pk': 1}):
+            encoded = urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+            response = self.client.get(url, {'cursor': encoded})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_item_price_intervals(self):
+        """
+        Tests the endpoint to get the prices for an item in windows. /v1/items/2/prices/?interval=1d
+        """
+        url = reverse('item prices', kwargs={'version': 1, 'item_id': 2})
+        Price.objects.create(item_id=2, date=datetime(2018, 4, 2, tzinfo=timezone.utc), buy_price=4, sell_price=5)
+
+        for interval in ('1d', f'{views.ItemPrices.MAX_INTERVAL}y', f'{views.ItemPrices.MAX_INTERVAL}h'):
+            response = self.client.get(url, {'interval': interval})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(len(response.json()), 1)
+
+        for interval in ('d', '0d', '1s', '99999999999999999999h', '10001y'):
+            response = self.client.get(url, {'interval': interval})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class PricesTest(APITestCase):
     """
     Regression tests to make sure the prices API conforms to expectations.
     """
+    fixtures = ['items.json']
+
     def test_get_prices(self):
         url = reverse('prices', kwargs={"version": 1})
         response = self.client.get(url)
@@ -70,6 +223,123 @@ class PricesTest(APITestCase):
         data = response.json()
         self.assertIsInstance(data, list)
 
+        response = self.client.get(url, {"page_size": 10})
+        self.assertEqual(response.json(), {'next': None, 'previous': None, 'results': []})
+
+    def test_get_prices_for_snapshot(self):
+        url = reverse('prices', kwargs={"version": 1})
+        response = self.client.get(url, {"snapshot": 1})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), [])
+
+        response = self.client.get(url, {"snapshot": "latest"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_price_history(self):
+        start = datetime.now(timezone.utc) - timedelta(hours=3)
+        for hours in range(3):
+            for item_id in (2, 6):
+                if item_id == 6 and hours == 1:
+                    continue
+                Price.objects.create(item_id=item_id, date=start + timedelta(hours=hours),
+                                     buy_price=hours, sell_price=item_id)
+
+        url = reverse('price history', kwargs={"version": 1})
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {"ids": "2,6,8", "fields": "buy_price,sell_price"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        data = response.json()
+        self.assertEqual(data['timestamps'], [int((start + timedelta(hours=hours)).timestamp()) for hours in range(3)])
+        self.assertEqual(data['items']['2'], {'buy_price': [0, 1, 2], 'sell_price': [2, 2, 2]})
+        self.assertEqual(data['items']['6'], {'buy_price': [0, None, 2], 'sell_price': [6, None, 6]})
+        self.assertEqual(data['items']['8'], {'buy_price': [None] * 3, 'sell_price': [None] * 3})
+
+        response = self.client.get(url, {"ids": "2", "after": (start + timedelta(minutes=90)).isoformat()})
+        self.assertEqual(len(response.json()['timestamps']), 1)
+        self.assertEqual(set(response.json()['items']['2']), set(views.PriceHistory.FIELDS))
+
+        for query in ({}, {"ids": "2,x"}, {"ids": "2", "fields": "name"}, {"ids": ",".join(map(str, range(101)))},
+                      {"ids": "2,99999999999999999999999"}, {"ids": "2,²"}):
+            response = self.client.get(url, query)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        with mock.patch.object(views.PriceHistory, 'MAX_ROWS', 4):
+            self.assertEqual(self.client.get(url, {"ids": "2,6"}).status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEqual(self.client.get(url, {"ids": "2"}).status_code, status.HTTP_200_OK)
+
+
+class AnalyticsTest(APITestCase):
+    """
+    Regression tests to make sure the analytics API conforms to expectations.
+    """
+    fixtures = ['items.json']
+
+    def setUp(self):
+        analytics._analytics = None
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(ANALYTICS_FILE=os.path.join(directory, 'analytics.npz'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        start = datetime.now(timezone.utc) - timedelta(hours=3)
+        for hours in range(3):
+            snapshot = PriceSnapshot.objects.create(date=start + timedelta(hours=hours))
+            Price.objects.create(item_id=2, date=snapshot.date, snapshot=snapshot, buy_price=4, sell_price=5)
+
+    def test_get_analytics(self):
+        url = reverse('analytics', kwargs={'version': 1})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([row['item'] for row in response.json()], [2])
+        self.assertEqual(response.json()[0]['margin'], 1)
+
+        self.assertEqual(self.client.get(url, {'ids': '6'}).json(), [])
+        self.assertEqual(self.client.get(url, {'ids': 'x'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_get_item_analytics(self):
+        response = self.client.get(reverse('item analytics', kwargs={'version': 1, 'item_id': 2}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['timestamps']), 3)
+
+        response = self.client.get(reverse('item analytics', kwargs={'version': 1, 'item_id': 6}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ScreenerTest(APITestCase):
+    """
+    Regression tests to make sure the screener API conforms to expectations.
+    """
+    fixtures = ['items.json']
+
+    def setUp(self):
+        snapshot = PriceSnapshot.objects.create(date=datetime.now(timezone.utc))
+        LatestPrice.objects.update_from([
+            Price.objects.create(item_id=item_id, date=snapshot.date, snapshot=snapshot, buy_price=4, sell_price=sell)
+            for item_id, sell in ((2, 5), (52, 6), (225, 5))
+        ])
+        ScreenerEntry.objects.rebuild(snapshot)
+
+    def test_get_screener(self):
+        url = reverse('screener', kwargs={'version': 1})
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(row['rank'], row['item']['item_id']) for row in response.json()],
+                         [(1, 52), (2, 225), (3, 2)])
+        self.assertEqual(response.json()[0]['score'], 14000)
+        self.assertEqual(response.json()[0]['price']['margin'], 2)
+
+        response = self.client.get(url, {'formula': 'margin', 'preset': 'members', 'limit': 1})
+        self.assertEqual([row['item']['item_id'] for row in response.json()], [52])
+
+    def test_get_screener_invalid(self):
+        url = reverse('screener', kwargs={'version': 1})
+        for query in ({'formula': 'x'}, {'preset': 'x'}, {'limit': '-1'}):
+            response = self.client.get(url, query)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class FavoriteTest(APITransactionTestCase):
     """
@@ -94,6 +364,19 @@ class FavoriteTest(APITransactionTestCase):
         token = response.json()["key"]
         self.auth = f"Token {token}"
 
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        settings = override_settings(CATALOG_VERSION_FILE=os.path.join(directory, 'catalog.version'),
+                                     TAG_INDEX_VERSION_FILE=os.path.join(directory, 'tags.version'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        tags._tag_index = None
+        self.addCleanup(setattr, tags, '_tag_index', None)
+        catalog._catalog = None
+        self.addCleanup(setattr, catalog, '_catalog', None)
+
     def test_get_favorites_list(self):
         """
         Tests that:
@@ -130,6 +413,25 @@ class FavoriteTest(APITransactionTestCase):
         value = response.json()
         self.assertEqual(value, False)
 
+    def test_get_items_list_favorited(self):
+        """
+        Tests that the item list marks your favorites, and plain lists come from the catalog. /v1/items/
+        """
+        self.client.post(reverse('item favorite', kwargs={'version': 1, 'item_id': 2}), HTTP_AUTHORIZATION=self.auth)
+
+        url = reverse('items', kwargs={'version': 1})
+        self.client.get(url)
+
+        # the token, the merchant and their favorites
+        with self.assertNumQueries(3):
+            response = self.client.get(url, HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual([item['item_id'] for item in response.json() if item['favorited']], [2])
+        self.assertEqual(len(response.json()), Item.objects.count())
+
+        response = self.client.get(url, {'name': 'cannon'}, HTTP_AUTHORIZATION=self.auth)
+        self.assertGreater(len(response.json()), 1)
+        self.assertEqual([item['item_id'] for item in response.json() if item['favorited']], [2])
+
     def test_create_favorite(self):
         """
         Tests that:
@@ -206,6 +508,21 @@ class TagsTest(APITransactionTestCase):
         token = response.json()["key"]
         self.auth = f"Token {token}"
 
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        settings = override_settings(CATALOG_VERSION_FILE=os.path.join(directory, 'catalog.version'),
+                                     TAG_INDEX_VERSION_FILE=os.path.join(directory, 'tags.version'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        tags._tag_index = None
+        self.addCleanup(setattr, tags, '_tag_index', None)
+        catalog._catalog = None
+        self.addCleanup(setattr, catalog, '_catalog', None)
+
+        TagCount.objects.refresh()
+
     def test_get_tags_list(self):
         """
         Tests the tags list endpoint. /v1/tags/
@@ -215,6 +532,32 @@ class TagsTest(APITransactionTestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         data = response.json()
         self.assertIsInstance(data, list)
+        self.assertIn('rune', data)
+
+    def test_get_tags_list_counts(self):
+        """
+        Tests the tags list endpoint with the number of items with each tag. /v1/tags/?counts
+        """
+        url = reverse('tags', kwargs={"version": 1})
+        rune = TaggedItem.objects.filter(tag__name='rune', user=None).count()
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'counts': ''})
+        self.assertIn({'name': 'rune', 'items': rune}, response.json())
+
+        item_tags = reverse('item tags', kwargs={'version': 1, 'item_id': 2})
+        self.client.post(item_tags, {"name": "rune"}, HTTP_AUTHORIZATION=self.auth)
+        self.client.post(item_tags, {"name": "p2p"}, HTTP_AUTHORIZATION=self.auth)
+        self.client.post(item_tags, {"name": "mine"}, HTTP_AUTHORIZATION=self.auth)
+
+        counts = self.client.get(url, {'counts': ''}, HTTP_AUTHORIZATION=self.auth).json()
+        self.assertIn({'name': 'rune', 'items': rune + 1}, counts)
+        self.assertIn({'name': 'mine', 'items': 1}, counts)
+        self.assertEqual(counts, self.client.get(url, {'counts': ''}, HTTP_AUTHORIZATION=self.auth).json())
+
+        self.assertIn({'name': 'rune', 'items': rune}, self.client.get(url, {'counts': ''}).json())
+        self.assertNotIn('mine', self.client.get(url).json())
+        self.assertIn('mine', self.client.get(url, HTTP_AUTHORIZATION=self.auth).json())
 
     def test_get_tag_items(self):
         """
@@ -231,6 +574,93 @@ class TagsTest(APITransactionTestCase):
         items = response.json()
         self.assertIsInstance(items, list)
 
+    def test_get_items_by_tags(self):
+        """
+        Tests filtering the items list by combinations of tags. /v1/items/?tag=rune|dragon&tag=f2p
+        """
+        url = reverse('items', kwargs={"version": 1})
+        rune = {item['item_id'] for item in self.client.get(url, {'tag': 'rune'}).json()}
+        f2p = {item['item_id'] for item in self.client.get(url, {'tag': 'F2P'}).json()}
+        dragon = {item['item_id'] for item in self.client.get(url, {'tag': 'dragon'}).json()}
+        self.assertTrue(rune and f2p and dragon)
+
+        response = self.client.get(url, {'tag': ['rune', 'f2p']})
+        self.assertEqual({item['item_id'] for item in response.json()}, rune & f2p)
+
+        response = self.client.get(url, {'tag': ['rune|dragon', 'f2p']})
+        self.assertEqual({item['item_id'] for item in response.json()}, (rune | dragon) & f2p)
+
+        self.assertEqual(self.client.get(url, {'tag': 'missing'}).json(), [])
+
+    def test_get_own_tag_items(self):
+        """
+        Tests that private tags are only seen by their merchant. /v1/tags/mine/
+        """
+        self.client.post(reverse('item tags', kwargs={'version': 1, 'item_id': 2}), {"name": "mine"},
+                         HTTP_AUTHORIZATION=self.auth)
+
+        url = reverse('tag items', kwargs={"version": 1, "tag_name": "mine"})
+        self.assertEqual(self.client.get(url).json(), [])
+        response = self.client.get(url, HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual([item['item_id'] for item in response.json()], [2])
+
+        url = reverse('items', kwargs={"version": 1})
+        self.assertEqual(self.client.get(url, {'tag': 'mine'}).json(), [])
+        response = self.client.get(url, {'tag': ['mine', 'weapon|p2p']}, HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual([item['item_id'] for item in response.json()], [2])
+
+    def test_bulk_tag_items(self):
+        """
+        Tests tagging and untagging many items at once. /v1/items/tags/
+        """
+        url = reverse('bulk item tags', kwargs={'version': 1})
+        pairs = [{'item': 2, 'tag': 'mine'}, {'item': 6, 'tag': 'mine'}, {'item': 2, 'tag': 'p2p'},
+                 {'item': 1, 'tag': 'mine'}]
+
+        self.assertEqual(self.client.post(url, pairs, 'json').status_code, status.HTTP_403_FORBIDDEN)
+
+        response = self.client.post(url, pairs, 'json', HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([pair['result'] for pair in response.json()], ['created', 'created', 'created', 'missing'])
+
+        response = self.client.post(url, pairs[:1], 'json', HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(response.json(), [{'item': 2, 'tag': 'mine', 'result': 'exists'}])
+
+        tag_items = reverse('tag items', kwargs={"version": 1, "tag_name": "mine"})
+        response = self.client.get(tag_items, HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual([item['item_id'] for item in response.json()], [2, 6])
+        self.assertIn({'name': 'mine', 'items': 2},
+                      self.client.get(reverse('tags', kwargs={"version": 1}), {'counts': ''},
+                                      HTTP_AUTHORIZATION=self.auth).json())
+
+        response = self.client.delete(url, pairs[:2] + [{'item': 6, 'tag': 'p2p'}], 'json',
+                                      HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual([pair['result'] for pair in response.json()], ['deleted', 'deleted', 'missing'])
+        self.assertEqual(self.client.get(tag_items, HTTP_AUTHORIZATION=self.auth).json(), [])
+        self.assertFalse(TagCount.objects.filter(tag__name='mine').exists())
+
+        response = self.client.post(url, [{'item': 'rune'}], 'json', HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_tag_repeated_items(self):
+        """
+        Tests that a pair given twice, in any case, is only tagged and untagged once. /v1/items/tags/
+        """
+        url = reverse('bulk item tags', kwargs={'version': 1})
+        pairs = [{'item': 2, 'tag': 'Mine'}, {'item': 2, 'tag': 'mine'}, {'item': 2, 'tag': 'MINE'}]
+
+        response = self.client.post(url, pairs, 'json', HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual([(pair['tag'], pair['result']) for pair in response.json()],
+                         [('mine', 'created'), ('mine', 'exists'), ('mine', 'exists')])
+        self.assertEqual(list(TaggedItem.objects.filter(item_id=2, tag__name='mine').values_list('item_id', flat=True)),
+                         [2])
+        self.assertEqual(list(TagCount.objects.filter(tag__name='mine').values_list('items', flat=True)), [1])
+
+        response = self.client.delete(url, pairs, 'json', HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual([pair['result'] for pair in response.json()], ['deleted', 'missing', 'missing'])
+        self.assertFalse(TaggedItem.objects.filter(tag__name='mine').exists())
+        self.assertFalse(TagCount.objects.filter(tag__name='mine').exists())
+
     def test_get_item_tags(self):
         """
         Tests the endpoint to get all tags for an item. /v1/items/2/tags/
@@ -248,7 +678,12 @@ class TagsTest(APITransactionTestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         data = response.json()
-        self.assertIsInstance(data, list)
+        self.assertEqual(data, ['p2p'])
+
+        # own tags are included
+        self.client.post(url, {"name": "mine"}, HTTP_AUTHORIZATION=self.auth)
+        self.assertEqual(self.client.get(url).json(), ['p2p'])
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION=self.auth).json(), ['mine', 'p2p'])
 
     def test_add_tag(self):
         """
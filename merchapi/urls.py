@@ -24,6 +24,8 @@ register_converter(ApiConverter, 'api')
 
 urlpatterns = [
     path('<api:version>/items/', views.ItemList.as_view(), name='items'),
+    path('<api:version>/items/tags/', views.BulkItemTags.as_view(), name='bulk item tags'),
+    path('<api:version>/items/autocomplete/', views.ItemAutocomplete.as_view(), name='item autocomplete'),
     path('<api:version>/items/<int:item_id>/', views.ItemSingle.as_view(), name='item'),
     path('<api:version>/items/<int:item_id>/prices/', views.ItemPrices.as_view(), name='item prices'),
     path('<api:version>/items/<int:item_id>/tags/', views.ItemTags.as_view(), name='item tags'),
@@ -31,6 +33,12 @@ urlpatterns = [
     path('<api:version>/items/<int:item_id>/flips/', views.ItemFlips.as_view(), name='item flips'),
 
     path('<api:version>/prices/', views.PriceForItemList.as_view(), name='prices'),
+    path('<api:version>/prices/history/', views.PriceHistory.as_view(), name='price history'),
+
+    path('<api:version>/analytics/', views.AnalyticsList.as_view(), name='analytics'),
+    path('<api:version>/analytics/<int:item_id>/', views.ItemAnalytics.as_view(), name='item analytics'),
+
+    path('<api:version>/screener/', views.ScreenerList.as_view(), name='screener'),
 
     path('<api:version>/favorites/', views.FavoriteList.as_view(), name='favorites'),
 
@@ -1,8 +1,11 @@
+import math
 import re
-from typing import List
+from datetime import datetime, timezone, timedelta
+from typing import List, Tuple
 
 from dateutil.parser import isoparse
 from django.db import IntegrityError
+from django.db.models import Sum, Q
 from django.http import Http404
 from rest_framework import generics, mixins, status
 from rest_framework.authentication import TokenAuthentication, SessionAuthentication
@@ -12,10 +15,18 @@ from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.serializers import Serializer
 
-from merchapi.models import Item, Price, Favorite, Tag, TaggedItem
+from merchapi.models import Item, Price, Favorite, Tag, TaggedItem, TagCount, LatestPrice, BasePrice, ScreenerEntry, \
+    get_rollup_model, get_rolled_up_windows, SCREENER_FORMULAS, SCREENER_PRESETS, SCREENER_SIZE, BULK_TAG_LIMIT
+from merchapi.pagination import KeysetPagination
 from merchapi.serializers.item import ItemPriceSerializer, ItemPriceFavoriteSerializer, ItemFavoriteSerializer, \
-    SingleItemPriceSerializer, SingleItemPriceFavoriteSerializer
-from merchapi.serializers.base import ItemSerializer, PriceSerializer, TagSerializer, FlipSerializer
+    SingleItemPriceSerializer, SingleItemPriceFavoriteSerializer, ItemSpriteSerializer
+from merchapi.serializers.base import ItemSerializer, PriceSerializer, TagSerializer, FlipSerializer, compose, \
+    LatestPriceSerializer, PriceIntervalSerializer, PriceHistorySerializer, ScreenerEntrySerializer, TagCountSerializer, \
+    TagPairSerializer
+from util.merch.analytics import get_analytics
+from util.merch.autocomplete import get_autocomplete
+from util.merch.catalog import get_catalog
+from util.merch.tags import get_tag_index, bump_tag_version
 
 
 class ItemList(generics.ListAPIView):
@@ -26,13 +37,25 @@ class ItemList(generics.ListAPIView):
     ### **Query Strings**
     This endpoint supports a set of querystring parameters:
 
-    - **name:** *?name=[query]* - Filters the items list to names matching the one given.
+    - **name:** *?name=[query]* - Searches the items list by name, ignoring case and accents and tolerating small
+                                  typos. Items are ordered by how well they match unless an order is given.
     - **members:** *?members=[true|false]* - Gets all items that are either members or non-members.
-    - **tag:** *?tag=[first]&tag=[second]* - Filters the items list by one or more tags.
+    - **tag:** *?tag=[first]&tag=[second]* - Filters the items list to the ones with every tag given, where a tag
+                                           can be either of a few: *?tag=rune|arrow&tag=f2p*. Includes your own tags.
     - **prices:** *?prices* - Additionally gets the prices for each item.
+    - **sprites:** *?sprites* - Additionally gets the location of each item's icon in the sprite sheets.
+    - **order:** *?order=[-][margin|roi|demand|volume]* - Orders the items by their latest price, descending with a -.
+                                                          Items without a value for that metric are left out.
+    - **min_margin:** *?min_margin=[int]* - Only gets items with at least the given margin.
+    - **min_roi:** *?min_roi=[float]* - Only gets items with at least the given roi, where 1.25 is 25%.
+    - **min_demand:** *?min_demand=[float]* - Only gets items with at least the given ratio of buyers to sellers.
+    - **min_volume:** *?min_volume=[int]* - Only gets items with at least the given combined buy and sell volume.
     """
     authentication_classes = (SessionAuthentication, TokenAuthentication,)
 
+    # the metrics are compared as 64 bit integers
+    MAX_MINIMUM = 2 ** 63
+
     def get_queryset(self):
         """
         Overrides the get queryset function to handle querying.
@@ -42,18 +65,41 @@ class ItemList(generics.ListAPIView):
 
         name = self.request.query_params.get('name')
         if name is not None:
-            queryset = queryset.filter(name__contains=name)
+            queryset = queryset.search(name)
 
-        members = self.request.query_params.get('members')
-        if members in ['true', '1', 'y']:
-            queryset = queryset.filter(members=True)
-        elif members in ['false', '0', 'n']:
-            queryset = queryset.filter(members=False)
+        members = self.get_members()
+        if members is not None:
+            queryset = queryset.filter(members=members)
 
         tags: List[str] = self.request.query_params.getlist('tag', [])
-
-        for tag in tags:
-            queryset = queryset.filter(tags__name=tag.lower())
+        if tags:
+            merchant_id = self.request.user.merchant.id if self.request.user.is_authenticated else None
+            clauses = [[name.lower() for name in tag.split('|')] for tag in tags]
+            queryset = queryset.filter(item_id__in=get_tag_index().query(clauses, merchant_id))
+
+        for metric in LatestPrice.METRIC_FIELDS:
+            minimum = self.request.query_params.get(f'min_{metric}')
+            if minimum is not None:
+                try:
+                    minimum = float(minimum)
+                except ValueError:
+                    raise ParseError(f"Invalid Minimum {metric.title()}")
+
+                # infinite or huge minimums overflow the integer columns when they are bound
+                if not math.isfinite(minimum) or abs(minimum) >= self.MAX_MINIMUM:
+                    raise ParseError(f"Invalid Minimum {metric.title()}")
+                queryset = queryset.filter(**{f'latest_price__{metric}__gte': minimum})
+
+        order = self.request.query_params.get('order')
+        if order is not None:
+            metric = order.lstrip('-')
+            if metric not in LatestPrice.METRIC_FIELDS:
+                raise ParseError("Invalid Order")
+
+            # ties are broken on the latest price's item so the whole order comes from the metric's index
+            direction = '-' if order.startswith('-') else ''
+            queryset = queryset.filter(**{f'latest_price__{metric}__isnull': False}) \
+                .order_by(f'{direction}latest_price__{metric}', f'{direction}latest_price__item_id')
 
         if self.request.user.is_authenticated:
             queryset = queryset.with_favorited(self.request.user.merchant)
@@ -64,22 +110,87 @@ class ItemList(generics.ListAPIView):
 
         return queryset
 
+    def get_members(self) -> bool or None:
+        """
+        :return: Whether to only get members or non-members items, or None for both.
+        """
+        members = self.request.query_params.get('members')
+        if members in ['true', '1', 'y']:
+            return True
+        elif members in ['false', '0', 'n']:
+            return False
+        return None
+
+    def list(self, request, *args, **kwargs):
+        # plain lists are the same for everyone, so they come from the catalog,
+        # with only the merchant's favorites looked up when they are logged in
+        if set(request.query_params) <= {'members', 'format'}:
+            items = get_catalog().serialized(self.get_members())
+            if not request.user.is_authenticated:
+                return Response(items)
+
+            favorites = set(Favorite.objects.filter(merchant=request.user.merchant).values_list('item_id', flat=True))
+            return Response([{**item, 'favorited': item['item_id'] in favorites} for item in items])
+
+        return super().list(request, *args, **kwargs)
+
     def get_serializer_class(self):
         if self.request.user.is_authenticated:
             if self.request.query_params.get('prices'):
-                return ItemPriceFavoriteSerializer
+                serializer = ItemPriceFavoriteSerializer
             else:
-                return ItemFavoriteSerializer
+                serializer = ItemFavoriteSerializer
         else:
             if self.request.query_params.get('prices'):
-                return ItemPriceSerializer
+                serializer = ItemPriceSerializer
             else:
-                return ItemSerializer
+                serializer = ItemSerializer
+
+        if self.request.query_params.get('sprites'):
+            return compose(serializer, ItemSpriteSerializer)
+
+        return serializer
+
+
+class ItemAutocomplete(generics.GenericAPIView):
+    """
+    Completes a partial item name, for searching as you type. Items are matched on the
+    start of any word in their name and the ones with the most volume come first.
+    The names are kept in memory, so this never hits the database.
+
+    ### **Query Strings**
+    This endpoint supports a set of querystring parameters:
+
+    - **q:** *?q=[query]* - The start of the name.
+    - **limit:** *?limit=[int]* - The most items to get, up to 25. Defaults to 10.
+    """
+    # no authentication, so the session is never looked up either
+    authentication_classes = ()
+    permission_classes = ()
+    serializer_class = Serializer
+
+    def get(self, request, version):
+        """
+        Gets the items that complete the query.
+        :param request: The request object.
+        :param version: The api version.
+        :return: A list of item ids and names.
+        """
+        limit = request.query_params.get('limit', '10')
+        if not limit.isdigit():
+            raise ParseError("Invalid Limit")
+
+        return Response(get_autocomplete().complete(request.query_params.get('q', ''), int(limit)))
 
 
 class ItemSingle(generics.RetrieveAPIView):
     """
     Gets a single item from the database.
+
+    ### **Query Strings**
+    This endpoint supports a set of querystring parameters:
+
+    - **sprites:** *?sprites* - Additionally gets the location of the item's icon in the sprite sheets.
     """
     authentication_classes = (SessionAuthentication, TokenAuthentication,)
 
@@ -92,8 +203,23 @@ class ItemSingle(generics.RetrieveAPIView):
             else Item.objects.all()
         )
 
+    def get_object(self):
+        if self.request.user.is_authenticated:
+            return super().get_object()
+
+        try:
+            return get_catalog().by_id[self.kwargs[self.lookup_field]]
+        except KeyError:
+            raise Http404
+
     def get_serializer_class(self):
-        return SingleItemPriceFavoriteSerializer if self.request.user.is_authenticated else SingleItemPriceSerializer
+        serializer = SingleItemPriceFavoriteSerializer if self.request.user.is_authenticated \
+            else SingleItemPriceSerializer
+
+        if self.request.query_params.get('sprites'):
+            return compose(serializer, ItemSpriteSerializer)
+
+        return serializer
 
 
 class ItemPrices(generics.ListAPIView):
@@ -105,9 +231,22 @@ class ItemPrices(generics.ListAPIView):
 
     - **before:** *?before=[ISO8601]*        - Only shows prices before a given date.
     - **after:** *?after=[ISO8601]*          - Only shows prices after a given date.
-    - **interval:** *?interval=2[h|d|w|m|y]* - Limits the interval to every hour, day, week, month or year, getting
-                                               the first one of each 'window'.. If none exist, it is ignored.
+    - **interval:** *?interval=2[h|d|w|m|y]* - Groups the prices into windows of hours, days, weeks, months or years,
+                                               returning the first, last, min, max and average of each price in
+                                               every window along with the total volumes. Windows are built from
+                                               the coarsest price rollup that fits the interval, and from the
+                                               prices themselves where they have not been rolled up yet.
+    - **cursor:** *?cursor=[cursor]*         - Gets the page of prices a next or previous link points to.
+    - **page_size:** *?page_size=[int]*      - Pages the prices, newest first, with this many on each page, up to
+                                               5000. Without a page size or cursor, every price is returned in
+                                               order of date.
+
+    Windows are never paginated.
     """
+    pagination_class = KeysetPagination
+
+    # the most units in a window, well past any history but short enough to fit in a timedelta
+    MAX_INTERVAL = 10000
 
     def get_queryset(self):
         """
@@ -115,42 +254,52 @@ class ItemPrices(generics.ListAPIView):
         """
 
         try:
-            queryset = Item.objects.get(item_id=self.kwargs['item_id']).price_set
+            item = Item.objects.get(item_id=self.kwargs['item_id'])
         except Item.DoesNotExist:
             raise Http404("Item does not exist.")
 
+        interval = self.request.query_params.get('interval')
+        match = None
+        if interval is not None:
+            match = re.search('^([0-9]+)([hdwmy])$', interval)
+            if match is None or not 0 < int(match.group(1)) <= self.MAX_INTERVAL:
+                raise ParseError("Invalid Interval")
+
+        dates = Q()
+
         before = self.request.query_params.get('before')
         if before is not None:
             try:
-                date = isoparse(before)
+                dates &= Q(date__lt=isoparse(before))
             except ValueError:
                 raise ParseError("Invalid Before Date")
-            else:
-                queryset = queryset.filter(date__lt=date)
 
         after = self.request.query_params.get('after')
         if after is not None:
             try:
-                date = isoparse(after)
+                dates &= Q(date__gt=isoparse(after))
             except ValueError:
                 raise ParseError("Invalid After Date")
-            else:
-                queryset = queryset.filter(date__gt=date)
 
-        interval = self.request.query_params.get('interval')
-        if interval is not None:
-            match = re.search('^([0-9]+)([hdwmy])$', interval)
-            if match is None:
-                raise ParseError("Invalid Interval")
+        if match is None:
+            return item.price_set.filter(dates).order_by('date', 'pk')
 
-            count = match.group(1)
-            unit = match.group(2)
+        count, unit = int(match.group(1)), match.group(2)
+        rollup = get_rollup_model(unit)
+        if rollup is None:
+            return item.price_set.filter(dates).in_intervals(count, unit)
 
-            # todo find a reasonable way to do this..
+        return get_rolled_up_windows(rollup, item, count, unit, dates)
 
-        return queryset
+    def paginate_queryset(self, queryset):
+        if self.request.query_params.get('interval') is not None:
+            return None
+        return super().paginate_queryset(queryset)
 
-    serializer_class = PriceSerializer
+    def get_serializer_class(self):
+        if self.request.query_params.get('interval') is not None:
+            return PriceIntervalSerializer
+        return PriceSerializer
 
 
 class ItemTags(generics.ListAPIView):
@@ -162,20 +311,12 @@ class ItemTags(generics.ListAPIView):
     lookup_field = 'item_id'
 
     def get_queryset(self):
-        try:
-            tags = Item.objects.get(item_id=self.kwargs[self.lookup_field]).tags
-        except Item.DoesNotExist as err:
+        item_id = self.kwargs[self.lookup_field]
+        if item_id not in get_catalog().by_id:
             raise Http404("Item does not exist.")
-        else:
-            unowned_tags = tags.filter(taggeditem__user=None)
 
-            if self.request.user.is_authenticated:
-                owned_tags = tags.filter(taggeditem__user=self.request.user.merchant)
-                tags = (unowned_tags | owned_tags).distinct()
-            else:
-                tags = unowned_tags
-
-            return tags
+        merchant_id = self.request.user.merchant.id if self.request.user.is_authenticated else None
+        return Tag.objects.filter(name__in=get_tag_index().tags(item_id, merchant_id)).order_by('name')
 
     def post(self, request: Request, version, item_id):
         """
@@ -229,6 +370,61 @@ class ItemTags(generics.ListAPIView):
             return Response({"detail": "Include the list of tags."}, status.HTTP_400_BAD_REQUEST)
 
 
+class BulkItemTags(generics.GenericAPIView):
+    """
+    Adds or removes many of your own tags at once.
+
+    ### **Body**
+    A list of up to 1000 items and tags: *[{"item": 2, "tag": "rune"}, {"item": 6, "tag": "cannon"}]*
+
+    Each pair is returned with its result. When tagging, that is *created*, *exists* or *missing*
+    if there is no such item. When untagging, it is *deleted* or *missing* if you had no such tag.
+    """
+    serializer_class = TagPairSerializer
+    authentication_classes = (SessionAuthentication, TokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+
+    def get_pairs(self, request: Request) -> List[Tuple[int, str]]:
+        """
+        Gets the item id and tag name pairs from the body, with the names lower cased as tags are searched.
+        """
+        serializer = self.get_serializer(data=request.data, many=True, max_length=BULK_TAG_LIMIT)
+        serializer.is_valid(raise_exception=True)
+        return [(pair['item'], pair['tag'].lower()) for pair in serializer.validated_data]
+
+    @staticmethod
+    def results(pairs: List[Tuple[int, str]], results: List[str]) -> Response:
+        """
+        Responds with each pair and its result.
+        """
+        return Response([{'item': item_id, 'tag': name, 'result': result}
+                         for (item_id, name), result in zip(pairs, results)])
+
+    def post(self, request: Request, version):
+        """
+        Tags every item with its tag.
+        :param request: The request object.
+        :param version: The API version number.
+        :return: The result of each pair.
+        """
+        pairs = self.get_pairs(request)
+        results = TaggedItem.objects.tag_items(pairs, request.user.merchant)
+        bump_tag_version()
+        return self.results(pairs, results)
+
+    def delete(self, request: Request, version):
+        """
+        Removes each tag from its item.
+        :param request: The request object.
+        :param version: The API version number.
+        :return: The result of each pair.
+        """
+        pairs = self.get_pairs(request)
+        results = TaggedItem.objects.untag_items(pairs, request.user.merchant)
+        bump_tag_version()
+        return self.results(pairs, results)
+
+
 class ItemFlips(generics.ListAPIView):
     """
     Gets the flips for a given item.
@@ -248,9 +444,197 @@ class ItemFlips(generics.ListAPIView):
 class PriceForItemList(generics.ListAPIView):
     """
     Gets the most recent price logs for each item.
+
+    ### **Query Strings**
+    This endpoint supports a set of querystring parameters:
+
+    - **snapshot:** *?snapshot=[id]*    - Gets the price logs from a given snapshot instead of the latest one.
+    - **cursor:** *?cursor=[cursor]*    - Gets the page of prices a next or previous link points to.
+    - **page_size:** *?page_size=[int]* - Pages the prices, newest first, with this many on each page, up to 5000.
+                                          Without a page size or cursor, every price is returned.
     """
-    queryset = Price.objects.most_recent_for_each_item()
-    serializer_class = PriceSerializer
+    pagination_class = KeysetPagination
+
+    def get_queryset(self):
+        snapshot = self.request.query_params.get('snapshot')
+        if snapshot is None:
+            return LatestPrice.objects.all()
+
+        if not snapshot.isdigit():
+            raise ParseError("Invalid Snapshot")
+
+        return Price.objects.in_snapshot(int(snapshot))
+
+    def get_serializer_class(self):
+        return PriceSerializer if self.request.query_params.get('snapshot') is not None else LatestPriceSerializer
+
+
+class PriceHistory(generics.GenericAPIView):
+    """
+    Gets the price history of several items in one request, as a list of
+    timestamps and a list of values for each item and price field.
+
+    ### **Query Strings**
+    This endpoint supports a set of querystring parameters:
+
+    - **ids:** *?ids=2,6,8*                      - The items to get the history of, up to 100. Required.
+    - **after:** *?after=[ISO8601]*              - Only shows prices after a given date, defaults to a day ago.
+    - **before:** *?before=[ISO8601]*            - Only shows prices before a given date.
+    - **fields:** *?fields=buy_price,sell_price* - The price fields to include, defaults to all of them.
+
+    At most 100000 prices are returned, so a request for more is refused and should ask for fewer ids or a
+    shorter range.
+    """
+    serializer_class = PriceHistorySerializer
+
+    MAX_IDS = 100
+    MAX_ROWS = 100000
+    # ids are bound as 64 bit integers
+    MAX_ITEM_ID = 2 ** 63 - 1
+    FIELDS = tuple(field for field in BasePrice.PRICE_FIELDS if field != 'date')
+
+    def get_item_ids(self) -> List[int]:
+        """
+        :return: The ids of the requested items, in order.
+        """
+        ids = self.request.query_params.get('ids')
+        if not ids or not all(re.fullmatch('[0-9]+', item_id) for item_id in ids.split(',')):
+            raise ParseError("Invalid Ids")
+
+        item_ids = sorted({int(item_id) for item_id in ids.split(',')})
+        if item_ids[-1] > self.MAX_ITEM_ID:
+            raise ParseError("Invalid Ids")
+        if len(item_ids) > self.MAX_IDS:
+            raise ParseError(f"Too Many Ids, the maximum is {self.MAX_IDS}")
+        return item_ids
+
+    def get_fields(self) -> Tuple[str, ...]:
+        """
+        :return: The requested price fields.
+        """
+        fields = self.request.query_params.get('fields')
+        fields = tuple(fields.split(',')) if fields else self.FIELDS
+        if not set(fields) <= set(self.FIELDS):
+            raise ParseError("Invalid Fields")
+        return fields
+
+    def get_queryset(self):
+        after = self.request.query_params.get('after')
+        try:
+            after = isoparse(after) if after is not None else datetime.now(timezone.utc) - timedelta(days=1)
+        except ValueError:
+            raise ParseError("Invalid After Date")
+
+        queryset = Price.objects.filter(item__in=self.get_item_ids(), user=None, date__gt=after)
+
+        before = self.request.query_params.get('before')
+        if before is not None:
+            try:
+                queryset = queryset.filter(date__lt=isoparse(before))
+            except ValueError:
+                raise ParseError("Invalid Before Date")
+
+        return queryset.values_list('item', 'date', *self.get_fields())
+
+    def get(self, request, version):
+        """
+        Gets the price history of the requested items.
+        :param request: The request object.
+        :param version: The api version.
+        :return: The timestamps and the values of each item and field.
+        """
+        rows = list(self.get_queryset()[:self.MAX_ROWS + 1])
+        if len(rows) > self.MAX_ROWS:
+            raise ParseError(f"Too Many Prices, the maximum is {self.MAX_ROWS}")
+
+        context = dict(self.get_serializer_context(), item_ids=self.get_item_ids(), fields=self.get_fields())
+        return Response(self.get_serializer(rows, context=context).data)
+
+
+class AnalyticsList(generics.GenericAPIView):
+    """
+    Gets the latest market indicators for every item: the moving averages and
+    volatility of the buy price, the margin and its trend, and the volume z-score.
+    They are recomputed once per price snapshot.
+
+    ### **Query Strings**
+    This endpoint supports a set of querystring parameters:
+
+    - **ids:** *?ids=2,6,8* - Only shows the given items.
+    """
+    serializer_class = Serializer
+
+    def get(self, request, version):
+        """
+        Gets the indicators of every item.
+        :param request: The request object.
+        :param version: The api version.
+        :return: A list of the latest indicators of each item.
+        """
+        summary = get_analytics().summary()
+
+        ids = request.query_params.get('ids')
+        if ids:
+            if not all(item_id.isdigit() for item_id in ids.split(',')):
+                raise ParseError("Invalid Ids")
+            item_ids = {int(item_id) for item_id in ids.split(',')}
+            summary = [row for row in summary if row['item'] in item_ids]
+
+        return Response(summary)
+
+
+class ItemAnalytics(generics.GenericAPIView):
+    """
+    Gets the market indicators of a single item, with the full series
+    of each one over the last week of snapshots.
+    """
+    serializer_class = Serializer
+
+    def get(self, request, version, item_id):
+        """
+        Gets the indicators of an item.
+        :param request: The request object.
+        :param version: The api version.
+        :param item_id: The item id.
+        :return: The latest indicators, the timestamps and the series,
+                 404 if the item has no recent prices.
+        """
+        try:
+            return Response(get_analytics().for_item(item_id))
+        except KeyError:
+            raise Http404("Item has no recent prices.")
+
+
+class ScreenerList(generics.ListAPIView):
+    """
+    Gets the best items to flip right now, from rankings that are built after every price ingest.
+
+    ### **Query Strings**
+    This endpoint supports a set of querystring parameters:
+
+    - **formula:** *?formula=[profit|traded_profit|margin|roi]* - How to rank the items, defaults to profit, the
+                                                                 margin multiplied by the buy limit. traded_profit
+                                                                 caps the buy limit at the volume.
+    - **preset:** *?preset=[all|f2p|members|liquid]*            - Which items to rank, defaults to all. liquid only
+                                                                 ranks items with a volume of at least 1000.
+    - **limit:** *?limit=[int]*                                 - The number of items to get, up to 250.
+    """
+    serializer_class = ScreenerEntrySerializer
+
+    def get_queryset(self):
+        formula = self.request.query_params.get('formula', 'profit')
+        if formula not in SCREENER_FORMULAS:
+            raise ParseError("Invalid Formula")
+
+        preset = self.request.query_params.get('preset', 'all')
+        if preset not in SCREENER_PRESETS:
+            raise ParseError("Invalid Preset")
+
+        limit = self.request.query_params.get('limit', '50')
+        if not limit.isdigit():
+            raise ParseError("Invalid Limit")
+
+        return ScreenerEntry.objects.ranking(formula, preset)[:min(int(limit), SCREENER_SIZE)]
 
 
 class FavoriteList(generics.ListAPIView):
@@ -326,16 +710,24 @@ class ItemFavorite(generics.GenericAPIView, mixins.DestroyModelMixin):
 class TagList(generics.ListAPIView):
     """
     Gets a list of all the tags.
+
+    ### **Query Strings**
+    This endpoint supports a set of querystring parameters:
+
+    - **counts:** *?counts* - Additionally gets the number of items with each tag.
     """
     authentication_classes = (SessionAuthentication, TokenAuthentication,)
-    serializer_class = TagSerializer
 
     def get_queryset(self):
-        tagged_items = TaggedItem.objects.all().filter(user=None)
-        if self.request.user.is_authenticated:
-            tagged_items |= TaggedItem.objects.all().filter(user=self.request.user.merchant)
+        counts = TagCount.objects.visible_to(self.request.user.merchant if self.request.user.is_authenticated else None)
 
-        return Tag.objects.filter(id__in=tagged_items.values('tag_id'))
+        if self.request.query_params.get('counts') is not None:
+            return counts.values('tag__name').annotate(items=Sum('items')).order_by('tag__name')
+
+        return Tag.objects.filter(id__in=counts.values('tag_id')).order_by('name')
+
+    def get_serializer_class(self):
+        return TagCountSerializer if self.request.query_params.get('counts') is not None else TagSerializer
 
 
 class TagItems(generics.ListAPIView):
@@ -348,17 +740,9 @@ class TagItems(generics.ListAPIView):
     lookup_field = 'tag_name'
 
     def get_queryset(self):
-
-        items = Item.objects.all()
-        unowned_tagged = items.filter(taggeditem__user=None)
-
-        if self.request.user.is_authenticated:
-            owned_tagged = items.filter(tags__taggeditem__user=self.request.user.merchant)
-            items = (unowned_tagged | owned_tagged).distinct()
-        else:
-            items = unowned_tagged
-
-        return items.filter(tags__name=self.kwargs[self.lookup_field])
+        merchant_id = self.request.user.merchant.id if self.request.user.is_authenticated else None
+        item_ids = get_tag_index().items(self.kwargs[self.lookup_field], merchant_id)
+        return Item.objects.filter(item_id__in=item_ids).order_by('item_id')
 
 
 class FlipList(generics.ListAPIView):
@@ -125,6 +125,34 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/2.0/howto/static-files/
 STATIC_URL = '/static/'
 
+# Scraper http cache, with the seconds each source stays fresh before revalidating.
+SCRAPE_CACHE_DIR = os.path.join(BASE_DIR, 'cache')
+SCRAPE_CACHE_TTLS = {
+    'summary': 60 * 60,
+    'wiki': 24 * 60 * 60,
+    'icon': 7 * 24 * 60 * 60,
+}
+
+# Days to keep each resolution of the price history for, None keeps it forever.
+PRICE_RETENTION = {
+    'raw': 30,
+    'hourly': 365,
+    'daily': None,
+    'weekly': None,
+}
+
+# Folder for the memory mapped columnar copy of the price history, None disables it.
+PRICE_STORE_DIR = None
+
+# File the ingest task saves the market analytics of each snapshot to, so the web processes load rather than compute them.
+ANALYTICS_FILE = os.path.join(BASE_DIR, 'cache', 'analytics.npz')
+
+# File that is replaced whenever the items change, so each process knows to reload its item catalog.
+CATALOG_VERSION_FILE = os.path.join(BASE_DIR, 'cache', 'catalog.version')
+
+# File that is replaced whenever items are tagged or untagged, so each process knows to reload its tag index.
+TAG_INDEX_VERSION_FILE = os.path.join(BASE_DIR, 'cache', 'tags.version')
+
 # settings.py
 HUEY = {
     'name': DATABASES['default']['NAME'],  # Use db name for huey.
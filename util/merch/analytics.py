@@ -0,0 +1,313 @@
+import io
+import os
+import warnings
+from threading import Lock
+from typing import Dict, List
+
+import numpy as np
+from django.conf import settings
+
+from merchapi.models import Price, PriceSnapshot
+from util.merch.cache import atomic_write
+from util.merch.columnar import PriceHistory, STORE_FIELDS, get_price_store
+
+ANALYTICS_HISTORY = 7 * 24
+SMA_WINDOW = 24
+EMA_SPAN = 24
+VOLATILITY_WINDOW = 24
+TREND_WINDOW = 24
+ZSCORE_WINDOW = 7 * 24
+
+_analytics: 'MarketAnalytics' or None = None
+_analytics_lock = Lock()
+
+
+def forward_fill(values: np.ndarray) -> np.ndarray:
+    """
+    Fills the gaps in each column with the last value before them.
+    :param values: A 2d array of times by items, NaN where there is no value.
+    :return: A new array with the gaps filled, leading gaps stay NaN.
+    """
+    rows = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return values[rows, np.arange(values.shape[1])]
+
+
+def rolling_sum(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    Sums each column over a trailing window.
+    :return: An array the same shape as values, NaN wherever the window is not full of values.
+    """
+    sums = np.full(values.shape, np.nan)
+    if len(values) >= window:
+        present = ~np.isnan(values)
+        start = np.zeros((1, values.shape[1]))
+        totals = np.cumsum(np.vstack([start, np.where(present, values, 0)]), axis=0)
+        counts = np.cumsum(np.vstack([start, present]), axis=0)
+        sums[window - 1:] = np.where(counts[window:] - counts[:-window] == window,
+                                     totals[window:] - totals[:-window], np.nan)
+    return sums
+
+
+def sma(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    The simple moving average of each column over a trailing window.
+    """
+    return rolling_sum(values, window) / window
+
+
+def ema(values: np.ndarray, span: int) -> np.ndarray:
+    """
+    The exponential moving average of each column, starting from its first value.
+    The loop is over time only, every item is updated at once.
+    """
+    alpha = 2 / (span + 1)
+    averages = np.full(values.shape, np.nan)
+    state = np.full(values.shape[1], np.nan)
+
+    for row, current in enumerate(values):
+        state = np.where(np.isnan(state), current, np.where(np.isnan(current), state,
+                                                            alpha * current + (1 - alpha) * state))
+        averages[row] = state
+
+    return averages
+
+
+def rolling_std(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    The population standard deviation of each column over a trailing window.
+    """
+    mean = rolling_sum(values, window) / window
+    mean_square = rolling_sum(values ** 2, window) / window
+    return np.sqrt(np.clip(mean_square - mean ** 2, 0, None))
+
+
+def volatility(prices: np.ndarray, window: int) -> np.ndarray:
+    """
+    The standard deviation of the log returns of each column over a trailing window.
+    """
+    if not len(prices):
+        return np.full(prices.shape, np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.diff(np.log(np.where(prices > 0, prices, np.nan)), axis=0)
+    return np.vstack([np.full((1, prices.shape[1]), np.nan), rolling_std(returns, window)])
+
+
+def trend(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    The least squares slope of each column over its last window.
+    :return: One slope for each column, NaN if the window has any gaps.
+    """
+    if len(values) < window:
+        return np.full(values.shape[1], np.nan)
+
+    recent = values[-window:]
+    x = np.arange(window) - (window - 1) / 2
+    return (x[:, None] * (recent - recent.mean(axis=0))).sum(axis=0) / (x ** 2).sum()
+
+
+def zscore(values: np.ndarray, window: int) -> np.ndarray:
+    """
+    How many standard deviations the last value of each column is from the mean of its last window.
+    """
+    recent = values[-window:]
+    if not len(recent):
+        return np.full(values.shape[1], np.nan)
+
+    with warnings.catch_warnings(), np.errstate(divide='ignore', invalid='ignore'):
+        warnings.simplefilter('ignore', RuntimeWarning)
+        std = np.nanstd(recent, axis=0)
+        return np.where(std > 0, (recent[-1] - np.nanmean(recent, axis=0)) / std, np.nan)
+
+
+def load_history(snapshots: int = ANALYTICS_HISTORY) -> PriceHistory:
+    """
+    Loads the most recent snapshots of every item into arrays, from the
+    columnar price store if it is enabled and the database otherwise.
+    :param snapshots: The number of snapshots to load.
+    :return: The price history of every item.
+    """
+    store = get_price_store()
+    if store is not None:
+        history = store.open()
+        return PriceHistory(history.item_ids, history.dates[-snapshots:], history.snapshots[-snapshots:],
+                            {name: values[-snapshots:] for name, values in history.fields.items()})
+
+    snapshot_ids = list(PriceSnapshot.objects.order_by('-id').values_list('id', flat=True)[:snapshots])[::-1]
+    rows = list(Price.objects.filter(snapshot__in=snapshot_ids, user=None)
+                .values_list('snapshot', 'snapshot__date', 'item', *STORE_FIELDS))
+
+    item_ids = np.array(sorted({row[2] for row in rows}), dtype=np.int64)
+    dates = dict((row[0], row[1]) for row in rows)
+    snapshot_ids = [snapshot_id for snapshot_id in snapshot_ids if snapshot_id in dates]
+
+    row_of = {snapshot_id: row for row, snapshot_id in enumerate(snapshot_ids)}
+    column_of = {item_id: column for column, item_id in enumerate(item_ids.tolist())}
+    values = np.full((len(STORE_FIELDS), len(snapshot_ids), len(item_ids)), np.nan)
+    if rows:
+        positions = np.array([(row_of[row[0]], column_of[row[2]]) for row in rows])
+        values[:, positions[:, 0], positions[:, 1]] = np.array([row[3:] for row in rows], dtype=float).T
+
+    return PriceHistory(
+        item_ids,
+        np.array([int(dates[snapshot_id].timestamp()) for snapshot_id in snapshot_ids], dtype='datetime64[s]'),
+        np.array(snapshot_ids, dtype=np.int64),
+        dict(zip(STORE_FIELDS, values)),
+    )
+
+
+class MarketAnalytics:
+    """
+    Indicators for every item at once, computed from a single price history.
+    """
+
+    def __init__(self, item_ids: np.ndarray, dates: np.ndarray, series: Dict[str, np.ndarray],
+                 latest: Dict[str, np.ndarray], snapshot: int = None):
+        """
+        :param item_ids: The item id of each column.
+        :param dates: The date of each row.
+        :param series: A 2d array of rows by columns for each indicator that has a full series.
+        :param latest: The latest value of every indicator for each item.
+        :param snapshot: The id of the snapshot the indicators go up to.
+        """
+        self.snapshot = snapshot
+        self.item_ids = item_ids
+        self.dates = dates
+        self.series = series
+        self.latest = latest
+        self._columns = {item_id: column for column, item_id in enumerate(self.item_ids.tolist())}
+        self._summary = [self._row(column) for column in range(len(self.item_ids))]
+
+    @classmethod
+    def from_history(cls, history: PriceHistory, snapshot: int = None) -> 'MarketAnalytics':
+        """
+        Computes the indicators from a price history.
+        :param history: The recent price history of every item.
+        :param snapshot: The id of the snapshot the history goes up to.
+        :return: The market analytics.
+        """
+        buy = forward_fill(np.asarray(history.fields['buy_price'], dtype=float))
+        sell = forward_fill(np.asarray(history.fields['sell_price'], dtype=float))
+        volume = np.asarray(history.fields['buy_volume'], dtype=float) + \
+            np.asarray(history.fields['sell_volume'], dtype=float)
+        margin = sell - buy
+
+        series = {
+            'buy_price': buy,
+            'sell_price': sell,
+            'margin': margin,
+            'sma': sma(buy, SMA_WINDOW),
+            'ema': ema(buy, EMA_SPAN),
+            'volatility': volatility(buy, VOLATILITY_WINDOW),
+        }
+
+        latest = {name: values[-1] if len(values) else np.full(len(history.item_ids), np.nan)
+                  for name, values in series.items()}
+        latest.update({
+            'margin_trend': trend(margin, TREND_WINDOW),
+            'volume_zscore': zscore(volume, ZSCORE_WINDOW),
+        })
+        return cls(history.item_ids, history.dates, series, latest, snapshot)
+
+    def save(self, path: str) -> None:
+        """
+        Atomically saves the indicators, so other processes can load them rather than compute them.
+        :param path: The file to save them to.
+        """
+        data = io.BytesIO()
+        np.savez(data, snapshot=np.array(-1 if self.snapshot is None else self.snapshot), item_ids=self.item_ids,
+                 dates=self.dates, **{f'series_{name}': values for name, values in self.series.items()},
+                 **{f'latest_{name}': values for name, values in self.latest.items()})
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        atomic_write(path, data.getvalue())
+
+    @classmethod
+    def load(cls, path: str) -> 'MarketAnalytics' or None:
+        """
+        Loads the indicators saved by another process.
+        :param path: The file they were saved to.
+        :return: The market analytics, or None if none have been saved.
+        """
+        try:
+            with np.load(path) as arrays:
+                snapshot = int(arrays['snapshot'])
+                return cls(arrays['item_ids'], arrays['dates'],
+                           {name[7:]: arrays[name] for name in arrays.files if name.startswith('series_')},
+                           {name[7:]: arrays[name] for name in arrays.files if name.startswith('latest_')},
+                           None if snapshot == -1 else snapshot)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _row(self, column: int) -> Dict:
+        row = {'item': int(self.item_ids[column])}
+        for name, values in self.latest.items():
+            value = values[column]
+            row[name] = None if np.isnan(value) else float(value)
+        return row
+
+    def summary(self) -> List[Dict]:
+        """
+        :return: The latest value of each indicator for every item.
+        """
+        return self._summary
+
+    def for_item(self, item_id: int) -> Dict:
+        """
+        Gets the full indicator series of a single item.
+        :param item_id: The id of the item.
+        :return: The latest values, the timestamps and a value for each timestamp for each series.
+        """
+        column = self._columns[item_id]
+        return {
+            'latest': self._summary[column],
+            'timestamps': self.dates.astype('int64').tolist(),
+            'series': {name: [None if np.isnan(value) else float(value) for value in values[:, column]]
+                       for name, values in self.series.items()},
+        }
+
+
+def get_latest_snapshot() -> int or None:
+    """
+    :return: The id of the latest snapshot, or None if there are none.
+    """
+    return PriceSnapshot.objects.order_by('-id').values_list('id', flat=True).first()
+
+
+def warm_analytics() -> MarketAnalytics:
+    """
+    Computes the analytics for the latest snapshot and saves them to the
+    shared analytics file, so the web processes only have to load them.
+    Run by the ingest task once each snapshot is saved.
+    :return: The market analytics.
+    """
+    global _analytics
+
+    latest = get_latest_snapshot()
+    analytics = MarketAnalytics.from_history(load_history(), latest)
+    analytics.save(settings.ANALYTICS_FILE)
+
+    with _analytics_lock:
+        _analytics = analytics
+    return analytics
+
+
+def get_analytics() -> MarketAnalytics:
+    """
+    Gets the analytics for the latest snapshot. They are loaded from the shared analytics
+    file when a new snapshot arrives, and only computed here if they have not been warmed.
+    :return: The market analytics.
+    """
+    global _analytics
+
+    latest = get_latest_snapshot()
+
+    with _analytics_lock:
+        if _analytics is None or _analytics.snapshot != latest:
+            saved = MarketAnalytics.load(settings.ANALYTICS_FILE)
+            if saved is not None and saved.snapshot == latest:
+                _analytics = saved
+            else:
+                _analytics = MarketAnalytics.from_history(load_history(), latest)
+        return _analytics
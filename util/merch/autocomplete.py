@@ -0,0 +1,109 @@
+import heapq
+import time
+from bisect import bisect_left
+from threading import Lock
+from typing import Iterable, List, Dict, Tuple
+
+from django.db.models import F
+from django.db.models.functions import Coalesce
+
+from merchapi.models import Item
+from merchapi.models.item import get_search_terms
+from util.merch.catalog import get_catalog_version
+
+# the most completions a single query can ask for
+AUTOCOMPLETE_MAX_LIMIT = 25
+
+# prefixes up to this long match too many names to rank on each request, so their completions are ranked up front
+AUTOCOMPLETE_CACHED_PREFIX = 3
+
+# how long the index is used for before it is rebuilt to pick up new volumes, in seconds
+AUTOCOMPLETE_MAX_AGE = 10 * 60
+
+_autocomplete: 'Autocomplete' or None = None
+_autocomplete_lock = Lock()
+
+
+class Autocomplete:
+    """
+    Completes item names from a sorted array of every word onwards of every name,
+    so "plate" completes "Rune platebody". A prefix is found with two binary searches,
+    and the matching names are ranked by their popularity.
+    """
+
+    def __init__(self, items: Iterable[Tuple[int, str, int]], version: Tuple[int, int] or None = None):
+        """
+        :param items: The id, name and popularity of each item.
+        :param version: The catalog version the items were loaded at.
+        """
+        self.version = version
+        self.built = time.monotonic()
+        self._items = {}
+        keys = []
+
+        for item_id, name, popularity in items:
+            # more popular items first, then shorter names
+            self._items[item_id] = ((-popularity, len(name), item_id), {'item_id': item_id, 'name': name})
+            words = get_search_terms(name)
+            keys.extend((' '.join(words[start:]), item_id) for start in range(len(words)))
+
+        keys.sort()
+        self._keys = [key for key, _ in keys]
+        self._key_items = [item_id for _, item_id in keys]
+
+        self._cached = {}
+        prefixes = {key[:length] for key in self._keys for length in range(1, AUTOCOMPLETE_CACHED_PREFIX + 1)}
+        for prefix in prefixes:
+            self._cached[prefix] = self._rank(prefix, AUTOCOMPLETE_MAX_LIMIT)
+
+    def __len__(self):
+        return len(self._items)
+
+    def _rank(self, prefix: str, limit: int) -> List[Dict]:
+        start = bisect_left(self._keys, prefix)
+        end = bisect_left(self._keys, prefix + '\uffff', start)
+        item_ids = set(self._key_items[start:end])
+        return [item for _, item in heapq.nsmallest(limit, (self._items[item_id] for item_id in item_ids))]
+
+    def complete(self, query: str, limit: int = 10) -> List[Dict]:
+        """
+        Gets the most popular items with a word that starts with the query.
+        :param query: The start of the name, ignoring case and diacritics.
+        :param limit: The most items to get.
+        :return: The id and name of each item, most popular first.
+        """
+        prefix = ' '.join(get_search_terms(query))
+        if not prefix:
+            return []
+
+        limit = min(limit, AUTOCOMPLETE_MAX_LIMIT)
+        if prefix in self._cached:
+            return self._cached[prefix][:limit]
+        if len(prefix) <= AUTOCOMPLETE_CACHED_PREFIX:
+            return []
+        return self._rank(prefix, limit)
+
+
+def build_autocomplete(version: Tuple[int, int] or None = None) -> Autocomplete:
+    """
+    Builds the autocomplete index from every item, ranked by the volume of its latest price.
+    :param version: The current catalog version.
+    """
+    return Autocomplete(Item.objects.annotate(popularity=Coalesce(F('latest_price__volume'), 0))
+                        .values_list('item_id', 'name', 'popularity'), version)
+
+
+def get_autocomplete() -> Autocomplete:
+    """
+    Gets this process' autocomplete index, building it on first use, when
+    items are added and once it is too old.
+    :return: The autocomplete index.
+    """
+    global _autocomplete
+
+    version = get_catalog_version()
+    with _autocomplete_lock:
+        if _autocomplete is None or _autocomplete.version != version or \
+                time.monotonic() - _autocomplete.built > AUTOCOMPLETE_MAX_AGE:
+            _autocomplete = build_autocomplete(version)
+        return _autocomplete
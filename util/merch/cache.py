@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from threading import Lock
+from typing import Dict
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from rest_framework import status
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """
+    Replaces a file by writing to a temporary file in the same folder
+    and renaming it, so that readers never see a partial file.
+    :param path: The file to write.
+    :param data: The contents of the file.
+    """
+    descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+class HttpCache:
+    """
+    A disk backed cache for GET requests to the scraper sources.
+
+    Responses are kept for a time-to-live that depends on their source.
+    Once that expires the stored ETag and Last-Modified headers are used
+    to revalidate the entry, so an unchanged resource costs a 304 rather
+    than the full payload.
+    """
+
+    HIT = 'hit'
+    REVALIDATED = 'revalidated'
+    MISS = 'miss'
+
+    def __init__(self, directory: str, ttls: Dict[str, float], session: requests.Session):
+        """
+        :param directory: The folder to store the cached responses in.
+        :param ttls: The number of seconds a response stays fresh, keyed by source.
+        :param session: The session to make requests with.
+        """
+        self.directory = directory
+        self.ttls = ttls
+        self.session = session
+        self.stats: Dict[str, Counter] = {}
+        self._lock = Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, url: str, source: str) -> requests.Response:
+        """
+        Gets a url, serving it from the cache where possible.
+        :param url: The url to get.
+        :param source: The name of the source, used to pick the ttl and count the result.
+        :return: The response, either fresh from the source or rebuilt from the cache.
+        """
+        path = self._path(url)
+        entry = self._load(path)
+
+        if entry is not None and time.time() - entry['fetched'] < self.ttls.get(source, 0):
+            self._count(source, self.HIT)
+            return self._response(url, entry, path)
+
+        headers = {}
+        if entry is not None:
+            if entry['etag'] is not None:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified'] is not None:
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = self.session.get(url, headers=headers)
+
+        if entry is not None and response.status_code == status.HTTP_304_NOT_MODIFIED:
+            self._count(source, self.REVALIDATED)
+            entry['fetched'] = time.time()
+            atomic_write(path + '.json', json.dumps(entry).encode())
+            return self._response(url, entry, path)
+
+        self._count(source, self.MISS)
+        if response.status_code == status.HTTP_200_OK:
+            self._store(path, url, response)
+
+        return response
+
+    def clear_stats(self) -> None:
+        """
+        Resets the hit and miss counters.
+        """
+        with self._lock:
+            self.stats = {}
+
+    def _count(self, source: str, result: str) -> None:
+        with self._lock:
+            self.stats.setdefault(source, Counter())[result] += 1
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest())
+
+    @staticmethod
+    def _load(path: str) -> Dict or None:
+        """
+        Loads the metadata for a cache entry, or None if it is missing or incomplete.
+        """
+        try:
+            with open(path + '.json') as meta_file:
+                entry = json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+        return entry if os.path.exists(path + '.body') else None
+
+    def _store(self, path: str, url: str, response: requests.Response) -> None:
+        """
+        Saves a response, writing the body before the metadata so that
+        a partially written entry is never loaded.
+        """
+        atomic_write(path + '.body', response.content)
+        atomic_write(path + '.json', json.dumps({
+            'url': url,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'content_type': response.headers.get('Content-Type'),
+            'fetched': time.time(),
+        }).encode())
+
+    @staticmethod
+    def _response(url: str, entry: Dict, path: str) -> requests.Response:
+        """
+        Rebuilds a response from a cache entry.
+        """
+        response = requests.Response()
+        response.url = url
+        response.status_code = status.HTTP_200_OK
+        response.headers = CaseInsensitiveDict({'Content-Type': entry['content_type']} if entry['content_type'] else {})
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+
+        with open(path + '.body', 'rb') as body_file:
+            response._content = body_file.read()
+
+        return response
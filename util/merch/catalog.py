@@ -0,0 +1,87 @@
+from threading import Lock
+from typing import Iterable, Dict, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from merchapi.models import Item
+from merchapi.serializers.base import ItemSerializer
+from util.merch.markers import get_marker_version, bump_marker
+
+_catalog: 'ItemCatalog' or None = None
+_catalog_lock = Lock()
+
+
+def get_catalog_version() -> Tuple[int, int] or None:
+    """
+    Gets the version of the items from the shared marker file.
+    :return: The version, or None if the items have not changed since the marker was removed.
+    """
+    return get_marker_version(settings.CATALOG_VERSION_FILE)
+
+
+def bump_catalog_version() -> None:
+    """
+    Marks the items as changed, so every process reloads its catalog on its next request.
+    """
+    bump_marker(settings.CATALOG_VERSION_FILE)
+
+
+@receiver([post_save, post_delete], sender='merchapi.Item')
+def item_changed(sender, raw=False, **kwargs):
+    """
+    Bumps the catalog version when a single item is edited, such as from the admin.
+    The bump waits for the change to commit, so no process reloads the old items.
+    Fixtures are left alone, and bulk changes bump the version themselves.
+    """
+    if not raw:
+        transaction.on_commit(bump_catalog_version)
+
+
+class ItemCatalog:
+    """
+    An unchanging copy of every item and its serialized form, shared by every request in a process.
+    """
+
+    def __init__(self, items: Iterable[Item], version: Tuple[int, int] or None = None):
+        """
+        :param items: Every item.
+        :param version: The catalog version the items were loaded at.
+        """
+        self.version = version
+        self.items = tuple(items)
+        self.by_id: Dict[int, Item] = {item.item_id: item for item in self.items}
+
+        data = tuple(ItemSerializer(self.items, many=True).data)
+        self._data = {
+            None: data,
+            True: tuple(row for row in data if row['members']),
+            False: tuple(row for row in data if not row['members']),
+        }
+
+    def __len__(self):
+        return len(self.items)
+
+    def serialized(self, members: bool = None) -> Tuple[Dict, ...]:
+        """
+        Gets the serialized items, in order of id.
+        :param members: Only gets members or non members items, or every item if None.
+        :return: The items as serialized by the item serializer.
+        """
+        return self._data[members]
+
+
+def get_catalog() -> ItemCatalog:
+    """
+    Gets this process' item catalog, only reloading it when the catalog version has changed.
+    :return: The item catalog.
+    """
+    global _catalog
+
+    version = get_catalog_version()
+    with _catalog_lock:
+        if _catalog is None or _catalog.version != version:
+            _catalog = ItemCatalog(Item.objects.order_by('item_id'), version)
+        return _catalog
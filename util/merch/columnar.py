@@ -0,0 +1,256 @@
+import json
+import os
+import re
+from datetime import datetime
+from itertools import groupby
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from merchapi.models import Price, PriceSnapshot, BasePrice
+from util.merch.cache import atomic_write
+
+STORE_META = "meta.json"
+STORE_FIELDS = tuple(field for field in BasePrice.PRICE_FIELDS if field != 'date')
+STORE_MIN_CAPACITY = 1024
+STORE_BATCH_SIZE = 500
+STORE_GENERATION_FILE = re.compile(r'^(\w+?)(?:\.(\d+))?\.bin$')
+
+# a snapshot as stored: its id, its date and a tuple of STORE_FIELDS for each item id
+StoredSnapshot = Tuple[int, datetime, Dict[int, tuple]]
+
+_store: 'PriceStore' or None = None
+
+
+class PriceHistory:
+    """
+    A read only view of the price store as it was when it was opened. The
+    arrays are memory mapped, so slicing them does not read or copy anything
+    until the values are used.
+    """
+
+    def __init__(self, item_ids: np.ndarray, dates: np.ndarray, snapshots: np.ndarray, fields: Dict[str, np.ndarray]):
+        """
+        :param item_ids: The item id of each column.
+        :param dates: The date of each row.
+        :param snapshots: The snapshot id of each row.
+        :param fields: A 2d array of rows by columns for each price field.
+        """
+        self.item_ids = item_ids
+        self.dates = dates
+        self.snapshots = snapshots
+        self.fields = fields
+        self._columns = {item_id: column for column, item_id in enumerate(item_ids.tolist())}
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def for_item(self, item_id: int) -> Dict[str, np.ndarray]:
+        """
+        Slices the history of a single item out of the store without copying it.
+        :param item_id: The id of the item.
+        :return: A value for each snapshot for each price field, NaN where the item had no price.
+        """
+        column = self._columns[item_id]
+        return {name: values[:, column] for name, values in self.fields.items()}
+
+
+class PriceStore:
+    """
+    An append only, column oriented copy of the scraped price history, kept in
+    a folder of raw little endian arrays so readers can memory map it.
+
+    Each price field is a matrix with a row for every snapshot and a column for
+    every item, stored as floats so that missing prices are NaN. Columns are
+    allocated in blocks, and the files are only rewritten when a new item needs
+    more columns than are left. Rows are written before the metadata that counts
+    them, so readers never see a partial snapshot. Wider files are written as a
+    new generation next to the old one and the metadata switches to them in one
+    write, so a reader or a crash never pairs a layout with the wrong shape. The
+    previous generation is kept until the next resize for readers that already
+    loaded the old metadata. There should only be one process appending at a time.
+    """
+
+    def __init__(self, directory: str):
+        """
+        :param directory: The folder to keep the arrays in.
+        """
+        self.directory = directory
+        self._lock = Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+    def open(self) -> PriceHistory:
+        """
+        Memory maps the store as it is now.
+        :return: The price history.
+        """
+        meta = self._load_meta()
+        rows, capacity, item_ids, generation = meta['rows'], meta['capacity'], meta['items'], meta['generation']
+
+        if rows == 0:
+            return PriceHistory(np.array(item_ids, dtype=np.int64), np.empty(0, dtype='datetime64[s]'),
+                                np.empty(0, dtype=np.int64),
+                                {name: np.empty((0, len(item_ids))) for name in STORE_FIELDS})
+
+        return PriceHistory(
+            np.array(item_ids, dtype=np.int64),
+            np.memmap(self._path('dates'), dtype='<i8', mode='r', shape=(rows,)).view('datetime64[s]'),
+            np.memmap(self._path('snapshots'), dtype='<i8', mode='r', shape=(rows,)),
+            {name: np.memmap(self._path(name, generation), dtype='<f8', mode='r',
+                             shape=(rows, capacity))[:, :len(item_ids)]
+             for name in STORE_FIELDS},
+        )
+
+    def last_snapshot(self) -> int:
+        """
+        :return: The id of the most recent snapshot in the store, or 0 if it is empty.
+        """
+        return self._last_snapshot(self._load_meta())
+
+    def append(self, snapshot: PriceSnapshot, prices: Iterable[Price]) -> int:
+        """
+        Appends the prices of a single snapshot.
+        :param snapshot: The saved snapshot.
+        :param prices: The prices in the snapshot.
+        :return: The number of snapshots appended, 0 if it was already stored.
+        """
+        return self.extend([(snapshot.id, snapshot.date, {
+            price.item_id: tuple(getattr(price, field) for field in STORE_FIELDS) for price in prices
+        })])
+
+    def extend(self, snapshots: Iterable[StoredSnapshot]) -> int:
+        """
+        Appends snapshots to the store, skipping any that are not newer than the last one stored.
+        :param snapshots: The snapshots to append, in order.
+        :return: The number of snapshots appended.
+        """
+        with self._lock:
+            meta = self._load_meta()
+            last = self._last_snapshot(meta)
+            snapshots = [snapshot for snapshot in snapshots if snapshot[0] > last]
+            if not snapshots:
+                return 0
+
+            item_ids: List[int] = meta['items']
+            columns = {item_id: column for column, item_id in enumerate(item_ids)}
+            for _, _, prices in snapshots:
+                for item_id in prices:
+                    if item_id not in columns:
+                        columns[item_id] = len(item_ids)
+                        item_ids.append(item_id)
+
+            capacity, generation = meta['capacity'], meta['generation']
+            if len(item_ids) > capacity:
+                new_capacity = max(STORE_MIN_CAPACITY, capacity * 2, len(item_ids))
+                self._resize(meta['rows'], capacity, generation, new_capacity, generation + 1)
+                capacity, generation = new_capacity, generation + 1
+
+            values = np.full((len(STORE_FIELDS), len(snapshots), capacity), np.nan)
+            for row, (_, _, prices) in enumerate(snapshots):
+                for item_id, price in prices.items():
+                    values[:, row, columns[item_id]] = np.array(price, dtype=float)
+
+            rows = meta['rows']
+            self._write(self._path('dates'), rows * 8, np.array([int(date.timestamp()) for _, date, _ in snapshots], dtype='<i8'))
+            self._write(self._path('snapshots'), rows * 8, np.array([snapshot_id for snapshot_id, _, _ in snapshots], dtype='<i8'))
+            for name, field_values in zip(STORE_FIELDS, values):
+                self._write(self._path(name, generation), rows * capacity * 8, field_values.astype('<f8'))
+
+            self._save_meta({"items": item_ids, "capacity": capacity, "rows": rows + len(snapshots),
+                             "generation": generation})
+
+            if generation != meta['generation']:
+                self._remove_generations(generation - 1)
+            return len(snapshots)
+
+    def _path(self, name: str, generation: int = None) -> str:
+        """
+        Gets the file of an array. The price fields have a file for each generation,
+        where the first generation keeps the unnumbered name stores started with.
+        """
+        if not generation:
+            return os.path.join(self.directory, f"{name}.bin")
+        return os.path.join(self.directory, f"{name}.{generation}.bin")
+
+    def _load_meta(self) -> Dict:
+        try:
+            with open(os.path.join(self.directory, STORE_META)) as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            meta = {"items": [], "capacity": 0, "rows": 0}
+
+        meta.setdefault("generation", 0)
+        return meta
+
+    def _save_meta(self, meta: Dict) -> None:
+        atomic_write(os.path.join(self.directory, STORE_META), json.dumps(meta).encode())
+
+    def _last_snapshot(self, meta: Dict) -> int:
+        if meta['rows'] == 0:
+            return 0
+        return int(np.fromfile(self._path('snapshots'), dtype='<i8', count=1, offset=(meta['rows'] - 1) * 8)[0])
+
+    def _write(self, path: str, offset: int, values: np.ndarray) -> None:
+        """
+        Writes values at an offset in an array file, dropping anything after
+        them that was left behind by an append that never finished.
+        """
+        with open(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b') as array_file:
+            array_file.seek(offset)
+            array_file.write(values.tobytes())
+            array_file.truncate()
+
+    def _resize(self, rows: int, capacity: int, generation: int, new_capacity: int, new_generation: int) -> None:
+        """
+        Copies the price fields into the files of a new generation with more
+        columns, filling the new ones with NaN. The old files are left as they are.
+        """
+        for name in STORE_FIELDS:
+            resized = np.full((rows, new_capacity), np.nan, dtype='<f8')
+            if rows:
+                resized[:, :capacity] = np.fromfile(self._path(name, generation), dtype='<f8',
+                                                    count=rows * capacity).reshape(rows, capacity)
+            atomic_write(self._path(name, new_generation), resized.tobytes())
+
+    def _remove_generations(self, keep: int) -> None:
+        """
+        Deletes the price field files of every generation before the one to keep.
+        """
+        for file_name in os.listdir(self.directory):
+            match = STORE_GENERATION_FILE.match(file_name)
+            if match is not None and match.group(1) in STORE_FIELDS and int(match.group(2) or 0) < keep:
+                os.remove(os.path.join(self.directory, file_name))
+
+
+def get_price_store() -> PriceStore or None:
+    """
+    Gets the shared price store, creating it on first use.
+    :return: The store, or None if PRICE_STORE_DIR is not set.
+    """
+    global _store
+
+    if settings.PRICE_STORE_DIR is None:
+        return None
+
+    if _store is None or _store.directory != settings.PRICE_STORE_DIR:
+        _store = PriceStore(settings.PRICE_STORE_DIR)
+
+    return _store
+
+
+def stored_snapshots(after: int = 0) -> Iterator[StoredSnapshot]:
+    """
+    Reads the scraped price history from the database in the form the price store takes.
+    :param after: Only read the snapshots with a larger id.
+    :return: An iterator of snapshots, in order.
+    """
+    prices = Price.objects.filter(user=None, snapshot__gt=after) \
+        .order_by('snapshot', 'item') \
+        .values_list('snapshot', 'snapshot__date', 'item', *STORE_FIELDS) \
+        .iterator()
+
+    for (snapshot_id, date), rows in groupby(prices, key=lambda row: row[:2]):
+        yield snapshot_id, date, {row[2]: row[3:] for row in rows}
@@ -0,0 +1,35 @@
+from datetime import datetime, timezone
+from typing import Iterable
+
+from django.db import transaction
+
+from merchapi.models import Price, PriceSnapshot, LatestPrice, ScreenerEntry
+from util.merch.columnar import get_price_store
+from util.merch.scrape import get_prices_for_items, PRICE_CONCURRENCY
+
+
+def ingest_prices(item_ids: Iterable[int], concurrency: int = PRICE_CONCURRENCY) -> PriceSnapshot:
+    """
+    Fetches the latest prices for a list of items and saves them as a new snapshot.
+    The snapshot, its prices and the updated latest prices are saved in one
+    transaction, along with the screener rankings, so a snapshot is never visible
+    without its prices. Once that commits, the prices are appended to the
+    columnar price store if it is enabled.
+    :param item_ids: The ids of the items to fetch.
+    :param concurrency: The maximum number of api requests in flight at once.
+    :return: The new snapshot.
+    """
+    snapshot = PriceSnapshot(date=datetime.now(timezone.utc))
+    prices = get_prices_for_items(item_ids, concurrency=concurrency, snapshot=snapshot)
+
+    with transaction.atomic():
+        snapshot.save()
+        Price.objects.bulk_create(prices)
+        LatestPrice.objects.update_from(prices)
+        ScreenerEntry.objects.rebuild(snapshot)
+
+        store = get_price_store()
+        if store is not None:
+            transaction.on_commit(lambda: store.append(snapshot, prices))
+
+    return snapshot
@@ -0,0 +1,31 @@
+import os
+import tempfile
+from typing import Tuple
+
+
+def get_marker_version(marker: str) -> Tuple[int, int] or None:
+    """
+    Gets the version of a shared marker file, which is a single stat.
+    :param marker: The path of the marker.
+    :return: The version, or None if the marker has never been bumped.
+    """
+    try:
+        stat = os.stat(marker)
+    except OSError:
+        return None
+
+    # the marker is replaced rather than written to, so the inode changes even if the clock does not
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def bump_marker(marker: str) -> None:
+    """
+    Replaces a shared marker file, so every process sees a new version.
+    :param marker: The path of the marker.
+    """
+    folder = os.path.dirname(marker)
+    os.makedirs(folder, exist_ok=True)
+
+    descriptor, path = tempfile.mkstemp(dir=folder)
+    os.close(descriptor)
+    os.replace(path, marker)
@@ -0,0 +1,107 @@
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Type
+
+from django.db import transaction
+from django.db.models import Min, Max
+
+from merchapi.models import Price, PriceSnapshot, PriceRollup, HourlyPrice, DailyPrice, WeeklyPrice, ROLLUP_MODELS, \
+    get_window, get_window_start
+from util.merch.scrape import group
+
+ROLLUP_BATCH_SIZE = 1000
+
+
+def get_pending_start(model: Type[PriceRollup]) -> datetime or None:
+    """
+    Finds the earliest window with rows that have not been rolled up yet, which
+    are the rows with a newer price than any of the rollups. Prices that are
+    ingested late for an earlier window are found as well as the newest ones.
+    :param model: The rollup model.
+    :return: The start of the window, or None if the rollup is up to date.
+    """
+    rolled_up = model.objects.aggregate(last=Max('max_price_id'))['last']
+    source = model.get_source()
+    if rolled_up is not None:
+        source = source.filter(max_price_id__gt=rolled_up)
+
+    window = source.annotate(window=get_window(1, model.UNIT)).aggregate(first=Min('window'))['first']
+    return None if window is None else get_window_start(int(window), 1, model.UNIT)
+
+
+def roll_up(model: Type[PriceRollup]) -> int:
+    """
+    Aggregates the rows a rollup is built from into the rollup table. Only the
+    windows from the earliest one with rows that have not been rolled up
+    onwards are recomputed, so the last, possibly partial, window is brought
+    up to date every run along with any window that had prices added late.
+    :param model: The rollup model to fill.
+    :return: The number of rollups written.
+    """
+    start = get_pending_start(model)
+    if start is None:
+        return 0
+
+    written = 0
+    windows = model.get_source().filter(date__gte=start).in_intervals(1, model.UNIT).iterator()
+
+    for batch in group(windows, ROLLUP_BATCH_SIZE):
+        model.objects.bulk_create(
+            (model(item_id=window['item'],
+                   date=get_window_start(int(window['window']), 1, model.UNIT),
+                   **{field: window[column] for column, field in PriceRollup.COLUMNS.items()})
+             for window in batch),
+            update_conflicts=True,
+            unique_fields=('item', 'date'),
+            update_fields=tuple(PriceRollup.COLUMNS.values()),
+        )
+        written += len(batch)
+
+    return written
+
+
+def roll_up_all() -> Dict[str, int]:
+    """
+    Brings every rollup up to date, from the finest to the coarsest.
+    :return: The number of rollups written, keyed by rollup.
+    """
+    return {model.__name__: roll_up(model) for model in ROLLUP_MODELS}
+
+
+def prune_prices(retention: Dict[str, int or None], now: datetime = None) -> Dict[str, int]:
+    """
+    Deletes price history that is older than its retention. Rows are only ever
+    deleted once the next coarser rollup has been built from them, so pruning
+    never loses data that has not been summarized somewhere else, including
+    rows that were added late to a window that had already been rolled up.
+    :param retention: The number of days to keep each of the raw, hourly, daily and weekly
+                      prices for, or None to keep them forever.
+    :param now: The time to measure the retention from, defaults to now.
+    :return: The number of rows deleted, keyed by resolution.
+    """
+    now = now or datetime.now(timezone.utc)
+    levels = (
+        ('raw', Price.objects.filter(user=None), HourlyPrice),
+        ('hourly', HourlyPrice.objects.all(), DailyPrice),
+        ('daily', DailyPrice.objects.all(), WeeklyPrice),
+        ('weekly', WeeklyPrice.objects.all(), None),
+    )
+
+    deleted = {}
+    for name, queryset, coarser in levels:
+        days = retention.get(name)
+        if days is None:
+            continue
+
+        cutoff = now - timedelta(days=days)
+        if coarser is not None:
+            rolled_up = coarser.objects.order_by('-date').values_list('date', flat=True).first()
+            if rolled_up is None:
+                continue
+            cutoff = min(cutoff, rolled_up, get_pending_start(coarser) or rolled_up)
+
+        with transaction.atomic():
+            deleted[name] = queryset.filter(date__lt=cutoff).delete()[0]
+            if name == 'raw':
+                PriceSnapshot.objects.filter(date__lt=cutoff, price=None).delete()
+
+    return deleted
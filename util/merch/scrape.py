@@ -1,27 +1,104 @@
-import errno
+import json
 import os
-import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 from itertools import islice, chain
-from typing import List, Tuple, Dict, Iterable
+from threading import Lock
+from typing import List, Tuple, Dict, Iterable, Iterator, Set
 
 import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
 from rest_framework import status
 
-from merchapi.models import MissingItem, Item, Price
+from merchapi.models import MissingItem, Item, Price, PriceSnapshot
+from util.merch.cache import HttpCache, atomic_write
 
 ITEM_SUMMARY_URL = "https://rsbuddy.com/exchange/summary.json"
 RUNESCAPE_WIKI_URL = "http://2007.runescape.wikia.com/wiki/Module:Exchange/%s?action=raw"
 RUNESCAPE_IMAGE_URL = "https://services.runescape.com/m=itemdb_oldschool/obj_big.gif?id="
 OSBUDDY_API = "https://api.rsbuddy.com/grandExchange?a=guidePrice"
 
+# the number of hosts the session keeps a connection pool for
+SESSION_POOL_HOSTS = 10
+
+# the fewest connections kept open to each host, raised to the concurrency of the largest fetch
+SESSION_POOL_SIZE = 16
+
+PRICE_GROUP_SIZE = 100
+PRICE_CONCURRENCY = 8
+PRICE_RETRIES = 3
+PRICE_BACKOFF = 0.5
+
+WIKI_CONCURRENCY = 8
+
+ICON_CONCURRENCY = 8
+ICON_MANIFEST = "manifest.json"
+ICON_MANIFEST_FLUSH = 100
+ICON_MIN_SIZE = 32
+
+_session: requests.Session or None = None
+_session_pool_size = 0
+_session_lock = Lock()
+_cache: HttpCache or None = None
+_cache_lock = Lock()
+
+
+def get_session(pool_size: int = None) -> requests.Session:
+    """
+    Gets the shared keep-alive session used by the scrapers, creating it
+    on first use. The connection pool grows to the largest size asked for,
+    so that every worker of a concurrent fetch can hold a connection open
+    rather than blocking or opening a throwaway one.
+
+    A concurrent fetch sizes the pool once before it starts its workers and
+    hands them the session, as growing the pool replaces its adapters.
+
+    :param pool_size: The number of connections the caller may have open at once,
+                      or None to use the session as it is.
+    :return: The session.
+    """
+    global _session, _session_pool_size
+
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            pool_size = max(pool_size or 0, SESSION_POOL_SIZE)
+
+        if pool_size is not None and pool_size > _session_pool_size:
+            replaced = {_session.get_adapter("http://"), _session.get_adapter("https://")}
+            adapter = HTTPAdapter(pool_connections=SESSION_POOL_HOSTS, pool_maxsize=pool_size)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session_pool_size = pool_size
+
+            for old_adapter in replaced:
+                old_adapter.close()
+
+        return _session
+
+
+def get_cache() -> HttpCache:
+    """
+    Gets the shared http cache for the item, wiki and icon sources,
+    creating it on first use.
+    :return: The cache.
+    """
+    global _cache
+
+    with _cache_lock:
+        if _cache is None:
+            _cache = HttpCache(settings.SCRAPE_CACHE_DIR, settings.SCRAPE_CACHE_TTLS, get_session())
+        return _cache
+
 
 def get_summary() -> List[Dict]:
     """
     Queries the summary url for the latest list of items.
     :return:
     """
-    return requests.get(ITEM_SUMMARY_URL).json().values()
+    return get_cache().get(ITEM_SUMMARY_URL, 'summary').json().values()
 
 
 def get_wiki_item(name: str) -> Dict or None:
@@ -30,7 +107,7 @@ def get_wiki_item(name: str) -> Dict or None:
     :param name: The name of the item to look up.
     :return: A dictionary with the data.
     """
-    wiki_info = requests.get(url=RUNESCAPE_WIKI_URL % name)
+    wiki_info = get_cache().get(RUNESCAPE_WIKI_URL % name, 'wiki')
     return parse_wiki_data(wiki_info.text) if wiki_info.status_code != status.HTTP_404_NOT_FOUND else None
 
 
@@ -63,106 +140,261 @@ def parse_wiki_data(wiki_response: str) -> Dict[str, str or int or float or bool
     return data
 
 
-def download_icons(item_ids: Iterable[int], folder: str) -> None:
+def is_valid_icon(data: bytes) -> bool:
+    """
+    Checks that some data is a complete gif, which starts with
+    a gif signature and ends with the gif trailer byte.
+    :param data: The contents of the icon.
+    :return: Whether the icon is valid.
+    """
+    return len(data) >= ICON_MIN_SIZE and data[:6] in (b"GIF87a", b"GIF89a") and data[-1:] == b"\x3b"
+
+
+def load_icon_manifest(folder: str) -> Dict[str, Dict]:
+    """
+    Loads the manifest of completed downloads for an icon folder.
+    :param folder: The icon folder.
+    :return: The size of each downloaded icon, keyed by item id.
+    """
+    try:
+        with open(os.path.join(folder, ICON_MANIFEST)) as manifest_file:
+            return json.load(manifest_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_icon_manifest(folder: str, manifest: Dict[str, Dict]) -> None:
+    """
+    Atomically saves the manifest of completed downloads for an icon folder.
+    :param folder: The icon folder.
+    :param manifest: The manifest to save.
+    """
+    atomic_write(os.path.join(folder, ICON_MANIFEST), json.dumps(manifest, sort_keys=True).encode())
+
+
+def has_icon(item_id: int, folder: str, manifest: Dict[str, Dict]) -> bool:
+    """
+    Checks whether an icon has been downloaded. Icons in the manifest only
+    need their size checked, while icons missing from it (for example if a
+    run was interrupted before the manifest was saved) are read and
+    validated, then added to the manifest.
+    :param item_id: The id of the item.
+    :param folder: The icon folder.
+    :param manifest: The manifest of completed downloads.
+    :return: Whether a valid icon exists.
+    """
+    path = os.path.join(folder, f"{item_id}.gif")
+
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return False
+
+    if str(item_id) in manifest:
+        return manifest[str(item_id)]["size"] == size
+
+    with open(path, 'rb') as icon_file:
+        if not is_valid_icon(icon_file.read()):
+            return False
+
+    manifest[str(item_id)] = {"size": size}
+    return True
+
+
+def download_icon(item_id: int, folder: str) -> Dict or None:
+    """
+    Downloads and validates a single icon, writing it atomically.
+    :param item_id: The id of the item.
+    :param folder: The folder to download it to.
+    :return: The manifest entry for the icon, or None if the download failed.
+    """
+    try:
+        response = get_cache().get(RUNESCAPE_IMAGE_URL + str(item_id), 'icon')
+    except requests.RequestException:
+        return None
+
+    if response.status_code != status.HTTP_200_OK or not is_valid_icon(response.content):
+        return None
+
+    atomic_write(os.path.join(folder, f"{item_id}.gif"), response.content)
+    return {"size": len(response.content)}
+
+
+def download_icons(item_ids: Iterable[int], folder: str, concurrency: int = ICON_CONCURRENCY) -> List[int]:
     """
-    Downloads the icons for the given list of item ids.
+    Downloads the icons for the given list of item ids, skipping any that
+    are already downloaded. Completed downloads are recorded in a manifest
+    so that an interrupted run can be resumed.
     :param item_ids: The list of item ids to download.
     :param folder: The folder to download them to.
-    :return: None.
+    :param concurrency: The maximum number of downloads in flight at once.
+    :return: The ids of the newly downloaded icons.
     """
-    try:
-        os.makedirs(folder)
-    except OSError as exception:
-        if exception.errno != errno.EEXIST:
-            raise
+    os.makedirs(folder, exist_ok=True)
+    get_session(concurrency)
+
+    manifest = load_icon_manifest(folder)
+    missing = [item_id for item_id in item_ids if not has_icon(item_id, folder, manifest)]
+    downloaded = []
+
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        futures = {executor.submit(download_icon, item_id, folder): item_id for item_id in missing}
+
+        for future in as_completed(futures):
+            entry = future.result()
+            if entry is None:
+                continue
 
-    images = os.listdir(folder)
-    count = 1
+            manifest[str(futures[future])] = entry
+            downloaded.append(futures[future])
 
-    for item_id in (x for x in item_ids if f"{x}.gif" not in images):
-        response = requests.get(RUNESCAPE_IMAGE_URL + str(item_id), stream=True)
-        with open(os.path.join(folder, f"{item_id}.gif"), 'wb') as out_file:
-            shutil.copyfileobj(response.raw, out_file)
-        count += 1
+            if len(downloaded) % ICON_MANIFEST_FLUSH == 0:
+                save_icon_manifest(folder, manifest)
 
+    save_icon_manifest(folder, manifest)
+    return downloaded
 
-def get_new_items(quantity: int or None = None) -> Tuple[List[Item], List[MissingItem]]:
+
+def get_known_item_ids() -> Set[int]:
     """
-    Searches and returns a list of any new items not yet in the database.
-    :return: A list of the new items.
+    Loads the ids of every item that is either stored or ignored.
+    :return: A set of item ids.
     """
+    return set(Item.objects.values_list('item_id', flat=True)) | \
+        set(MissingItem.objects.values_list('item_id', flat=True))
 
-    items = set()
 
-    counter = 0
-    item_ids = Item.objects.all().values_list('item_id', flat=True)
+def get_new_items(quantity: int or None = None,
+                  concurrency: int = WIKI_CONCURRENCY) -> Tuple[List[Item], List[MissingItem]]:
+    """
+    Searches and returns a list of any new items not yet in the database.
+    Items are filtered against the known ids up front and the wiki lookups
+    for the remainder are made by a bounded pool of workers.
+    :param quantity: The maximum number of new items to look up. None for all.
+    :param concurrency: The maximum number of wiki requests in flight at once.
+    :return: A list of the new items, and a list of the items to ignore.
+    """
+    get_session(concurrency)
+    known_ids = get_known_item_ids()
+    summaries = list(islice((data for data in get_summary() if data["id"] not in known_ids), quantity))
 
     new_items = []
     ignored_items = []
 
-    for data in get_summary():
-        if data["id"] in item_ids:
-            continue
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        wiki_infos = executor.map(lambda data: get_wiki_item(data["name"]), summaries)
+
+        for data, wiki_info in zip(summaries, wiki_infos):
+            if wiki_info is not None and wiki_info["examine"] is not None and wiki_info["members"] is not None:
+                new_item = Item(item_id=data["id"],
+                                name=data["name"],
+                                members=wiki_info["members"],
+                                description=wiki_info["examine"],
+                                high_alch=wiki_info["hialch"] if "hialch" in wiki_info else None,
+                                low_alch=wiki_info["lowalch"] if "lowalch" in wiki_info else None,
+                                buy_limit=wiki_info["limit"],
+                                store_price=data["sp"] if "sp" in data else None)
+                new_items.append(new_item)
+            else:
+                ignored_item = MissingItem(item_id=data["id"], name=data["name"])
+                ignored_items.append(ignored_item)
 
-        counter += 1
+    return new_items, ignored_items
 
-        if quantity is not None and counter > quantity:
-            break
 
-        wiki_info = get_wiki_item(data["name"])
+def group(iterable: Iterable, size: int = 10) -> Iterator[List]:
+    """
+    Splits an iterable into lists of at most a given size.
+    :param iterable: The iterable to split.
+    :param size: The maximum size of each group.
+    :return: An iterator of groups.
+    """
+    iterator = iter(iterable)
+    for first in iterator:
+        yield list(chain([first], islice(iterator, size - 1)))
 
-        if wiki_info is not None and wiki_info["examine"] is not None and wiki_info["members"] is not None:
-            items |= wiki_info.keys()
-            new_item = Item(item_id=data["id"],
-                            name=data["name"],
-                            members=wiki_info["members"],
-                            description=wiki_info["examine"],
-                            high_alch=wiki_info["hialch"] if "hialch" in wiki_info else None,
-                            low_alch=wiki_info["lowalch"] if "lowalch" in wiki_info else None,
-                            buy_limit=wiki_info["limit"],
-                            store_price=data["sp"] if "sp" in data else None)
-            new_items.append(new_item)
+
+def get_price_group(item_ids: List[int], retries: int = PRICE_RETRIES, backoff: float = PRICE_BACKOFF,
+                    session: requests.Session = None) -> Dict[str, Dict]:
+    """
+    Queries the OSBuddy api for the guide prices of a single group of item ids,
+    retrying with exponential backoff when the request fails.
+    :param item_ids: The item ids to query.
+    :param retries: The number of times to retry before giving up.
+    :param backoff: The delay before the first retry in seconds, doubled on each attempt.
+    :param session: The session to fetch with, or None for the shared one.
+    :return: The raw price data keyed by item id.
+    :raises Exception: When the api still fails after all retries.
+    """
+    url = OSBUDDY_API + "".join(f"&i={item_id}" for item_id in item_ids)
+    session = session or get_session()
+
+    for attempt in range(retries + 1):
+        try:
+            response = session.get(url)
+        except requests.RequestException as err:
+            error = f"Error with API: {err}"
         else:
-            ignored_item = MissingItem(item_id=data["id"], name=data["name"])
-            ignored_items.append(ignored_item)
+            if response.status_code == status.HTTP_200_OK:
+                return response.json()
+            error = f"Error with API: {response.status_code}"
 
-    return new_items, ignored_items
+        if attempt < retries:
+            time.sleep(backoff * 2 ** attempt)
+
+    raise Exception(error)
 
 
-def get_prices_for_items(items: Iterable[int]) -> List[Price]:
+def stream_prices(items: Iterable[int], concurrency: int = PRICE_CONCURRENCY, ordered: bool = True,
+                  group_size: int = PRICE_GROUP_SIZE, retries: int = PRICE_RETRIES,
+                  backoff: float = PRICE_BACKOFF) -> Iterator[Tuple[int, Dict]]:
     """
-    Queries the OSBuddy api for the guide prices of a given list of item ids.
-    :param items: The list of items.
-    :return: A list of PriceLogs with the date,
+    Fetches the guide prices for a list of item ids using a bounded pool of workers
+    sharing one keep-alive session, yielding the results as each group arrives.
+    :param items: The list of item ids.
+    :param concurrency: The maximum number of groups in flight at once.
+    :param ordered: Whether to yield the groups in the order they were requested,
+                    or as soon as each one completes.
+    :param group_size: The number of item ids in a single api request.
+    :param retries: The number of retries for each group.
+    :param backoff: The initial backoff between retries in seconds.
+    :return: An iterator of (item id, raw price data) pairs.
     """
+    session = get_session(concurrency)
 
-    def group(iterable, size=10):
-        iterator = iter(iterable)
-        for first in iterator:
-            yield chain([first], islice(iterator, size - 1))
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as executor:
+        futures = [executor.submit(get_price_group, id_group, retries, backoff, session)
+                   for id_group in group(items, group_size)]
 
-    price_data: List[Price] = []
+        for future in (futures if ordered else as_completed(futures)):
+            for item_id, data in future.result().items():
+                yield int(item_id), data
 
-    id_groups = group(items, 100)
 
-    for group in id_groups:
-        url = OSBUDDY_API + "".join(f"&i={item_id}" for item_id in group)
+def get_prices_for_items(items: Iterable[int], concurrency: int = PRICE_CONCURRENCY, ordered: bool = True,
+                         snapshot: PriceSnapshot = None) -> List[Price]:
+    """
+    Queries the OSBuddy api for the guide prices of a given list of item ids.
+    The prices reference their items by id alone, so no queries are made.
+    :param items: The list of items.
+    :param concurrency: The maximum number of api requests in flight at once.
+    :param ordered: Whether the prices should keep the order of the given items.
+    :param snapshot: The snapshot the prices belong to, which also provides their date.
+    :return: A list of PriceLogs with the date,
+    """
+    date = snapshot.date if snapshot is not None else datetime.now(timezone.utc)
+    price_data: List[Price] = []
 
-        request = requests.get(url)
-        if request.status_code == status.HTTP_200_OK:
-            raw_data = request.json()
-        else:
-            raise Exception(f"Error with API: {request.status_code}")
-
-        for item_id, data in raw_data.items():
-            price_data.append(Price(
-                date=datetime.now(timezone.utc),
-                buy_price=data["buying"],
-                sell_price=data["selling"],
-                average_price=data["overall"],
-                buy_volume=data["buyingQuantity"],
-                sell_volume=data["sellingQuantity"],
-                item=Item.objects.get(item_id=item_id)
-            ))
+    for item_id, data in stream_prices(items, concurrency=concurrency, ordered=ordered):
+        price_data.append(Price(
+            date=date,
+            snapshot=snapshot,
+            buy_price=data["buying"],
+            sell_price=data["selling"],
+            average_price=data["overall"],
+            buy_volume=data["buyingQuantity"],
+            sell_volume=data["sellingQuantity"],
+            item_id=item_id
+        ))
 
     return price_data
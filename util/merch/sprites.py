@@ -0,0 +1,179 @@
+import hashlib
+import io
+import json
+import os
+from typing import Dict, List, Tuple
+
+from PIL import Image
+
+from util.merch.cache import atomic_write
+
+SPRITE_INDEX = "sprites.json"
+SPRITE_COLUMNS = 16
+SPRITE_ROWS = 16
+SPRITE_CELL_SIZE = 96
+
+_index_cache: Dict[str, tuple] = {}
+
+
+def load_sprite_index(folder: str) -> Dict:
+    """
+    Loads the sprite index for a sprite folder.
+    :param folder: The sprite folder.
+    :return: The list of sheets and the location of each icon, keyed by item id.
+    """
+    try:
+        with open(os.path.join(folder, SPRITE_INDEX)) as index_file:
+            return json.load(index_file)
+    except (OSError, ValueError):
+        return {"sheets": [], "icons": {}}
+
+
+def get_sprite_index(folder: str) -> Dict:
+    """
+    Gets the sprite index for a sprite folder, only reloading
+    it from disk when the file has changed.
+    :param folder: The sprite folder.
+    :return: The sprite index.
+    """
+    try:
+        modified = os.path.getmtime(os.path.join(folder, SPRITE_INDEX))
+    except OSError:
+        return {"sheets": [], "icons": {}}
+
+    cached = _index_cache.get(folder)
+    if cached is None or cached[0] != modified:
+        cached = _index_cache[folder] = (modified, load_sprite_index(folder))
+
+    return cached[1]
+
+
+def render_sheet(item_ids: List[int], icon_folder: str) -> Tuple[bytes, Dict[str, Dict]]:
+    """
+    Packs a list of icons into a single png sprite sheet.
+    :param item_ids: The ids of the icons, in the order they are placed.
+    :param icon_folder: The folder containing the icons.
+    :return: The png data and the location of each icon on the sheet.
+    """
+    sheet = Image.new("RGBA", (SPRITE_COLUMNS * SPRITE_CELL_SIZE, SPRITE_ROWS * SPRITE_CELL_SIZE))
+    icons = {}
+
+    for position, item_id in enumerate(item_ids):
+        with open(os.path.join(icon_folder, f"{item_id}.gif"), "rb") as icon_file:
+            contents = icon_file.read()
+
+        with Image.open(io.BytesIO(contents)) as icon:
+            icon = icon.convert("RGBA")
+            icon.thumbnail((SPRITE_CELL_SIZE, SPRITE_CELL_SIZE))
+
+            x = position % SPRITE_COLUMNS * SPRITE_CELL_SIZE
+            y = position // SPRITE_COLUMNS * SPRITE_CELL_SIZE
+            sheet.paste(icon, (x, y))
+
+            icons[str(item_id)] = {
+                "x": x,
+                "y": y,
+                "width": icon.width,
+                "height": icon.height,
+                "hash": hash_icon(contents),
+            }
+
+    data = io.BytesIO()
+    sheet.save(data, "PNG", optimize=True)
+    return data.getvalue(), icons
+
+
+def hash_icon(contents: bytes) -> str:
+    """
+    Hashes the contents of an icon, so a redownloaded icon is only redrawn if it actually changed.
+    :param contents: The contents of the icon file.
+    :return: The hash of the contents.
+    """
+    return hashlib.sha256(contents).hexdigest()[:16]
+
+
+def get_icon_hashes(icon_folder: str) -> Dict[str, str]:
+    """
+    Lists the icons in a folder that can be opened as images.
+    :param icon_folder: The folder containing the icons.
+    :return: The hash of each icon's contents, keyed by item id.
+    """
+    hashes = {}
+
+    for name in os.listdir(icon_folder):
+        item_id, extension = os.path.splitext(name)
+        if extension != ".gif" or not item_id.isdigit():
+            continue
+
+        with open(os.path.join(icon_folder, name), "rb") as icon_file:
+            contents = icon_file.read()
+        try:
+            with Image.open(io.BytesIO(contents)) as icon:
+                icon.verify()
+        except (OSError, SyntaxError):
+            continue
+
+        hashes[item_id] = hash_icon(contents)
+
+    return hashes
+
+
+def build_sprites(icon_folder: str, sprite_folder: str) -> List[str]:
+    """
+    Packs the icons into content hashed sprite sheets and writes an index of
+    where each item's icon is. Existing sheets are kept as they are unless
+    one of their icons has changed or been removed, and new icons fill up
+    the last sheet before new sheets are started, so only a few sheets
+    need rebuilding when new icons arrive. The sheets of the previous index
+    are kept until the next build, so clients still holding it can load them.
+    :param icon_folder: The folder containing the icons.
+    :param sprite_folder: The folder to write the sheets and the index to.
+    :return: The names of the sheets that were written.
+    """
+    os.makedirs(sprite_folder, exist_ok=True)
+
+    index = load_sprite_index(sprite_folder)
+    hashes = get_icon_hashes(icon_folder)
+    capacity = SPRITE_COLUMNS * SPRITE_ROWS
+
+    sheets = []
+    for sheet in index["sheets"]:
+        item_ids = [item_id for item_id in sheet["items"] if str(item_id) in hashes]
+        changed = len(item_ids) != len(sheet["items"]) or \
+            any(index["icons"][str(item_id)].get("hash") != hashes[str(item_id)] for item_id in item_ids) or \
+            not os.path.exists(os.path.join(sprite_folder, sheet["name"]))
+        sheets.append({"name": None if changed else sheet["name"], "items": item_ids})
+
+    placed = {str(item_id) for sheet in sheets for item_id in sheet["items"]}
+    new_ids = sorted(int(item_id) for item_id in hashes if item_id not in placed)
+
+    for item_id in new_ids:
+        if not sheets or len(sheets[-1]["items"]) >= capacity:
+            sheets.append({"name": None, "items": []})
+        sheets[-1]["items"].append(item_id)
+        sheets[-1]["name"] = None
+
+    icons = {}
+    written = []
+    for sheet in (sheet for sheet in sheets if sheet["items"]):
+        if sheet["name"] is None:
+            data, sheet_icons = render_sheet(sheet["items"], icon_folder)
+            sheet["name"] = f"sprites-{hashlib.sha256(data).hexdigest()[:12]}.png"
+            atomic_write(os.path.join(sprite_folder, sheet["name"]), data)
+            written.append(sheet["name"])
+        else:
+            sheet_icons = {str(item_id): index["icons"][str(item_id)] for item_id in sheet["items"]}
+
+        for item_id, icon in sheet_icons.items():
+            icons[item_id] = dict(icon, sheet=sheet["name"])
+
+    sheets = [sheet for sheet in sheets if sheet["items"]]
+    atomic_write(os.path.join(sprite_folder, SPRITE_INDEX),
+                 json.dumps({"sheets": sheets, "icons": icons}, sort_keys=True).encode())
+
+    in_use = {sheet["name"] for sheet in sheets} | {sheet["name"] for sheet in index["sheets"]}
+    for name in os.listdir(sprite_folder):
+        if name.startswith("sprites-") and name.endswith(".png") and name not in in_use:
+            os.remove(os.path.join(sprite_folder, name))
+
+    return written
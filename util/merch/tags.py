@@ -0,0 +1,121 @@
+from collections import defaultdict
+from threading import Lock
+from typing import Iterable, Dict, List, Set, Tuple, FrozenSet
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from merchapi.models import TaggedItem, is_bulk_tagging
+from util.merch.markers import get_marker_version, bump_marker
+
+_tag_index: 'TagIndex' or None = None
+_tag_index_lock = Lock()
+
+
+def get_tag_version() -> Tuple[int, int] or None:
+    """
+    Gets the version of the tagged items from the shared marker file.
+    """
+    return get_marker_version(settings.TAG_INDEX_VERSION_FILE)
+
+
+def bump_tag_version() -> None:
+    """
+    Marks the tagged items as changed, so every process reloads its tag index on its next request.
+    """
+    bump_marker(settings.TAG_INDEX_VERSION_FILE)
+
+
+@receiver([post_save, post_delete], sender='merchapi.TaggedItem')
+@receiver([post_save, post_delete], sender='merchapi.Tag')
+def tags_changed(sender, raw=False, **kwargs):
+    """
+    Bumps the tag version when an item is tagged or untagged, or a tag changes.
+    The bump waits for the change to commit, so no process reloads the old tags.
+    Fixtures are left alone, and bulk changes bump the version themselves.
+    """
+    if not raw and not is_bulk_tagging():
+        transaction.on_commit(bump_tag_version)
+
+
+class TagIndex:
+    """
+    The set of item ids with each tag, for everyone and for each merchant, so
+    any combination of tags is a handful of set operations rather than a join
+    through the tagged items for every tag.
+    """
+
+    def __init__(self, tagged_items: Iterable[Tuple[str, int, int or None]], version: Tuple[int, int] or None = None):
+        """
+        :param tagged_items: The tag name, item id and merchant id of each tagged item,
+                             with no merchant if the tag is global.
+        :param version: The tag version the tagged items were loaded at.
+        """
+        self.version = version
+
+        tagged = defaultdict(set)
+        self._item_tags: Dict[int or None, Dict[int, Set[str]]] = defaultdict(lambda: defaultdict(set))
+        for tag, item_id, merchant_id in tagged_items:
+            tagged[merchant_id, tag].add(item_id)
+            self._item_tags[merchant_id][item_id].add(tag)
+
+        self._global: Dict[str, FrozenSet[int]] = {}
+        self._overlays: Dict[int, Dict[str, FrozenSet[int]]] = defaultdict(dict)
+        for (merchant_id, tag), item_ids in tagged.items():
+            if merchant_id is None:
+                self._global[tag] = frozenset(item_ids)
+            else:
+                self._overlays[merchant_id][tag] = frozenset(item_ids)
+
+    def items(self, tag: str, merchant_id: int = None) -> FrozenSet[int]:
+        """
+        Gets the items with a tag.
+        :param tag: The name of the tag.
+        :param merchant_id: The merchant whose own tags are included as well as the global ones.
+        :return: The ids of the tagged items.
+        """
+        item_ids = self._global.get(tag, frozenset())
+        overlay = self._overlays.get(merchant_id)
+        if overlay and tag in overlay:
+            item_ids = item_ids | overlay[tag]
+        return item_ids
+
+    def tags(self, item_id: int, merchant_id: int = None) -> Set[str]:
+        """
+        Gets the tags of an item.
+        :param item_id: The id of the item.
+        :param merchant_id: The merchant whose own tags are included as well as the global ones.
+        :return: The names of the tags.
+        """
+        names = set(self._item_tags[None].get(item_id, ()))
+        if merchant_id is not None and merchant_id in self._item_tags:
+            names |= self._item_tags[merchant_id].get(item_id, set())
+        return names
+
+    def query(self, clauses: List[List[str]], merchant_id: int = None) -> Set[int]:
+        """
+        Gets the items that have at least one tag from every clause.
+        :param clauses: The tag names of each clause, so [["rune", "arrow"], ["f2p"]] is (rune or arrow) and f2p.
+        :param merchant_id: The merchant whose own tags are included as well as the global ones.
+        :return: The ids of the matching items.
+        """
+        # the smallest clauses go first, so the intersection only ever shrinks from the smallest set
+        matches = sorted((set().union(*(self.items(tag, merchant_id) for tag in clause)) for clause in clauses),
+                         key=len)
+        return set.intersection(*matches) if matches else set()
+
+
+def get_tag_index() -> TagIndex:
+    """
+    Gets this process' tag index, only reloading it when the tag version has changed.
+    :return: The tag index.
+    """
+    global _tag_index
+
+    version = get_tag_version()
+    with _tag_index_lock:
+        if _tag_index is None or _tag_index.version != version:
+            _tag_index = TagIndex(TaggedItem.objects.values_list('tag__name', 'item_id', 'user_id'), version)
+        return _tag_index
@@ -0,0 +1,137 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone, timedelta
+
+import numpy as np
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from merchapi.models import Price, PriceSnapshot
+from util.merch import analytics
+from util.merch.analytics import forward_fill, sma, ema, volatility, trend, zscore, load_history, get_analytics, \
+    warm_analytics
+from util.merch.columnar import PriceStore, stored_snapshots
+
+START = datetime(2018, 4, 2, tzinfo=timezone.utc)
+nan = np.nan
+
+
+class IndicatorTest(SimpleTestCase):
+    """
+    Tests the vectorized indicators against values worked out by hand.
+    """
+
+    def test_forward_fill(self):
+        values = np.array([[nan, 1], [2, nan], [nan, nan], [4, 5]])
+        np.testing.assert_array_equal(forward_fill(values), [[nan, 1], [2, 1], [2, 1], [4, 5]])
+
+    def test_sma(self):
+        values = np.array([[1, nan], [2, 2], [3, 4], [4, 6]], dtype=float)
+        np.testing.assert_array_equal(sma(values, 2), [[nan, nan], [1.5, nan], [2.5, 3], [3.5, 5]])
+
+    def test_ema(self):
+        values = np.array([[2, nan], [nan, 4], [5, 1]], dtype=float)
+        np.testing.assert_allclose(ema(values, 3), [[2, nan], [2, 4], [3.5, 2.5]])
+
+    def test_volatility(self):
+        prices = np.array([[1], [2], [4], [8]], dtype=float)
+        np.testing.assert_allclose(volatility(prices, 2), [[nan], [nan], [0], [0]], atol=1e-6)
+
+        prices = np.array([[1], [2], [2]], dtype=float)
+        self.assertAlmostEqual(volatility(prices, 2)[-1, 0], np.log(2) / 2)
+
+    def test_trend(self):
+        values = np.array([[1, 5, 1], [2, 5, nan], [3, 5, 3]], dtype=float)
+        np.testing.assert_array_equal(trend(values, 3), [1, 0, nan])
+        self.assertTrue(np.isnan(trend(values, 4)).all())
+
+    def test_zscore(self):
+        values = np.array([[1, 3], [3, 3], [1, 3], [3, 3]], dtype=float)
+        np.testing.assert_array_equal(zscore(values, 4), [1, nan])
+
+
+class AnalyticsTest(TestCase):
+    """
+    Tests loading the history and caching the analytics per snapshot.
+    """
+    fixtures = ['items.json']
+
+    def setUp(self):
+        analytics._analytics = None
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(ANALYTICS_FILE=os.path.join(directory, 'analytics.npz'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        for hours in range(30):
+            self.add_snapshot(hours)
+
+    @staticmethod
+    def add_snapshot(hours: int):
+        snapshot = PriceSnapshot.objects.create(date=START + timedelta(hours=hours))
+        Price.objects.bulk_create(Price(
+            date=snapshot.date,
+            snapshot=snapshot,
+            item_id=item_id,
+            buy_price=100 + hours,
+            sell_price=110 + hours * item_id,
+            buy_volume=10,
+            sell_volume=10,
+        ) for item_id in (2, 6) if not (item_id == 6 and hours < 5))
+
+    def test_load_history(self):
+        history = load_history(24)
+        self.assertEqual(history.item_ids.tolist(), [2, 6])
+        self.assertEqual(len(history), 24)
+        self.assertEqual(history.dates[-1], np.datetime64(int((START + timedelta(hours=29)).timestamp()), 's'))
+        self.assertEqual(history.for_item(6)['buy_price'][-1], 129)
+
+    def test_load_history_from_store(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        PriceStore(directory).extend(stored_snapshots())
+
+        with override_settings(PRICE_STORE_DIR=directory):
+            from_store = load_history(24)
+        from_database = load_history(24)
+
+        self.assertEqual(from_store.snapshots.tolist(), from_database.snapshots.tolist())
+        for field in ('buy_price', 'sell_volume'):
+            np.testing.assert_array_equal(from_store.fields[field], from_database.fields[field])
+
+    def test_summary(self):
+        summary = {row['item']: row for row in get_analytics().summary()}
+
+        self.assertEqual(summary[2]['buy_price'], 129)
+        self.assertEqual(summary[2]['sma'], np.mean(range(106, 130)))
+        self.assertAlmostEqual(summary[2]['margin_trend'], 1)
+        self.assertAlmostEqual(summary[6]['margin_trend'], 5)
+        self.assertIsNone(summary[6]['volume_zscore'])
+
+        item = get_analytics().for_item(6)
+        self.assertEqual(len(item['timestamps']), 30)
+        self.assertEqual(item['series']['buy_price'][:5], [None] * 5)
+
+    def test_cached_per_snapshot(self):
+        first = get_analytics()
+        with self.assertNumQueries(1):
+            self.assertIs(get_analytics(), first)
+
+        self.add_snapshot(30)
+        self.assertIsNot(get_analytics(), first)
+        self.assertEqual(get_analytics().latest['buy_price'][0], 130)
+
+    def test_warmed(self):
+        warmed = warm_analytics()
+        analytics._analytics = None
+
+        with self.assertNumQueries(1):
+            loaded = get_analytics()
+        self.assertEqual(loaded.snapshot, warmed.snapshot)
+        self.assertEqual(loaded.item_ids.tolist(), [2, 6])
+        self.assertEqual(loaded.summary(), warmed.summary())
+        self.assertEqual(loaded.for_item(6), warmed.for_item(6))
+
+        self.add_snapshot(30)
+        self.assertEqual(get_analytics().latest['buy_price'][0], 130)
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timezone
+from unittest import mock
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from util.merch import autocomplete
+from util.merch.autocomplete import Autocomplete, get_autocomplete, build_autocomplete
+from util.merch.catalog import bump_catalog_version
+from merchapi.models import Item, LatestPrice
+
+
+class AutocompleteTest(SimpleTestCase):
+    """
+    Tests completing names against a handful of items.
+    """
+
+    def setUp(self):
+        self.autocomplete = Autocomplete([
+            (1, "Rune platebody", 50),
+            (2, "Rune platelegs", 80),
+            (3, "Fire rune", 1000),
+            (4, "Crème brûlée", 0),
+            (5, "Runite bar", 80),
+        ])
+
+    def complete(self, query, limit=10):
+        return [item['item_id'] for item in self.autocomplete.complete(query, limit)]
+
+    def test_complete(self):
+        self.assertEqual(self.complete("rune"), [3, 2, 1])
+        self.assertEqual(self.complete("RUNE PLATEB"), [1])
+        self.assertEqual(self.complete("plate"), [2, 1])
+        self.assertEqual(self.complete("bru"), [4])
+        self.assertEqual(self.complete("creme"), [4])
+        self.assertEqual(self.complete("rune p", limit=1), [2])
+
+    def test_short_prefixes(self):
+        self.assertEqual(self.complete("r"), [3, 5, 2, 1])
+        self.assertEqual(self.complete("ru", limit=2), [3, 5])
+        self.assertEqual(self.complete("x"), [])
+        self.assertEqual(self.complete(" "), [])
+
+    def test_no_match(self):
+        self.assertEqual(self.complete("rune bar"), [])
+        self.assertEqual(self.complete("platebodyy"), [])
+
+
+class GetAutocompleteTest(TestCase):
+    """
+    Tests building the index from the database and keeping it in memory.
+    """
+    fixtures = ['items.json']
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        settings = override_settings(CATALOG_VERSION_FILE=os.path.join(directory, 'catalog.version'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        autocomplete._autocomplete = None
+        self.addCleanup(setattr, autocomplete, '_autocomplete', None)
+
+    def test_cached(self):
+        first = get_autocomplete()
+        self.assertEqual(len(first), Item.objects.count())
+
+        with self.assertNumQueries(0):
+            self.assertIs(get_autocomplete(), first)
+            self.assertEqual(first.complete("rune platebody")[0]['name'], "Rune platebody")
+
+        with mock.patch('util.merch.autocomplete.time.monotonic', return_value=time.monotonic() + 3600):
+            self.assertIsNot(get_autocomplete(), first)
+
+    def test_popularity(self):
+        LatestPrice.objects.create(item_id=805, date=datetime.now(timezone.utc), buy_volume=10, sell_volume=10)
+        self.assertEqual(build_autocomplete().complete("rune")[0]['name'], "Rune thrownaxe")
+
+    def test_items_added(self):
+        get_autocomplete()
+        Item.objects.bulk_create([Item(item_id=1, name="Zzz new item", description="", members=False)])
+        self.assertEqual(get_autocomplete().complete("zzz"), [])
+
+        bump_catalog_version()
+        self.assertEqual(get_autocomplete().complete("zzz"), [{'item_id': 1, 'name': "Zzz new item"}])
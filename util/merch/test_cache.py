@@ -0,0 +1,72 @@
+import shutil
+import tempfile
+from unittest import mock
+
+import requests
+from django.test import SimpleTestCase
+
+from util.merch.cache import HttpCache
+
+
+def make_response(status_code: int, content: bytes = b"", headers=None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = content
+    response.headers.update(headers or {})
+    return response
+
+
+class HttpCacheTest(SimpleTestCase):
+    """
+    Tests the disk backed http cache against a fake session.
+    """
+
+    url = "https://example.com/summary.json"
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+        self.session = mock.Mock()
+        self.session.get.return_value = make_response(200, b'{"2": {"id": 2}}', {
+            'ETag': '"abc"',
+            'Last-Modified': 'Sun, 18 Oct 2026 12:00:00 GMT',
+            'Content-Type': 'application/json',
+        })
+
+        self.cache = HttpCache(self.directory, {'summary': 60, 'wiki': 0}, self.session)
+
+    def test_fresh_hit(self):
+        self.assertEqual(self.cache.get(self.url, 'summary').json(), {"2": {"id": 2}})
+        self.assertEqual(self.cache.get(self.url, 'summary').json(), {"2": {"id": 2}})
+
+        self.assertEqual(self.session.get.call_count, 1)
+        self.assertEqual(self.cache.stats['summary'], {HttpCache.MISS: 1, HttpCache.HIT: 1})
+
+    def test_revalidation(self):
+        self.cache.get(self.url, 'wiki')
+
+        self.session.get.return_value = make_response(304)
+        response = self.cache.get(self.url, 'wiki')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"2": {"id": 2}})
+        self.assertEqual(self.session.get.call_args[1]['headers'], {
+            'If-None-Match': '"abc"',
+            'If-Modified-Since': 'Sun, 18 Oct 2026 12:00:00 GMT',
+        })
+        self.assertEqual(self.cache.stats['wiki'], {HttpCache.MISS: 1, HttpCache.REVALIDATED: 1})
+
+    def test_persists_across_instances(self):
+        self.cache.get(self.url, 'summary')
+
+        cache = HttpCache(self.directory, {'summary': 60}, self.session)
+        self.assertEqual(cache.get(self.url, 'summary').text, '{"2": {"id": 2}}')
+        self.assertEqual(self.session.get.call_count, 1)
+
+    def test_errors_not_cached(self):
+        self.session.get.return_value = make_response(404)
+
+        self.assertEqual(self.cache.get(self.url, 'summary').status_code, 404)
+        self.assertEqual(self.cache.get(self.url, 'summary').status_code, 404)
+        self.assertEqual(self.cache.stats['summary'], {HttpCache.MISS: 2})
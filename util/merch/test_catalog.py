@@ -0,0 +1,64 @@
+import shutil
+import tempfile
+import os
+
+from django.test import TestCase, override_settings
+
+from merchapi.models import Item
+from util.merch import catalog
+from util.merch.catalog import get_catalog, get_catalog_version, bump_catalog_version
+
+
+class CatalogTest(TestCase):
+    """
+    Tests keeping the catalog in memory until the version marker changes.
+    """
+    fixtures = ['items.json']
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        settings = override_settings(CATALOG_VERSION_FILE=os.path.join(directory, 'catalog', 'catalog.version'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        catalog._catalog = None
+        self.addCleanup(setattr, catalog, '_catalog', None)
+
+    def test_version(self):
+        self.assertIsNone(get_catalog_version())
+
+        bump_catalog_version()
+        first = get_catalog_version()
+        self.assertIsNotNone(first)
+
+        bump_catalog_version()
+        self.assertNotEqual(get_catalog_version(), first)
+
+    def test_cached(self):
+        first = get_catalog()
+        self.assertEqual(len(first), Item.objects.count())
+        self.assertEqual(first.by_id[2].name, "Cannonball")
+        self.assertTrue(all(row['members'] for row in first.serialized(True)))
+
+        with self.assertNumQueries(0):
+            self.assertIs(get_catalog(), first)
+
+        bump_catalog_version()
+        self.assertIsNot(get_catalog(), first)
+
+    def test_item_changed(self):
+        first = get_catalog()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Item.objects.create(item_id=1, name="New item", description="", members=False)
+            self.assertIs(get_catalog(), first)
+        self.assertEqual(get_catalog().by_id[1].name, "New item")
+        self.assertIsNot(get_catalog(), first)
+
+        second = get_catalog()
+        with self.captureOnCommitCallbacks(execute=True):
+            Item.objects.filter(item_id=1).delete()
+        self.assertNotIn(1, get_catalog().by_id)
+        self.assertIsNot(get_catalog(), second)
@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+from datetime import datetime, timezone, timedelta
+from unittest import mock
+
+import numpy as np
+from django.test import TestCase, override_settings
+
+from merchapi.models import Price, PriceSnapshot
+from util.merch.columnar import PriceStore, stored_snapshots, get_price_store
+from util.merch.ingest import ingest_prices
+
+START = datetime(2018, 4, 2, tzinfo=timezone.utc)
+
+
+def make_snapshot(snapshot_id: int, prices):
+    return snapshot_id, START + timedelta(hours=snapshot_id), prices
+
+
+class PriceStoreTest(TestCase):
+    """
+    Tests the columnar price store against a temporary folder.
+    """
+    fixtures = ['items.json']
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.store = PriceStore(self.directory)
+
+    def test_empty(self):
+        history = self.store.open()
+        self.assertEqual(len(history), 0)
+        self.assertEqual(self.store.last_snapshot(), 0)
+
+    def test_extend(self):
+        self.assertEqual(self.store.extend([
+            make_snapshot(1, {2: (10, 12, 11, 100, 50)}),
+            make_snapshot(2, {2: (11, 13, 12, 90, 60), 6: (5, None, 5, 1, 1)}),
+        ]), 2)
+
+        history = self.store.open()
+        self.assertEqual(history.item_ids.tolist(), [2, 6])
+        self.assertEqual(history.snapshots.tolist(), [1, 2])
+        self.assertEqual(history.dates[1], np.datetime64(START.replace(tzinfo=None) + timedelta(hours=2), 's'))
+        self.assertEqual(history.fields['buy_price'].shape, (2, 2))
+
+        item = history.for_item(6)
+        self.assertTrue(np.isnan(item['buy_price'][0]))
+        self.assertEqual(item['buy_price'][1], 5)
+        self.assertTrue(np.isnan(item['sell_price'][1]))
+        self.assertIsInstance(history.fields['buy_price'].base, np.memmap)
+
+    def test_skips_stored(self):
+        self.store.extend([make_snapshot(1, {2: (1, 1, 1, 1, 1)})])
+        self.assertEqual(self.store.extend([make_snapshot(1, {2: (2, 2, 2, 2, 2)})]), 0)
+        self.assertEqual(self.store.open().for_item(2)['buy_price'].tolist(), [1])
+
+    def test_grows_columns(self):
+        with mock.patch('util.merch.columnar.STORE_MIN_CAPACITY', 1):
+            self.store.extend([make_snapshot(1, {2: (1, 1, 1, 1, 1)})])
+            self.store.extend([make_snapshot(2, {6: (2, 2, 2, 2, 2)})])
+            self.store.extend([make_snapshot(3, {2: (3, 3, 3, 3, 3), 6: (4, 4, 4, 4, 4), 8: (5, 5, 5, 5, 5)})])
+
+        history = self.store.open()
+        self.assertEqual(history.item_ids.tolist(), [2, 6, 8])
+        np.testing.assert_array_equal(history.for_item(2)['buy_price'], [1, np.nan, 3])
+        np.testing.assert_array_equal(history.for_item(6)['buy_price'], [np.nan, 2, 4])
+        np.testing.assert_array_equal(history.for_item(8)['buy_price'], [np.nan, np.nan, 5])
+
+    def test_unfinished_resize(self):
+        with mock.patch('util.merch.columnar.STORE_MIN_CAPACITY', 1):
+            self.store.extend([make_snapshot(1, {2: (1, 1, 1, 1, 1)})])
+
+            # the new generation is written, but the process dies before the metadata switches to it
+            with mock.patch.object(PriceStore, '_save_meta', side_effect=OSError), self.assertRaises(OSError):
+                self.store.extend([make_snapshot(2, {6: (2, 2, 2, 2, 2)})])
+
+            history = self.store.open()
+            self.assertEqual(history.item_ids.tolist(), [2])
+            self.assertEqual(history.for_item(2)['buy_price'].tolist(), [1])
+
+            self.store.extend([make_snapshot(2, {6: (2, 2, 2, 2, 2)})])
+            self.store.extend([make_snapshot(3, {8: (3, 3, 3, 3, 3)})])
+
+        history = self.store.open()
+        np.testing.assert_array_equal(history.for_item(2)['buy_price'], [1, np.nan, np.nan])
+        np.testing.assert_array_equal(history.for_item(8)['buy_price'], [np.nan, np.nan, 3])
+
+        # only the current and the previous generation are kept
+        self.assertEqual(sorted(name for name in os.listdir(self.directory) if name.startswith('buy_price')),
+                         ['buy_price.2.bin', 'buy_price.3.bin'])
+
+    def test_unfinished_append(self):
+        self.store.extend([make_snapshot(1, {2: (1, 1, 1, 1, 1)})])
+        with open(os.path.join(self.directory, 'buy_price.1.bin'), 'ab') as array_file:
+            array_file.write(b'\xff' * 100)
+
+        self.store.extend([make_snapshot(2, {2: (2, 2, 2, 2, 2)})])
+        self.assertEqual(self.store.open().for_item(2)['buy_price'].tolist(), [1, 2])
+
+    def test_from_database(self):
+        for snapshot_id in (1, 2):
+            snapshot = PriceSnapshot.objects.create(id=snapshot_id, date=START + timedelta(hours=snapshot_id))
+            Price.objects.create(date=snapshot.date, snapshot=snapshot, item_id=2, buy_price=snapshot_id)
+
+        self.store.extend(stored_snapshots())
+        self.assertEqual(self.store.open().for_item(2)['buy_price'].tolist(), [1, 2])
+        self.assertEqual(list(stored_snapshots(after=2)), [])
+
+    def test_ingest(self):
+        def fake_prices(item_ids, concurrency, snapshot):
+            return [Price(date=snapshot.date, snapshot=snapshot, item_id=item_id, buy_price=item_id)
+                    for item_id in item_ids]
+
+        with override_settings(PRICE_STORE_DIR=self.directory), \
+                mock.patch('util.merch.ingest.get_prices_for_items', fake_prices), \
+                self.captureOnCommitCallbacks(execute=True):
+            snapshot = ingest_prices([2, 6])
+            self.assertIsNotNone(get_price_store())
+
+        history = self.store.open()
+        self.assertEqual(history.snapshots.tolist(), [snapshot.id])
+        self.assertEqual(history.fields['buy_price'].tolist(), [[2, 6]])
+
+    def test_disabled(self):
+        with override_settings(PRICE_STORE_DIR=None):
+            self.assertIsNone(get_price_store())
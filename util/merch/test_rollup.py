@@ -0,0 +1,139 @@
+from datetime import datetime, timezone, timedelta
+
+from django.test import TestCase
+
+from merchapi.models import Price, PriceSnapshot, HourlyPrice, DailyPrice, WeeklyPrice, get_rollup_model, \
+    get_rolled_up_windows
+from util.merch.rollup import roll_up, roll_up_all, prune_prices
+
+START = datetime(2018, 4, 2, tzinfo=timezone.utc)  # a monday
+
+
+class RollupTest(TestCase):
+    """
+    Tests the price rollups against the raw prices they summarize.
+    """
+    fixtures = ['items.json']
+
+    def setUp(self):
+        self.add_prices(range(0, 24 * 10 * 4))
+
+    @staticmethod
+    def add_prices(quarters):
+        for quarter in quarters:
+            date = START + timedelta(minutes=15 * quarter)
+            snapshot = PriceSnapshot.objects.create(date=date)
+            Price.objects.bulk_create(Price(
+                date=date,
+                snapshot=snapshot,
+                item_id=item_id,
+                buy_price=quarter,
+                sell_price=quarter + item_id,
+                average_price=quarter,
+                buy_volume=1,
+                sell_volume=2,
+            ) for item_id in (2, 6))
+
+    def test_hourly(self):
+        self.assertEqual(roll_up(HourlyPrice), 2 * 24 * 10)
+
+        hour = HourlyPrice.objects.get(item_id=6, date=START + timedelta(hours=1))
+        self.assertEqual((hour.samples, hour.buy_price_open, hour.buy_price_close), (4, 4, 7))
+        self.assertEqual((hour.sell_price_low, hour.sell_price_high, hour.sell_price_mean), (10, 13, 11.5))
+        self.assertEqual((hour.buy_volume, hour.sell_volume), (4, 8))
+
+    def test_hierarchy(self):
+        roll_up_all()
+
+        self.assertEqual(DailyPrice.objects.filter(item_id=2).count(), 10)
+        self.assertEqual(list(WeeklyPrice.objects.filter(item_id=2).values_list('date', 'samples')), [
+            (START, 4 * 24 * 7),
+            (START + timedelta(weeks=1), 4 * 24 * 3),
+        ])
+
+        for unit in ('d', 'w'):
+            raw = list(Price.objects.filter(item_id=2).in_intervals(1, unit))
+            rolled_up = list(get_rollup_model(unit).objects.filter(item_id=2).in_intervals(1, unit))
+            self.assertEqual([window['count'] for window in raw], [window['count'] for window in rolled_up])
+            for field in ('buy_price_first', 'buy_price_last', 'sell_price_max', 'total_sell_volume'):
+                self.assertEqual([window[field] for window in raw], [window[field] for window in rolled_up])
+            for expected, actual in zip(raw, rolled_up):
+                self.assertAlmostEqual(expected['buy_price_avg'], actual['buy_price_avg'])
+
+    def test_incremental(self):
+        roll_up_all()
+        self.add_prices([24 * 10 * 4, 24 * 10 * 4 + 1])
+
+        self.assertEqual(roll_up(HourlyPrice), 2)
+        self.assertEqual(roll_up(HourlyPrice), 0)
+        last = HourlyPrice.objects.get(item_id=2, date=START + timedelta(days=10))
+        self.assertEqual((last.samples, last.buy_price_close), (2, 24 * 10 * 4 + 1))
+
+        roll_up_all()
+        self.assertEqual(DailyPrice.objects.filter(item_id=2).count(), 11)
+        self.assertEqual(WeeklyPrice.objects.get(item_id=2, date=START + timedelta(weeks=1)).samples, 4 * 24 * 3 + 2)
+
+    def test_late_prices(self):
+        roll_up_all()
+        self.add_prices([4 * 24 + 1])
+
+        self.assertEqual(HourlyPrice.objects.get(item_id=2, date=START + timedelta(days=1)).samples, 4)
+        self.assertEqual(prune_prices({'raw': 0}, START + timedelta(days=30))['raw'], 2 * 4 * 24)
+        self.assertEqual(Price.objects.filter(date__lt=START + timedelta(days=1)).count(), 0)
+        self.assertEqual(Price.objects.filter(date=START + timedelta(days=1, minutes=15)).count(), 2 * 2)
+
+        roll_up_all()
+        self.assertEqual(HourlyPrice.objects.get(item_id=2, date=START + timedelta(days=1)).samples, 5)
+        self.assertEqual(DailyPrice.objects.get(item_id=2, date=START + timedelta(days=1)).samples, 4 * 24 + 1)
+        self.assertEqual(WeeklyPrice.objects.get(item_id=2, date=START).samples, 4 * 24 * 7 + 1)
+
+    def test_missing_prices(self):
+        Price.objects.filter(item_id=2, date__lt=START + timedelta(hours=12), buy_price__gte=4).update(buy_price=None)
+        roll_up_all()
+
+        raw = list(Price.objects.filter(item_id=2).in_intervals(1, 'd'))
+        rolled_up = list(DailyPrice.objects.filter(item_id=2).in_intervals(1, 'd'))
+        self.assertEqual((rolled_up[0]['count'], rolled_up[0]['buy_price_count']), (4 * 24, 4 * 24 - 4 * 12 + 4))
+        for expected, actual in zip(raw, rolled_up):
+            self.assertAlmostEqual(expected['buy_price_avg'], actual['buy_price_avg'])
+        self.assertAlmostEqual(rolled_up[0]['buy_price_avg'], sum(range(4)) / 52 + sum(range(48, 96)) / 52)
+
+    def test_prune(self):
+        now = START + timedelta(days=10)
+        retention = {'raw': 2, 'hourly': 5, 'daily': None, 'weekly': None}
+
+        self.assertEqual(prune_prices(retention, now), {})
+
+        roll_up(HourlyPrice)
+        prune_prices(retention, now)
+        self.assertEqual(Price.objects.earliest('date').date, now - timedelta(days=2))
+        self.assertEqual(PriceSnapshot.objects.earliest('date').date, now - timedelta(days=2))
+
+        roll_up(DailyPrice)
+        deleted = prune_prices(retention, now)
+        self.assertEqual(deleted['hourly'], 2 * 24 * 5)
+        self.assertEqual(HourlyPrice.objects.earliest('date').date, now - timedelta(days=5))
+
+    def test_rollup_model(self):
+        self.assertIs(get_rollup_model('h'), HourlyPrice)
+        self.assertIs(get_rollup_model('d'), DailyPrice)
+        self.assertIs(get_rollup_model('w'), WeeklyPrice)
+        self.assertIs(get_rollup_model('m'), DailyPrice)
+
+    def test_windows_not_rolled_up(self):
+        raw = list(Price.objects.filter(item_id=2).in_intervals(2, 'd'))
+        self.assertEqual(get_rolled_up_windows(DailyPrice, 2, 2, 'd'), raw)
+
+        roll_up_all()
+        self.add_prices(range(24 * 10 * 4, 24 * 11 * 4))
+
+        # the latest rollups are out of date, and some windows are partly rolled up and partly not
+        for model, count, unit in ((WeeklyPrice, 1, 'w'), (DailyPrice, 2, 'd'), (DailyPrice, 1, 'm')):
+            raw = list(Price.objects.filter(item_id=2).in_intervals(count, unit))
+            windows = get_rolled_up_windows(model, 2, count, unit)
+
+            self.assertEqual([window['date'] for window in windows], [window['date'] for window in raw])
+            for expected, actual in zip(raw, windows):
+                for field in ('count', 'buy_price_first', 'buy_price_last', 'sell_price_min', 'total_buy_volume'):
+                    self.assertEqual(expected[field], actual[field])
+                self.assertAlmostEqual(expected['buy_price_avg'], actual['buy_price_avg'])
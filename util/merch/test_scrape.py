@@ -1,11 +1,17 @@
 import os
 import shutil
+import tempfile
 from typing import List
+from unittest import mock
 
+import requests
 from django.test import TestCase
 
-from util.merch.scrape import get_new_items, parse_wiki_data, get_summary, download_icons, get_prices_for_items
-from merchapi.models import Item, Price
+from util.merch import scrape
+from util.merch.scrape import get_new_items, parse_wiki_data, get_summary, download_icons, get_prices_for_items, \
+    stream_prices, get_price_group, load_icon_manifest, get_session, SESSION_POOL_SIZE, SESSION_POOL_HOSTS
+from merchapi.models import Item, Price, MissingItem, PriceSnapshot, LatestPrice
+from util.merch.ingest import ingest_prices
 
 
 class ScrapeTest(TestCase):
@@ -54,12 +60,13 @@ class ScrapeTest(TestCase):
         self.assertNotEqual(len(get_summary()), 0)
 
     def test_download_image(self):
-        test_path = "./test"
+        test_path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, test_path)
         item_ids = [2]
 
         download_icons(item_ids, test_path)
-        self.assertEqual([f"{item_id}.gif" for item_id in item_ids], os.listdir(test_path))
-        shutil.rmtree(test_path)
+        self.assertEqual([f"{item_id}.gif" for item_id in item_ids],
+                         [name for name in os.listdir(test_path) if name.endswith(".gif")])
 
     def test_get_prices_for_ids(self):
         """
@@ -74,3 +81,245 @@ class ScrapeTest(TestCase):
         test_prices: List[Price] = get_prices_for_items(test_ids)
 
         self.assertEqual([price.item for price in test_prices], test_items)
+
+
+class FakeResponse:
+    """
+    A minimal stand in for a requests response.
+    """
+
+    def __init__(self, status_code: int, data=None):
+        self.status_code = status_code
+        self.data = data
+
+    def json(self):
+        return self.data
+
+
+def fake_guide_prices(url: str) -> FakeResponse:
+    """
+    Builds a guide price response for every id in an OSBuddy url.
+    """
+    item_ids = [int(part[2:]) for part in url.split("&") if part.startswith("i=")]
+    return FakeResponse(200, {str(item_id): {
+        "buying": item_id, "selling": item_id + 1, "overall": item_id,
+        "buyingQuantity": 10, "sellingQuantity": 20,
+    } for item_id in item_ids})
+
+
+class ConcurrentPriceTest(TestCase):
+    """
+    Tests the pooled price fetcher without touching the network.
+    """
+
+    def setUp(self):
+        patcher = mock.patch('util.merch.scrape.get_session')
+        self.get_session = patcher.start()
+        self.session = self.get_session.return_value
+        self.session.get.side_effect = fake_guide_prices
+        self.addCleanup(patcher.stop)
+
+    def test_ordered_stream(self):
+        item_ids = list(range(1, 251))
+        results = list(stream_prices(item_ids, concurrency=4, group_size=100))
+
+        self.assertEqual([item_id for item_id, _ in results], item_ids)
+        self.assertEqual(self.session.get.call_count, 3)
+        # the workers are handed the session sized for them rather than looking it up
+        self.get_session.assert_called_once_with(4)
+
+    def test_unordered_stream(self):
+        item_ids = list(range(1, 251))
+        results = list(stream_prices(item_ids, concurrency=4, ordered=False, group_size=10))
+
+        self.assertCountEqual([item_id for item_id, _ in results], item_ids)
+        self.assertEqual(self.session.get.call_count, 25)
+
+    def test_retry(self):
+        self.session.get.side_effect = [
+            requests.ConnectionError(),
+            FakeResponse(503),
+            fake_guide_prices("&i=2"),
+        ]
+
+        with mock.patch('util.merch.scrape.time.sleep') as sleep:
+            self.assertIn("2", get_price_group([2], retries=2, backoff=1))
+
+        self.assertEqual([call[0][0] for call in sleep.call_args_list], [1, 2])
+
+    def test_retry_exhausted(self):
+        self.session.get.side_effect = lambda url: FakeResponse(500)
+
+        with mock.patch('util.merch.scrape.time.sleep'), self.assertRaises(Exception):
+            get_price_group([2], retries=2)
+
+        self.assertEqual(self.session.get.call_count, 3)
+
+
+class SessionTest(TestCase):
+    """
+    Tests that the shared session's pool fits the concurrency of each fetch.
+    """
+
+    def setUp(self):
+        self.addCleanup(setattr, scrape, '_session', scrape._session)
+        self.addCleanup(setattr, scrape, '_session_pool_size', scrape._session_pool_size)
+        scrape._session = None
+        scrape._session_pool_size = 0
+
+    def test_pool_size(self):
+        session = get_session()
+        self.assertEqual(session.get_adapter("https://rsbuddy.com")._pool_maxsize, SESSION_POOL_SIZE)
+        self.assertEqual(session.get_adapter("https://rsbuddy.com")._pool_connections, SESSION_POOL_HOSTS)
+
+        first = session.get_adapter("https://rsbuddy.com")
+        with mock.patch.object(first, 'close') as close:
+            self.assertIs(get_session(SESSION_POOL_SIZE * 2), session)
+        close.assert_called_once_with()
+        self.assertEqual(session.get_adapter("https://rsbuddy.com")._pool_maxsize, SESSION_POOL_SIZE * 2)
+
+        get_session(1)
+        self.assertEqual(session.get_adapter("http://2007.runescape.wikia.com")._pool_maxsize, SESSION_POOL_SIZE * 2)
+
+    def test_unsized_keeps_the_pool(self):
+        session = get_session(4)
+        adapter = session.get_adapter("https://rsbuddy.com")
+        self.assertEqual(adapter._pool_maxsize, SESSION_POOL_SIZE)
+
+        self.assertIs(get_session(), session)
+        self.assertIs(session.get_adapter("https://rsbuddy.com"), adapter)
+
+
+class PriceIngestQueryTest(TestCase):
+    """
+    Makes sure building prices does not query per item.
+    """
+    fixtures = ['items.json']
+
+    def setUp(self):
+        patcher = mock.patch('util.merch.scrape.get_session')
+        patcher.start().return_value.get.side_effect = fake_guide_prices
+        self.addCleanup(patcher.stop)
+
+    def test_build_prices_without_queries(self):
+        item_ids = list(Item.objects.values_list('item_id', flat=True)[:100])
+
+        with self.assertNumQueries(0):
+            prices = get_prices_for_items(item_ids)
+
+        self.assertEqual([price.item_id for price in prices], item_ids)
+
+    def test_ingest_query_count(self):
+        for count in (10, 100):
+            with self.assertNumQueries(2):
+                item_ids = Item.objects.values_list('item_id', flat=True)[:count]
+                Price.objects.bulk_create(get_prices_for_items(item_ids))
+
+        self.assertEqual(Price.objects.count(), 110)
+
+    def test_ingest_snapshot(self):
+        item_ids = list(Item.objects.values_list('item_id', flat=True)[:50])
+
+        first = ingest_prices(item_ids)
+        second = ingest_prices(item_ids)
+
+        self.assertEqual(PriceSnapshot.objects.count(), 2)
+        self.assertEqual(set(Price.objects.values_list('date', flat=True)), {first.date, second.date})
+        self.assertEqual(Price.objects.latest_snapshot().count(), 50)
+        self.assertEqual({price.snapshot_id for price in Price.objects.latest_snapshot()}, {second.id})
+        self.assertEqual({latest.snapshot_id for latest in LatestPrice.objects.all()}, {second.id})
+        self.assertEqual(LatestPrice.objects.count(), 50)
+
+
+class NewItemTest(TestCase):
+    """
+    Tests new item discovery without touching the network.
+    """
+    fixtures = ['items.json']
+
+    def setUp(self):
+        MissingItem.objects.create(item_id=100001, name="Ignored")
+
+        summary = mock.patch('util.merch.scrape.get_summary', return_value=[
+            {"id": 2, "name": "Cannonball", "sp": 5},
+            {"id": 100001, "name": "Ignored"},
+            {"id": 100002, "name": "New item", "sp": 10},
+            {"id": 100003, "name": "Unknown item"},
+            {"id": 100004, "name": "Another item"},
+        ])
+        summary.start()
+        self.addCleanup(summary.stop)
+
+        wiki_info = {"examine": "An item.", "members": True, "limit": 100, "hialch": 6}
+        wiki = mock.patch('util.merch.scrape.get_wiki_item',
+                          side_effect=lambda name: None if name == "Unknown item" else wiki_info)
+        self.wiki = wiki.start()
+        self.addCleanup(wiki.stop)
+
+    def test_skips_known_items(self):
+        with self.assertNumQueries(2):
+            items, ignored = get_new_items(concurrency=2)
+
+        self.assertEqual([item.item_id for item in items], [100002, 100004])
+        self.assertEqual([item.item_id for item in ignored], [100003])
+        self.assertEqual(items[0].store_price, 10)
+        self.assertEqual(self.wiki.call_count, 3)
+
+    def test_quantity(self):
+        items, ignored = get_new_items(2)
+
+        self.assertEqual([item.item_id for item in items], [100002])
+        self.assertEqual([item.item_id for item in ignored], [100003])
+        self.assertEqual(self.wiki.call_count, 2)
+
+
+GIF = b"GIF89a" + b"\x00" * 32 + b"\x3b"
+
+
+class IconDownloadTest(TestCase):
+    """
+    Tests the icon downloader without touching the network.
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+
+        patcher = mock.patch('util.merch.scrape.get_cache')
+        self.cache = patcher.start().return_value
+        self.cache.get.side_effect = self.fake_icon
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def fake_icon(url: str, source: str) -> FakeResponse:
+        item_id = int(url.rsplit("=", 1)[1])
+        response = FakeResponse(200 if item_id != 404 else 404)
+        response.content = GIF[:-10] if item_id == 13 else GIF
+        return response
+
+    def test_download(self):
+        downloaded = download_icons([2, 6, 13, 404], self.folder, concurrency=2)
+
+        self.assertCountEqual(downloaded, [2, 6])
+        self.assertCountEqual(os.listdir(self.folder), ["2.gif", "6.gif", "manifest.json"])
+        self.assertEqual(load_icon_manifest(self.folder), {"2": {"size": len(GIF)}, "6": {"size": len(GIF)}})
+
+    def test_resume(self):
+        download_icons([2], self.folder)
+        self.cache.get.reset_mock()
+
+        self.assertEqual(download_icons([2, 6], self.folder), [6])
+        self.assertEqual(self.cache.get.call_count, 1)
+
+    def test_truncated_icon(self):
+        download_icons([2, 6], self.folder)
+
+        with open(os.path.join(self.folder, "2.gif"), "wb") as icon:
+            icon.write(GIF[:10])
+        os.remove(os.path.join(self.folder, "manifest.json"))
+
+        with open(os.path.join(self.folder, "7.gif"), "wb") as icon:
+            icon.write(GIF)
+
+        self.assertEqual(download_icons([2, 6, 7], self.folder), [2])
+        self.assertEqual(set(load_icon_manifest(self.folder)), {"2", "6", "7"})
@@ -0,0 +1,85 @@
+import json
+import os
+import shutil
+import tempfile
+
+from PIL import Image
+from django.test import SimpleTestCase
+
+from util.merch.sprites import build_sprites, load_sprite_index, SPRITE_INDEX
+
+
+class SpriteTest(SimpleTestCase):
+    """
+    Tests packing icons into sprite sheets.
+    """
+
+    def setUp(self):
+        self.icons = tempfile.mkdtemp()
+        self.sprites = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.icons)
+        self.addCleanup(shutil.rmtree, self.sprites)
+
+    def make_icons(self, *item_ids, color=(255, 0, 0)):
+        for item_id in item_ids:
+            Image.new("RGB", (36, 32), color).save(os.path.join(self.icons, f"{item_id}.gif"))
+
+    def sheets(self):
+        return sorted(name for name in os.listdir(self.sprites) if name != SPRITE_INDEX)
+
+    def test_build(self):
+        self.make_icons(2, 6, 8)
+        with open(os.path.join(self.icons, "10.gif"), "wb") as broken:
+            broken.write(b"GIF89a")
+
+        written = build_sprites(self.icons, self.sprites)
+        index = load_sprite_index(self.sprites)
+
+        self.assertEqual(self.sheets(), written)
+        self.assertEqual(set(index["icons"]), {"2", "6", "8"})
+        self.assertEqual(index["icons"]["6"]["sheet"], written[0])
+        self.assertEqual((index["icons"]["6"]["x"], index["icons"]["6"]["width"]), (96, 36))
+
+    def test_incremental(self):
+        self.make_icons(*range(1, 300))
+        first = build_sprites(self.icons, self.sprites)
+        self.assertEqual(len(first), 2)
+
+        self.assertEqual(build_sprites(self.icons, self.sprites), [])
+
+        self.make_icons(400)
+        second = build_sprites(self.icons, self.sprites)
+        index = load_sprite_index(self.sprites)
+
+        self.assertEqual(len(second), 1)
+        self.assertEqual(index["icons"]["400"]["sheet"], second[0])
+
+        # the replaced sheet outlives the index that used it by one build
+        self.assertEqual(self.sheets(), sorted(first + second))
+        self.make_icons(401)
+        third = build_sprites(self.icons, self.sprites)
+        self.assertEqual(self.sheets(), sorted([first[0]] + second + third))
+
+    def test_changed_icon(self):
+        self.make_icons(2, 6)
+        first = build_sprites(self.icons, self.sprites)
+
+        Image.new("RGB", (20, 20), (0, 0, 255)).save(os.path.join(self.icons, "2.gif"))
+        second = build_sprites(self.icons, self.sprites)
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(self.sheets(), sorted(first + second))
+        with open(os.path.join(self.sprites, SPRITE_INDEX)) as index_file:
+            self.assertEqual(json.load(index_file)["icons"]["2"]["width"], 20)
+
+    def test_changed_icon_same_size(self):
+        self.make_icons(2, 6)
+        first = build_sprites(self.icons, self.sprites)
+
+        size = os.path.getsize(os.path.join(self.icons, "2.gif"))
+        self.make_icons(2, color=(0, 0, 255))
+        self.assertEqual(os.path.getsize(os.path.join(self.icons, "2.gif")), size)
+
+        second = build_sprites(self.icons, self.sprites)
+        self.assertEqual(len(second), 1)
+        self.assertNotEqual(first, second)
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from merchapi.models import Item, Tag, TaggedItem, User
+from util.merch import tags
+from util.merch.tags import TagIndex, get_tag_index
+
+
+class TagIndexTest(SimpleTestCase):
+    """
+    Tests combining tags with global and per merchant sets.
+    """
+
+    def setUp(self):
+        self.index = TagIndex([
+            ('rune', 1, None),
+            ('rune', 2, None),
+            ('arrow', 3, None),
+            ('f2p', 1, None),
+            ('f2p', 3, None),
+            ('f2p', 4, 7),
+            ('mine', 2, 7),
+            ('mine', 5, 8),
+        ])
+
+    def test_items(self):
+        self.assertEqual(self.index.items('rune'), {1, 2})
+        self.assertEqual(self.index.items('f2p', 7), {1, 3, 4})
+        self.assertEqual(self.index.items('mine'), set())
+        self.assertEqual(self.index.items('mine', 8), {5})
+        self.assertEqual(self.index.items('missing', 7), set())
+
+    def test_query(self):
+        self.assertEqual(self.index.query([['rune'], ['f2p']]), {1})
+        self.assertEqual(self.index.query([['rune', 'arrow'], ['f2p']]), {1, 3})
+        self.assertEqual(self.index.query([['rune', 'arrow'], ['f2p']], 7), {1, 3})
+        self.assertEqual(self.index.query([['mine'], ['rune']], 7), {2})
+        self.assertEqual(self.index.query([['mine'], ['rune']], 8), set())
+        self.assertEqual(self.index.query([]), set())
+
+
+class GetTagIndexTest(TestCase):
+    """
+    Tests reloading the tag index when items are tagged.
+    """
+    fixtures = ['items.json', 'merchants.json']
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+
+        settings = override_settings(TAG_INDEX_VERSION_FILE=os.path.join(directory, 'tags.version'))
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+        tags._tag_index = None
+        self.addCleanup(setattr, tags, '_tag_index', None)
+
+    def test_tagging(self):
+        merchant = User.objects.create(username="test").merchant
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(name="rune")
+            tag.tag_item(Item.objects.get(item_id=2))
+        self.assertEqual(get_tag_index().items('rune'), {2})
+
+        with self.assertNumQueries(0):
+            get_tag_index()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.tag_item(Item.objects.get(item_id=6), merchant)
+            self.assertEqual(get_tag_index().items('rune', merchant.id), {2})
+        self.assertEqual(get_tag_index().items('rune'), {2})
+        self.assertEqual(get_tag_index().items('rune', merchant.id), {2, 6})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TaggedItem.objects.filter(item_id=2).delete()
+        self.assertEqual(get_tag_index().items('rune', merchant.id), {6})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            tag.delete()
+        self.assertEqual(get_tag_index().items('rune', merchant.id), set())